@@ -1,82 +1,365 @@
+import codecs
+import hashlib
+import io
+import json
 import os
 import re
+import stat
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 # ==========================
-# 核心：幂等清洗函数（安全、不损坏内容）
+# 预编译规则（模块加载时编译一次）
+# 执行顺序与逐条 re.sub 的旧实现完全一致，保证输出逐字节相同
 # ==========================
 
-def clean_wechat_article(text: str) -> str:
-    original = text  # 用于幂等对比（确保不损坏内容）
+# 1. 公众号头部垃圾
+_ORIGIN_RE = re.compile(r"原创.*?\n")                            # “原创 XXX”
+_JS_LINK_RE = re.compile(r"\[.*?\]\(javascript:void\(0\)\)")     # javascript:void 链接
+_DATE_RE = re.compile(r"\*?\d{4}年\d{1,2}月\d{1,2}日.*?\n")       # 日期格式
+_SICHUAN_RE = re.compile(r"[\* ]*四川[\* ]*\n")                   # 四川（你的源文中多次出现）
 
-    # 1. 删除公众号头部垃圾
-    patterns_head = [
-        r"原创.*?\n",                           # “原创 XXX”
-        r"\[.*?\]\(javascript:void\(0\)\)",     # javascript:void 链接
-        r"\*?\d{4}年\d{1,2}月\d{1,2}日.*?\n",   # 日期格式
-        r"[\* ]*四川[\* ]*\n",                  # 四川（你的源文中多次出现）
-    ]
-    for p in patterns_head:
-        text = re.sub(p, "", text)
+# 2. markdown / html 图片
+_MD_IMG_RE = re.compile(r"!\[.*?\]\(.*?\)")
+_HTML_IMG_RE = re.compile(r"<img.*?>")
+_IMG_URL_RE = re.compile(r"https?://\S+\.(jpg|jpeg|png|gif)")
 
-    # 2. 删除 markdown / html 图片
-    text = re.sub(r"!\[.*?\]\(.*?\)", "", text)
-    text = re.sub(r"<img.*?>", "", text)
-    text = re.sub(r"https?://\S+\.(jpg|jpeg|png|gif)", "", text)
+# 3. emoji（不会影响文字）
+_EMOJI_RE = re.compile(r"[\U00010000-\U0010ffff]")
+
+# 4. javascript:void(0)
+_JS_VOID_RE = re.compile(r"javascript:void\(0\);?")
+
+# 5. 独立符号行使用的符号集
+_SYMBOL_CHARS = "·-*"
+
+
+def _date_starts(text: str, anchor: int, pos: int):
+    """日期规则的候选起点：「年」前 4 位数字，可带一个 *"""
+    return range(max(pos, anchor - 5), anchor - 3)
 
-    # 3. 删除 emoji（不会影响文字）
-    text = re.sub(r"[\U00010000-\U0010ffff]", "", text)
 
+def _symbol_run_starts(text: str, anchor: int, pos: int):
+    """四川规则的候选起点：锚点前连续 *、空格的最左端"""
+    start = anchor
+    while start > pos and text[start - 1] in "* ":
+        start -= 1
+    return (start,)
+
+
+def _sub_anchored(pattern, text: str, anchor: str, candidate_starts) -> str:
+    """等价于 pattern.sub("", text)，但只在锚点附近尝试匹配
+
+    没有字面量前缀的正则会在每个位置逐一尝试，很慢；这里先用 str.find
+    定位必含的锚点，再按从左到右的顺序在候选起点上 match，结果与 sub 一致。
+    """
+    index = text.find(anchor)
+    if index == -1:
+        return text
+
+    pieces = []
+    pos = 0  # 上一个匹配的结束位置
+    while index != -1:
+        next_from = index + 1
+        for start in candidate_starts(text, index, pos):
+            m = pattern.match(text, start)
+            if m:
+                pieces.append(text[pos:start])
+                pos = next_from = m.end()
+                break
+        index = text.find(anchor, next_from)
+    pieces.append(text[pos:])
+    return "".join(pieces)
+
+
+# 1-4 步按顺序执行的删除规则，整篇清洗与流式清洗共用
+_REMOVE_STEPS = [
+    # 1. 删除公众号头部垃圾
+    partial(_ORIGIN_RE.sub, ""),
+    partial(_JS_LINK_RE.sub, ""),
+    partial(_sub_anchored, _DATE_RE, anchor="年", candidate_starts=_date_starts),
+    partial(_sub_anchored, _SICHUAN_RE, anchor="四川", candidate_starts=_symbol_run_starts),
+    # 2. 删除 markdown / html 图片
+    partial(_MD_IMG_RE.sub, ""),
+    partial(_HTML_IMG_RE.sub, ""),
+    partial(_IMG_URL_RE.sub, ""),
+    # 3. 删除 emoji（不会影响文字）
+    partial(_EMOJI_RE.sub, ""),
     # 4. 删除 javascript:void(0)
-    text = re.sub(r"javascript:void\(0\);?", "", text)
+    partial(_JS_VOID_RE.sub, ""),
+]
 
-    # 5. 删除独立符号行（不会误删标题或正文）
-    text = re.sub(r"^\s*[·\-\*]+\s*$", "", text, flags=re.MULTILINE)
 
-    # 6. 去除空行（幂等）
-    lines = [line.strip() for line in text.splitlines() if line.strip() != ""]
-    text = "\n".join(lines)
+def _count_real_chars(s: str) -> int:
+    """统计非空白字符数（空格、制表符、换行、回车之外的字符）"""
+    return len(s) - s.count(" ") - s.count("\t") - s.count("\n") - s.count("\r")
+
+
+def _kept_lines(segments):
+    """删除独立符号行，去除每行首尾空白与空行，逐行产出保留的内容"""
+    # 符号行按 \n 判定（与 re.MULTILINE 的 ^/$ 一致），空行再按 splitlines 判定
+    for segment in segments:
+        stripped = segment.strip()
+        if not stripped or not stripped.strip(_SYMBOL_CHARS):
+            continue
+        for line in segment.splitlines():
+            line = line.strip()
+            if line:
+                yield line
+
+
+# ==========================
+# 核心：幂等清洗函数（安全、不损坏内容）
+# ==========================
+
+def clean_wechat_article(text: str) -> str:
+    original = text  # 用于幂等对比（确保不损坏内容）
+
+    # 1-4. 删除头部垃圾、图片、emoji、javascript:void(0)
+    for step in _REMOVE_STEPS:
+        text = step(text)
+
+    # 5-6. 删除独立符号行、去除空行（幂等），合并为一次逐行扫描
+    text = "\n".join(_kept_lines(text.split("\n")))
 
     # 7. 幂等保护：确保不会误伤文本
     # 如果清洗后比原文少了「非垃圾字符」则回退
     # 防止误删正文
-    def count_real_chars(s):
-        s = re.sub(r"[ \t\n\r]", "", s)
-        return len(s)
-
-    if count_real_chars(text) < count_real_chars(original) * 0.5:
+    if _count_real_chars(text) < _count_real_chars(original) * 0.5:
         # 意味着内容被异常大量删除 → 回退安全版本
         return original
 
     return text
 
 
+# ==========================
+# 流式清洗：超大归档文件逐块处理，内存占用恒定
+# ==========================
+
+# 每次读取的块大小（字符）
+STREAM_CHUNK_SIZE = 1 << 20
+
+# 超过该大小（字节）的文件在批量清洗时自动走流式模式
+STREAM_THRESHOLD = 64 << 20
+
+
+def _complete_lines(pieces):
+    """把上游文本片段重新切分为以 \n 结尾的完整行块（最后一块可能不以 \n 结尾）"""
+    buffer = ""
+    for piece in pieces:
+        buffer += piece
+        cut = buffer.rfind("\n") + 1
+        if cut:
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+    if buffer:
+        yield buffer
+
+
+def _stream_step(step, pieces):
+    """对完整行块执行一条删除规则
+
+    所有规则都不会跨越换行匹配（最多吞掉行尾的 \n），所以逐块执行与整篇执行结果相同；
+    吞掉行尾 \n 后相邻两行合并，由下一条规则的 _complete_lines 重新拼接。
+    """
+    for block in _complete_lines(pieces):
+        yield step(block)
+
+
+def _read_translated(f, chunk_size: int, digest):
+    """按块读取二进制文件：更新原始字节哈希，并按文本模式解码、统一换行符"""
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")(), translate=True)
+    for block in iter(partial(f.read, chunk_size), b""):
+        digest.update(block)
+        yield decoder.decode(block)
+    yield decoder.decode(b"", final=True)
+
+
+def clean_file_streaming(path: str, chunk_size: int = STREAM_CHUNK_SIZE):
+    """流式清洗单个文件，输出与 clean_wechat_article 一致
+
+    清洗结果先写入同目录临时文件，同时累计原文与结果的「非垃圾字符」数；
+    只有通过 50% 回退保护且内容有变化时才 rename 覆盖原文件。
+    返回 (是否改写, 处理后文件内容的 sha256)。
+    """
+    raw_digest = hashlib.sha256()
+    out_digest = hashlib.sha256()
+    original_real = 0
+    cleaned_real = 0
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".",
+                                    prefix=".", suffix=".tmp")
+    try:
+        with open(path, "rb") as src, os.fdopen(fd, "wb") as dst:
+            def counted(pieces):
+                nonlocal original_real
+                for piece in pieces:
+                    original_real += _count_real_chars(piece)
+                    yield piece
+
+            pieces = counted(_read_translated(src, chunk_size, raw_digest))
+            for step in _REMOVE_STEPS:
+                pieces = _stream_step(step, pieces)
+
+            segments = (segment for block in _complete_lines(pieces)
+                        for segment in block.split("\n"))
+            separator = b""
+            # 行块末尾的 \n 会切出空段，由 _kept_lines 跳过
+            for line in _kept_lines(segments):
+                cleaned_real += _count_real_chars(line)
+                data = separator + line.encode("utf-8")
+                out_digest.update(data)
+                dst.write(data)
+                separator = b"\n"
+            dst.flush()
+            os.fsync(dst.fileno())
+
+        # 回退保护：内容被异常大量删除 → 丢弃临时文件，原文件保持不变
+        if cleaned_real < original_real * 0.5 or out_digest.digest() == raw_digest.digest():
+            os.remove(tmp_path)
+            return False, raw_digest.hexdigest()
+
+        _promote(tmp_path, path)
+        return True, out_digest.hexdigest()
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
 # ==========================
 # 批量清洗 data/ 下所有 markdown 文件
 # ==========================
 
-def batch_clean(folder="data"):
-    for filename in os.listdir(folder):
-        # 跳过 readme
-        if filename.lower() == "readme.md":
-            print(f"跳过文件（已忽略）：{filename}")
-            continue
+# 清洗规则版本：规则变化时递增，清单中版本不同的记录全部失效
+CLEANER_VERSION = "2"
+
+# 清单文件：记录每个已清洗文件的大小、修改时间和内容哈希
+MANIFEST_NAME = ".clean_manifest.json"
+
 
-        if filename.endswith(".md"):
-            path = os.path.join(folder, filename)
+def _promote(tmp_path: str, path: str):
+    """用临时文件覆盖目标文件（保留原文件权限）"""
+    if os.path.exists(path):
+        os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode))
+    os.replace(tmp_path, path)
 
-            with open(path, "r", encoding="utf-8") as f:
-                raw = f.read()
 
-            cleaned = clean_wechat_article(raw)
+def _atomic_write(path: str, data: bytes):
+    """先写同目录临时文件，再 rename 覆盖，避免中断时留下半截文件"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".",
+                                    prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        _promote(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
-            # 幂等检测：不应删掉大量非垃圾内容
-            with open(path, "w", encoding="utf-8") as f:
-                f.write(cleaned)
 
+def _load_manifest(folder: str) -> dict:
+    path = os.path.join(folder, MANIFEST_NAME)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != CLEANER_VERSION:
+        return {}
+    return manifest.get("files", {})
+
+
+def _save_manifest(folder: str, files: dict):
+    manifest = {"version": CLEANER_VERSION, "files": files}
+    data = json.dumps(manifest, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    _atomic_write(os.path.join(folder, MANIFEST_NAME), data)
+
+
+def _clean_file(job):
+    """清洗单个文件（进程池任务），返回 (文件名, 是否改写, 清单记录)"""
+    path, known_hash, stream = job
+    if stream:
+        rewritten, digest = clean_file_streaming(path)
+        st = os.stat(path)
+        entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+        return os.path.basename(path), rewritten, entry
+
+    with open(path, "rb") as f:
+        raw_bytes = f.read()
+
+    digest = hashlib.sha256(raw_bytes).hexdigest()
+    rewritten = False
+    # 仅修改时间变化、内容与上次清洗结果相同：无需再清洗
+    if digest != known_hash:
+        # 与文本模式读取一致：统一换行符
+        raw = raw_bytes.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+        cleaned = clean_wechat_article(raw).encode("utf-8")
+        if cleaned != raw_bytes:
+            _atomic_write(path, cleaned)
+            digest = hashlib.sha256(cleaned).hexdigest()
+            rewritten = True
+
+    st = os.stat(path)
+    entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+    return os.path.basename(path), rewritten, entry
+
+
+def batch_clean(folder="data", workers=None, force=False, stream_threshold=STREAM_THRESHOLD):
+    """增量清洗：清单中大小与修改时间都未变的文件直接跳过，其余交给进程池
+
+    超过 stream_threshold 字节的文件走流式模式，内存占用与文件大小无关。
+    """
+    manifest = {} if force else _load_manifest(folder)
+    files = {}
+    jobs = []
+
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            filename = entry.name
+            # 跳过 readme
+            if filename.lower() == "readme.md":
+                print(f"跳过文件（已忽略）：{filename}")
+                continue
+
+            if not filename.endswith(".md") or not entry.is_file():
+                continue
+
+            record = manifest.get(filename)
+            st = entry.stat()
+            if record and record["size"] == st.st_size and record["mtime_ns"] == st.st_mtime_ns:
+                files[filename] = record
+                continue
+
+            jobs.append((entry.path, record["sha256"] if record else None,
+                         st.st_size > stream_threshold))
+
+    jobs.sort()
+
+    workers = workers or os.cpu_count() or 1
+    if len(jobs) > 1 and workers > 1:
+        chunksize = max(1, len(jobs) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_clean_file, jobs, chunksize=chunksize))
+    else:
+        results = [_clean_file(job) for job in jobs]
+
+    for filename, rewritten, record in results:
+        files[filename] = record
+        if rewritten:
             print(f"✓ 已清洗：{filename}")
 
-    print("\n🎉 所有文件已安全清洗（幂等，不会损伤已整理内容）")
+    if results or len(files) != len(manifest):
+        _save_manifest(folder, files)
+
+    print(f"\n共 {len(files)} 个文件，检查 {len(jobs)} 个，"
+          f"改写 {sum(1 for r in results if r[1])} 个，跳过 {len(files) - len(jobs)} 个")
+    print("🎉 所有文件已安全清洗（幂等，不会损伤已整理内容）")
 
 
 if __name__ == "__main__":
-    batch_clean()
\ No newline at end of file
+    batch_clean()
@@ -31,13 +31,63 @@ TUSHARE_TOKEN = os.getenv("TUSHARE_TOKEN", "")
 # 日志配置
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
-# 数据爬取配置
+# 数据爬取配置（顺序即优先级，前一个数据源失败或熔断时自动切换到下一个）
 MARKET_DATA_SOURCES = {
     "akshare": True,  # 免费，无需token
     "efinance": True,  # 免费，无需token
     "tushare": bool(TUSHARE_TOKEN),  # 需要token
 }
 
+# 各数据源限速：rate 为平均每秒请求数，burst 为允许的突发请求数
+SOURCE_RATE_LIMITS = {
+    "akshare": {"rate": 2.0, "burst": 4},
+    "efinance": {"rate": 2.0, "burst": 4},
+    "tushare": {"rate": 3.0, "burst": 3},  # 免费积分约200次/分钟
+}
+
+# 数据源重试：每次调用最多重试 retries 次（指数退避 + 随机抖动），单次超过 timeout 秒视为过慢，切换数据源
+SOURCE_RETRY = {"retries": 2, "base_delay": 0.5, "max_delay": 8.0, "timeout": 30.0}
+
+# 数据源熔断：连续失败 failure_threshold 次后跳过该数据源 reset_timeout 秒
+CIRCUIT_BREAKER = {"failure_threshold": 5, "reset_timeout": 60.0}
+
+# 并发获取时同时在途的请求数
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "4"))
+
+# 数据源响应缓存：各接口的有效期（秒）；参数中的日期都已过去的请求视为不可变，永久有效
+RESPONSE_CACHE_TTL = {
+    "default": 6 * 3600,
+    "stock_zh_a_spot_em": 5 * 60,             # 实时行情快照
+    "stock_board_industry_name_em": 5 * 60,   # 实时板块行情
+    "stock_hsgt_north_net_flow_in_em": 6 * 3600,  # 收盘后更新的历史序列
+    "get_realtime_quotes": 5 * 60,            # efinance 实时行情/板块
+    "stock_board_concept_name_em": 5 * 60,    # 实时概念板块行情
+}
+
+# 响应缓存总大小上限，超出时按最近访问时间淘汰
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+# 历史涨跌统计：创新高/新低的回看交易日数（约52周）
+BREADTH_HIGH_LOW_WINDOW = int(os.getenv("BREADTH_HIGH_LOW_WINDOW", "250"))
+
+# 语料板块词 -> 东方财富板块名称（行业或概念板块）；不在表中的词按名称完全匹配、再按包含匹配
+SECTOR_BOARD_MAPPING = {
+    "AI": "人工智能",
+    "军工": "国防军工",
+    "芯片": "芯片概念",
+    "券商": "券商概念",
+    "锂电": "锂电池",
+    "光伏": "光伏设备",
+    "煤炭": "煤炭行业",
+}
+
+# 语料关键词配置（板块/预测/情绪），可扩充到上千个词
+KEYWORDS_FILE = PROJECT_ROOT / "keywords.json"
+
+# A股代码/简称快照（code,name），用 python scripts/stock_recognizer.py --refresh
+# 或 python scripts/run_pipeline.py --refresh-stocks 生成（需要联网）
+STOCK_SNAPSHOT_FILE = PROJECT_ROOT / "stock_names.csv"
+
 # 股票指数代码
 INDEX_CODES = {
     "上证指数": "000001",
@@ -52,6 +102,25 @@ TRAINING_CONFIG = {
     "max_tokens": 4000,
 }
 
+# 生成训练数据时同时在途的LLM请求数（收到429时自动减半，连续成功后逐步恢复）
+GENERATION_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", "8"))
+
+# 生成请求重试：429、5xx、连接错误最多重试 retries 次（优先按 Retry-After 等待，否则指数退避 + 随机抖动），
+# 单次请求超过 timeout 秒视为超时
+GENERATION_RETRY = {"retries": 5, "base_delay": 1.0, "max_delay": 60.0, "timeout": 120.0}
+
+# 生成请求缓存（模型参数 + prompt 相同的请求直接用缓存的回复）总大小上限，超出时按最近访问时间淘汰
+PROMPT_CACHE_MAX_BYTES = int(os.getenv("PROMPT_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+# 生成日志：每完成一个章节追加一行，每 records 条或 seconds 秒 fsync 一次
+GENERATION_JOURNAL_SYNC = {"records": 20, "seconds": 5.0}
+
+# 训练数据集输出：size 大于0时每 size 条切一个JSONL分片，compress 为真时分片用gzip压缩
+DATASET_SHARDS = {
+    "size": int(os.getenv("DATASET_SHARD_SIZE", "0")),
+    "compress": os.getenv("DATASET_COMPRESS", "0") == "1",
+}
+
 # 微调配置
 FINETUNE_CONFIG = {
     "base_model": "Qwen/Qwen2.5-7B-Instruct",  # 基座模型
@@ -104,7 +104,7 @@ echo -e "${GREEN}   ✅ 所有步骤完成！${NC}"
 echo "========================================="
 echo ""
 echo "📁 生成的文件："
-echo "   - outputs/processed_data/parsed_corpus.json"
+echo "   - outputs/processed_data/parsed_corpus.jsonl"
 echo "   - outputs/training_data/training_dataset.json"
 echo "   - outputs/training_data/training_dataset.jsonl"
 echo ""
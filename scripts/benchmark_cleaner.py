@@ -0,0 +1,199 @@
+"""清洗引擎基准测试 - 对比旧版逐条re.sub实现，并校验整篇/流式输出逐字节一致"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from cleaner import clean_wechat_article, clean_file_streaming
+from config import DATA_DIR
+
+
+def legacy_clean_wechat_article(text: str) -> str:
+    """旧版实现（逐条re.sub，每次调用重新编译），作为基准与正确性参照"""
+    original = text
+
+    patterns_head = [
+        r"原创.*?\n",
+        r"\[.*?\]\(javascript:void\(0\)\)",
+        r"\*?\d{4}年\d{1,2}月\d{1,2}日.*?\n",
+        r"[\* ]*四川[\* ]*\n",
+    ]
+    for p in patterns_head:
+        text = re.sub(p, "", text)
+
+    text = re.sub(r"!\[.*?\]\(.*?\)", "", text)
+    text = re.sub(r"<img.*?>", "", text)
+    text = re.sub(r"https?://\S+\.(jpg|jpeg|png|gif)", "", text)
+    text = re.sub(r"[\U00010000-\U0010ffff]", "", text)
+    text = re.sub(r"javascript:void\(0\);?", "", text)
+    text = re.sub(r"^\s*[·\-\*]+\s*$", "", text, flags=re.MULTILINE)
+
+    lines = [line.strip() for line in text.splitlines() if line.strip() != ""]
+    text = "\n".join(lines)
+
+    def count_real_chars(s):
+        s = re.sub(r"[ \t\n\r]", "", s)
+        return len(s)
+
+    if count_real_chars(text) < count_real_chars(original) * 0.5:
+        return original
+
+    return text
+
+
+# 合成语料用的片段：正文 + 各类公众号垃圾
+BODY_LINES = [
+    "今天草原整体震荡，上证在3900点附近反复拉锯，成交额1.8万亿。",
+    "半导体和算力继续走强，军工、航天有资金回流，注意做T节奏。",
+    "  主力净流入12.5亿，北向资金小幅流出，羊要拿稳别乱换。  ",
+    "明天大概率冲高回落，创业板3100点是关键位置。",
+]
+JUNK_LINES = [
+    "原创 大草原 大草原的剧本\n",
+    "[阅读原文](javascript:void(0))",
+    "*2025年12月2日 08:30*\n",
+    "** 四川 **\n",
+    "![图片](https://mmbiz.qpic.cn/abc/640.png)",
+    '<img src="https://mmbiz.qpic.cn/x.jpg" data-ratio="0.5">',
+    "https://mmbiz.qpic.cn/mmbiz_jpg/xyz.jpeg",
+    "🚀📈🐑",
+    "javascript:void(0);",
+    "\n - - - \n",
+    "\n·\n",
+    "\r\n\t\n",
+]
+
+
+def make_article(rng: random.Random, target_chars: int, junk_ratio: float) -> str:
+    """生成一篇合成文章"""
+    parts = []
+    size = 0
+    while size < target_chars:
+        if rng.random() < junk_ratio:
+            piece = rng.choice(JUNK_LINES)
+        else:
+            piece = rng.choice(BODY_LINES) + "\n"
+        parts.append(piece)
+        size += len(piece)
+    return "".join(parts)
+
+
+def make_corpus(seed: int, total_mb: float, junk_ratio: float):
+    """生成总量约 total_mb 的合成语料（单篇 20-60KB）"""
+    rng = random.Random(seed)
+    articles = []
+    total = 0
+    while total < total_mb * 1024 * 1024:
+        article = make_article(rng, rng.randint(20_000, 60_000), junk_ratio)
+        articles.append(article)
+        total += len(article.encode("utf-8"))
+    return articles, total
+
+
+def fuzz_equivalence(seed: int, rounds: int) -> int:
+    """随机拼接垃圾片段与边界字符，校验新旧实现输出一致"""
+    rng = random.Random(seed)
+    alphabet = JUNK_LINES + BODY_LINES + [
+        "\n", "\r", "\x0b", " ", "　", " ", "-", "·", "*", "年", "12月", "2日", "2025", "*2025",
+        "原创", "四川", "javascript:void(", "0)", "](", "[", "!", "<img", ">", "😀", ".png",
+    ]
+    for _ in range(rounds):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        expected = legacy_clean_wechat_article(text)
+        actual = clean_wechat_article(text)
+        if actual != expected:
+            print(f"✗ 输出不一致: {text!r}")
+            return 1
+    return 0
+
+
+def bench(func, articles, repeat: int) -> float:
+    """返回最佳一轮耗时（秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for article in articles:
+            func(article)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_streaming(articles) -> int:
+    """把合成语料拼成一个大文件，对比流式清洗与整篇清洗的结果、耗时和峰值内存"""
+    text = "".join(articles)
+    expected = clean_wechat_article(text)
+    failures = 0
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # 两份副本：一份计时，一份在 tracemalloc 下测峰值内存（tracemalloc 会拖慢执行）
+        paths = [os.path.join(tmp_dir, f"archive_{i}.md") for i in range(2)]
+        for path in paths:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        size = os.path.getsize(paths[0])
+        del text
+
+        start = time.perf_counter()
+        clean_file_streaming(paths[0])
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        clean_file_streaming(paths[1])
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        for path in paths:
+            with open(path, "r", encoding="utf-8") as f:
+                if f.read() != expected:
+                    print("✗ 流式清洗输出不一致")
+                    failures += 1
+
+    print(f"流式: {size / 1024 / 1024:.1f} MB 单文件 {elapsed:.3f}s  峰值内存 {peak / 1024 / 1024:.1f} MB")
+    return failures
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="清洗引擎基准测试")
+    arg_parser.add_argument("--mb", type=float, default=8.0, help="合成语料大小（MB）")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="每组重复次数")
+    arg_parser.add_argument("--seed", type=int, default=42)
+    arg_parser.add_argument("--fuzz", type=int, default=20000, help="随机等价性校验轮数")
+    args = arg_parser.parse_args()
+
+    # 正确性：真实语料 + 随机边界用例
+    failures = 0
+    for path in sorted(DATA_DIR.glob("*.md")):
+        text = path.read_text(encoding="utf-8")
+        if clean_wechat_article(text) != legacy_clean_wechat_article(text):
+            print(f"✗ 输出不一致: {path.name}")
+            failures += 1
+    failures += fuzz_equivalence(args.seed, args.fuzz)
+
+    # 性能：脏语料（首次抓取）与已清洗语料（每晚重跑）
+    dirty, size = make_corpus(args.seed, args.mb, junk_ratio=0.15)
+    clean = [legacy_clean_wechat_article(a) for a in dirty]
+    for article in dirty + clean:
+        if clean_wechat_article(article) != legacy_clean_wechat_article(article):
+            print("✗ 合成语料输出不一致")
+            failures += 1
+            break
+
+    print(f"合成语料: {len(dirty)} 篇, {size / 1024 / 1024:.1f} MB")
+    for label, articles in [("未清洗", dirty), ("已清洗", clean)]:
+        old = bench(legacy_clean_wechat_article, articles, args.repeat)
+        new = bench(clean_wechat_article, articles, args.repeat)
+        print(f"{label}: 旧版 {old:.3f}s  新版 {new:.3f}s  加速 {old / new:.1f}x")
+    failures += bench_streaming(dirty)
+
+    print("✓ 输出逐字节一致" if not failures else f"✗ {failures} 处不一致")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
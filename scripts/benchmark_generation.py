@@ -0,0 +1,424 @@
+"""训练数据生成基准测试 - 用本地 OpenAI 兼容的替身服务（可配置延迟和并发容量），
+对比逐章节串行请求与并发生成、固定并发与遇到429自适应降并发、回复缓存冷热运行、
+每5天全量备份与追加写生成日志、中断后从日志恢复、全量保存与流式写入数据集，并检查样本顺序一致"""
+import argparse
+import hashlib
+import json
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from loguru import logger
+from openai import OpenAI
+
+sys.path.append(str(Path(__file__).parent.parent))
+from generate_training_data import SECTIONS, TrainingDataGenerator
+import dataset_writer
+from dataset_writer import DatasetWriter, iter_dataset
+from generation_engine import AdaptiveConcurrency, GenerationEngine
+from generation_journal import GenerationJournal
+from prompt_cache import PromptCache
+
+
+class MockChatServer:
+    """本地 chat.completions 替身
+
+    每个请求固定延迟 latency 秒；同时处理的请求超过 capacity 个时立即返回429
+    （retry_after 不为空时带 Retry-After 头）。回复内容由 prompt 的哈希决定，同一 prompt 回复相同。
+    """
+
+    def __init__(self, latency: float, capacity: Optional[int] = None, retry_after: Optional[float] = None):
+        self.latency = latency
+        self.capacity = capacity
+        self.retry_after = retry_after
+        self.requests = 0
+        self.rejected = 0
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: Dict, headers: Optional[Dict] = None):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server._lock:
+                    server.requests += 1
+                    if server.capacity is not None and server.active >= server.capacity:
+                        server.rejected += 1
+                        rejected = True
+                    else:
+                        server.active += 1
+                        server.peak = max(server.peak, server.active)
+                        rejected = False
+                if rejected:
+                    headers = {"Retry-After": str(server.retry_after)} if server.retry_after is not None else None
+                    self._send(429, {"error": {"message": "rate limited", "type": "rate_limit_error"}}, headers)
+                    return
+                try:
+                    time.sleep(server.latency)
+                    content = server.reply(request["messages"][-1]["content"])
+                    self._send(200, {
+                        "id": "chatcmpl-bench", "object": "chat.completion", "created": 0,
+                        "model": request["model"],
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": content}}],
+                        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                    })
+                finally:
+                    with server._lock:
+                        server.active -= 1
+
+        return Handler
+
+    @staticmethod
+    def reply(prompt: str) -> str:
+        """按 prompt 生成两条样本，放在 ```json 代码块里（与真实接口的常见返回一致）"""
+        date = re.search(r"\*\*日期\*\*: (\S+)", prompt).group(1)
+        section = re.search(r"\*\*文章类型\*\*: (\S+?)（", prompt).group(1)
+        digest = hashlib.md5(prompt.encode("utf-8")).hexdigest()
+        samples = [{"instruction": f"{section} 问题{i + 1}", "input": f"{date} 市场背景",
+                    "output": f"回答 {digest[i * 8:(i + 1) * 8]}", "section_type": section, "date": date}
+                   for i in range(2)]
+        return f"```json\n{json.dumps(samples, ensure_ascii=False)}\n```"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def synthetic_corpus(n_days: int) -> List[Dict]:
+    """合成语料：每 7 天缺一次早自习（不发请求）"""
+    corpus = []
+    for i in range(n_days):
+        date = f"2025-{1 + i // 28:02d}-{1 + i % 28:02d}"
+        sections = {section: f"{date} {section}：大盘震荡上涨，成交额1.{i % 9}万亿，草原上的羊分化明显。" * 20
+                    for section in SECTIONS}
+        if i % 7 == 0:
+            sections['早自习'] = ''
+        corpus.append({"date": date, "sections": sections})
+    return corpus
+
+
+def make_generator(server: MockChatServer, concurrency: int, base_delay: float,
+                   adaptive: bool = True, prompt_cache: Optional[PromptCache] = None) -> TrainingDataGenerator:
+    client = OpenAI(api_key="bench", base_url=server.url, max_retries=0, timeout=30)
+    # 默认不用回复缓存，每次都真正请求替身服务
+    generator = TrainingDataGenerator(client=client, concurrency=concurrency,
+                                      prompt_cache=prompt_cache or PromptCache(enabled=False))
+    generator.engine = GenerationEngine(concurrency, base_delay=base_delay, max_delay=base_delay * 8)
+    if not adaptive:
+        # 固定并发：上限不随429降低，只靠各自退避重试
+        generator.engine.limiter = AdaptiveConcurrency(concurrency, min_inflight=concurrency)
+    # 不读取真实的市场数据
+    generator._market_context = {}
+    return generator
+
+
+def legacy_generate(generator: TrainingDataGenerator, corpus: List[Dict], sleep: float) -> List[Dict]:
+    """原实现：逐天逐章节串行请求，每次请求后 sleep"""
+    samples = []
+    for corpus_item in corpus:
+        market_data = generator.load_market_data(corpus_item['date'])
+        for section_name in SECTIONS:
+            samples.extend(generator.generate_training_sample(corpus_item, market_data, section_name))
+            time.sleep(sleep)
+    return samples
+
+
+def concurrent_generate(generator: TrainingDataGenerator, corpus: List[Dict],
+                        done: Optional[Dict] = None, journal: Optional[GenerationJournal] = None) -> List[Dict]:
+    return [sample for _, _, samples in generator.iter_generated(corpus, done, journal) for sample in samples]
+
+
+def bench_prompt_cache(corpus: List[Dict], expected: List[Dict], latency: float,
+                       concurrency: int, base_delay: float) -> int:
+    """冷运行全部请求；热运行不请求；改一天语料只重新请求受影响的章节；超过大小上限时LRU淘汰"""
+    n_sections = sum(1 for item in corpus for section in SECTIONS if item['sections'][section])
+    print(f"\n回复缓存: {n_sections} 个章节，并发 {concurrency}")
+    failures = 0
+    edited = [dict(item, sections=dict(item['sections'])) for item in corpus]
+    edited[1]['sections']['主2'] += "尾盘拉升。"
+    with tempfile.TemporaryDirectory() as tmp, MockChatServer(latency) as server:
+        path = Path(tmp) / "prompt_cache.sqlite"
+        runs = (("冷运行    ", corpus, n_sections), ("热运行    ", corpus, 0), ("改动一个章节", edited, 1))
+        for label, data, expected_requests in runs:
+            # 每次运行新建缓存对象，模拟重新启动进程
+            cache = PromptCache(path)
+            requests = server.requests
+            start = time.perf_counter()
+            samples = concurrent_generate(make_generator(server, concurrency, base_delay, prompt_cache=cache), data)
+            elapsed = time.perf_counter() - start
+            stats = cache.stats()
+            cache.close()
+            requests = server.requests - requests
+            ok = requests == expected_requests and len(samples) == len(expected)
+            if data is corpus:
+                ok = ok and samples == expected
+            failures += not ok
+            print(f"{label}: {elapsed:6.2f}s  请求 {requests:>3} 次  命中率 {stats['hit_rate']:4.0%}  "
+                  f"缓存 {stats['entries']} 条 {stats['bytes'] / 1024:.1f}KB {'✓' if ok else '✗'}")
+
+        # 上限只够放一半条目：只保留最近用到的
+        max_bytes = stats['bytes'] // 2
+        cache = PromptCache(path, max_bytes=max_bytes)
+        cache.put("extra", "[]")
+        stats = cache.stats()
+        cache.close()
+        ok = stats['bytes'] <= max_bytes and 0 < stats['entries'] < n_sections
+        failures += not ok
+        print(f"LRU淘汰: 上限 {max_bytes / 1024:.1f}KB 内剩余 {stats['entries']} 条，"
+              f"淘汰 {stats['evictions']} 条 {'✓' if ok else '✗'}")
+    return failures
+
+
+def synthetic_samples(n_days: int) -> List[List[Dict]]:
+    """每天 3 个章节 x 4 个样本"""
+    sample = {"instruction": "今天市场表现如何？", "input": "上证指数收盘3200点，成交额1.2万亿",
+              "output": "草原上的羊分化明显，" * 25, "section_type": "主1", "date": "2025-01-01"}
+    return [[dict(sample, date=f"day{i}", instruction=f"问题{i}-{j}") for j in range(3 * 4)]
+            for i in range(n_days)]
+
+
+def legacy_backup(directory: Path, samples: List[Dict]):
+    """原实现的中间备份：每次把已生成的全部样本重写成 JSON 和 JSONL"""
+    with open(directory / "training_dataset_backup.json", 'w', encoding='utf-8') as f:
+        json.dump(samples, f, ensure_ascii=False, indent=2)
+    with open(directory / "training_dataset_backup.jsonl", 'w', encoding='utf-8') as f:
+        for item in samples:
+            f.write(json.dumps(item, ensure_ascii=False) + '\n')
+
+
+class FailingWriter(DatasetWriter):
+    """保存时出错的数据集写入器（如磁盘已满）"""
+
+    def close(self):
+        self.abort()
+        raise OSError("磁盘已满")
+
+
+def bench_journal(corpus: List[Dict], expected: List[Dict], latency: float,
+                  concurrency: int, base_delay: float, n_days: int) -> int:
+    """每5天全量备份与追加写日志的写入量；中断（含写了一半的末行）后从日志恢复只请求剩余章节；
+    prompt 变化的章节不沿用日志"""
+    failures = 0
+    per_day = synthetic_samples(n_days)
+    print(f"\n生成日志: {n_days} 天 x 每天 {len(per_day[0])} 个样本的写入量")
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        start = time.perf_counter()
+        samples, written = [], 0
+        for i, day in enumerate(per_day):
+            samples.extend(day)
+            if (i + 1) % 5 == 0:
+                legacy_backup(tmp, samples)
+                written += sum(path.stat().st_size for path in tmp.glob("training_dataset_backup.*"))
+        old = time.perf_counter() - start
+
+        journal = GenerationJournal(tmp / "journal.jsonl")
+        start = time.perf_counter()
+        for i, day in enumerate(per_day):
+            for j, section in enumerate(SECTIONS):
+                key = hashlib.sha256(f"day{i} {section}".encode('utf-8')).hexdigest()
+                journal.append(f"day{i}", section, key, day[j * 4:(j + 1) * 4])
+        journal.close()
+        new = time.perf_counter() - start
+        appended = journal.path.stat().st_size
+        print(f"每5天全量备份: {old:6.2f}s  写入 {written / 1e6:7.1f}MB")
+        print(f"追加写日志    : {new:6.2f}s  写入 {appended / 1e6:7.1f}MB  ({written / appended:.0f}x 更少)")
+
+    n_sections = sum(1 for item in corpus for section in SECTIONS if item['sections'][section])
+    with tempfile.TemporaryDirectory() as tmp, MockChatServer(latency) as server:
+        path = Path(tmp) / "journal.jsonl"
+        # 第一次运行（并发2）拿到一半章节就中断，在途的请求完成后也会记录；最后一行只写了一半
+        generator = make_generator(server, 2, base_delay)
+        for k, _ in enumerate(generator.iter_generated(corpus, {}, GenerationJournal(path))):
+            if k + 1 >= len(corpus) * len(SECTIONS) // 2:
+                break
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write('{"date": "2025-0')
+
+        journal = GenerationJournal(path)
+        done = journal.load()
+        remaining = sum(1 for item in corpus for section in SECTIONS
+                        if item['sections'][section] and (item['date'], section) not in done)
+        requests = server.requests
+        samples = concurrent_generate(make_generator(server, concurrency, base_delay), corpus, done, journal)
+        journal.close()
+        requests = server.requests - requests
+        ok = samples == expected and requests == remaining and len(journal.load()) == len(corpus) * len(SECTIONS)
+        failures += not ok
+        print(f"中断后恢复: 日志中 {len(done)} 个章节（丢弃写了一半的末行），"
+              f"重新请求 {requests}/{n_sections} 个，样本与完整运行一致 {'✓' if ok else '✗'}")
+
+        # 改动一个章节（prompt 随之变化）后重跑：日志里的旧样本过期，只重新请求这一个章节
+        edited = [dict(item, sections=dict(item['sections'])) for item in corpus]
+        edited[1]['sections']['主2'] += "尾盘拉升。"
+        requests = server.requests
+        journal = GenerationJournal(path)
+        samples = concurrent_generate(make_generator(server, concurrency, base_delay), edited, journal.load(), journal)
+        journal.close()
+        requests = server.requests - requests
+        ok = requests == 1 and len(samples) == len(expected) and samples != expected
+        failures += not ok
+        print(f"改动一个章节后重跑: 重新请求 {requests} 个，其余沿用日志 {'✓' if ok else '✗'}")
+
+        # 恢复原语料：日志已记录改动后的键，这一章节再请求一次
+        journal = GenerationJournal(path)
+        concurrent_generate(make_generator(server, concurrency, base_delay), corpus, journal.load(), journal)
+        journal.close()
+
+        # 数据集保存失败时保留日志，重新运行不再请求；保存成功后才删除日志
+        generator = make_generator(server, concurrency, base_delay)
+        generator.journal = GenerationJournal(path)
+        generator.load_parsed_corpus = lambda: corpus
+        generator.load_market_context = lambda start, end: None
+        requests = server.requests
+        try:
+            with FailingWriter(directory=Path(tmp) / "dataset") as writer:
+                generator.generate_all_training_data(writer)
+            generator.clear_journal()
+        except OSError:
+            pass
+        kept = path.exists()
+        with DatasetWriter(directory=Path(tmp) / "dataset", json_view=False) as writer:
+            generator.generate_all_training_data(writer)
+        generator.clear_journal()
+        requests = server.requests - requests
+        ok = kept and not path.exists() and requests == 0 \
+            and list(iter_dataset("training_dataset", Path(tmp) / "dataset")) == expected
+        failures += not ok
+        print(f"保存失败后重跑: 日志保留 {'是' if kept else '否'}，重新请求 {requests} 个，"
+              f"保存成功后日志已删除 {'✓' if ok else '✗'}")
+    return failures
+
+
+def bench_writer(n_days: int, shard_size: int) -> int:
+    """原实现一次性写缩进JSON和JSONL，与边生成边追加JSONL、结束时生成JSON视图；检查读回的样本一致"""
+    per_day = synthetic_samples(n_days)
+    samples = [sample for day in per_day for sample in day]
+    print(f"\n数据集写入: {len(samples)} 个样本")
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        start = time.perf_counter()
+        legacy_backup(tmp, samples)
+        old = time.perf_counter() - start
+        old_bytes = sum(path.stat().st_size for path in tmp.glob("training_dataset_backup.*"))
+        print(f"原实现全量保存        : {old * 1000:7.0f}ms  {old_bytes / 1e6:6.2f}MB（每次保存都重写全部样本）")
+
+        encoders = [("json", False)] + ([("orjson", True)] if dataset_writer.ORJSON_AVAILABLE else [])
+        variants = [(f"流式JSONL+视图 {name:<6}", use_orjson, 0, False) for name, use_orjson in encoders]
+        variants.append((f"gzip分片 每{shard_size}条", encoders[-1][1], shard_size, True))
+        for label, use_orjson, size, compress in variants:
+            dataset_writer.ORJSON_AVAILABLE = use_orjson
+            directory = tmp / label.strip()
+            start = time.perf_counter()
+            per_write = []
+            with DatasetWriter(directory=directory, shard_size=size, compress=compress,
+                               json_view=not compress) as writer:
+                for day in per_day:
+                    t = time.perf_counter()
+                    writer.write(day)
+                    per_write.append(time.perf_counter() - t)
+            elapsed = time.perf_counter() - start
+            size_bytes = sum(path.stat().st_size for path in directory.iterdir())
+            ok = list(iter_dataset("training_dataset", directory)) == samples
+            if not compress:
+                with open(directory / "training_dataset.json", 'r', encoding='utf-8') as f:
+                    ok = ok and json.load(f) == samples
+            failures += not ok
+            print(f"{label:<20}: {elapsed * 1000:7.0f}ms  {size_bytes / 1e6:6.2f}MB  "
+                  f"每天追加 {sum(per_write) / len(per_write) * 1e6:5.0f}µs  "
+                  f"{len(list(directory.glob('*.jsonl*')))} 个文件  读回一致 {'✓' if ok else '✗'}")
+        dataset_writer.ORJSON_AVAILABLE = encoders[-1][1]
+    return failures
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="训练数据生成基准测试")
+    arg_parser.add_argument("--days", type=int, default=12, help="合成语料的天数")
+    arg_parser.add_argument("--latency", type=float, default=0.2, help="替身服务每个请求的延迟（秒）")
+    arg_parser.add_argument("--sleep", type=float, default=0.5, help="原实现每次请求后的等待（秒）")
+    arg_parser.add_argument("--concurrency", type=int, nargs='+', default=[1, 4, 16], help="对比的并发数")
+    arg_parser.add_argument("--capacity", type=int, default=6, help="限流场景下替身服务的并发容量")
+    arg_parser.add_argument("--base-delay", type=float, default=0.2, help="退避的基础等待（秒）")
+    arg_parser.add_argument("--journal-days", type=int, default=500, help="写入量对比的天数")
+    arg_parser.add_argument("--shard-size", type=int, default=2000, help="分片写入时每个分片的样本数")
+    args = arg_parser.parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+
+    corpus = synthetic_corpus(args.days)
+    n_sections = sum(1 for item in corpus for section in SECTIONS if item['sections'][section])
+    print(f"训练数据生成: {args.days} 天 {n_sections} 个章节，替身服务延迟 {args.latency * 1000:.0f}ms")
+    failures = 0
+
+    with MockChatServer(args.latency) as server:
+        start = time.perf_counter()
+        expected = legacy_generate(make_generator(server, 1, args.base_delay), corpus, args.sleep)
+        old = time.perf_counter() - start
+        print(f"逐章节串行（每次等 {args.sleep}s）: {old:6.2f}s  {len(expected)} 个样本")
+
+        for concurrency in args.concurrency:
+            server.peak = 0
+            start = time.perf_counter()
+            samples = concurrent_generate(make_generator(server, concurrency, args.base_delay), corpus)
+            elapsed = time.perf_counter() - start
+            ok = samples == expected
+            failures += not ok
+            print(f"并发 {concurrency:>3}: {elapsed:6.2f}s  {n_sections / elapsed:5.1f} 章节/秒  "
+                  f"加速 {old / elapsed:4.1f}x  服务端峰值并发 {server.peak:>2}  顺序一致 {'✓' if ok else '✗'}")
+
+    concurrency = max(args.concurrency)
+    print(f"\n限流: 替身服务最多同时处理 {args.capacity} 个请求，超出返回429，客户端并发 {concurrency}")
+    for label, adaptive in (("固定并发  ", False), ("自适应并发", True)):
+        with MockChatServer(args.latency, capacity=args.capacity) as server:
+            generator = make_generator(server, concurrency, args.base_delay, adaptive)
+            start = time.perf_counter()
+            samples = concurrent_generate(generator, corpus)
+            elapsed = time.perf_counter() - start
+            stats = generator.engine.stats()
+            ok = samples == expected
+            if adaptive:
+                failures += not ok
+            print(f"{label}: {elapsed:6.2f}s  请求 {server.requests:>4} 次  429 {server.rejected:>4} 次  "
+                  f"最终上限 {stats['limit']:>2}  样本 {len(samples)}/{len(expected)} {'✓' if ok else '✗'}")
+
+    failures += bench_prompt_cache(corpus, expected, args.latency, max(args.concurrency), args.base_delay)
+    failures += bench_journal(corpus, expected, args.latency, max(args.concurrency), args.base_delay,
+                              args.journal_days)
+    failures += bench_writer(args.journal_days, args.shard_size)
+
+    print("✓ 结果一致" if not failures else f"✗ {failures} 处结果不一致")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,875 @@
+"""行情获取基准测试 - 用离线替身代替akshare，对比逐日筛选与批量向量化提取、串行与并发限速获取、
+响应缓存冷热运行、逐日JSON与列式存储的读取、按交易日历的增量获取、多数据源重试熔断与切换、
+逐日筛选与一次向量化的涨跌统计、个股日线面板的历史涨跌统计与增量更新、板块词逐日逐个请求与板块快照加日线缓存"""
+import argparse
+import json
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+sys.path.append(str(Path(__file__).parent.parent))
+import akshare
+import index_history
+import market_store
+from fetch_engine import set_rate_limit
+from fetch_market_data_enhanced import EnhancedMarketDataFetcher
+from fetch_planner import TradingCalendar, plan_fetch, describe_plan
+from index_history import IndexHistoryCache, INDEX_SYMBOLS
+from market_breadth import BreadthEngine, SpotSnapshot, history_breadth, spot_breadth
+from market_store import MarketDataStore, TABLES, flatten
+from response_cache import ResponseCache
+from sector_boards import BoardHistoryCache, SectorBoards
+from source_adapters import AkshareAdapter, MarketDataSources, SourceAdapter, SourceUnavailableError
+from stock_history import StockHistoryStore
+
+
+def synthetic_history(symbol: str, days: pd.DatetimeIndex) -> pd.DataFrame:
+    """合成指数日线（与新浪接口一致：date 列为 datetime.date）"""
+    rng = np.random.default_rng(sum(map(ord, symbol)))
+    close = 3000 + rng.standard_normal(len(days)).cumsum() * 15
+    return pd.DataFrame({
+        'date': days.date,
+        'open': (close + rng.standard_normal(len(days)) * 8).round(2),
+        'high': (close + 20).round(2),
+        'low': (close - 20).round(2),
+        'close': close.round(2),
+        'volume': rng.integers(10**10, 5 * 10**10, len(days)).astype(float),
+    })
+
+
+def legacy_indices(frames, date: str):
+    """旧版实现：每个指数按日期筛选，再逐字段 iloc 取值"""
+    indices = {}
+    for name, symbol in INDEX_SYMBOLS.items():
+        df = frames[symbol]
+        row = df[df['date'] == date]
+        if not row.empty:
+            indices[name] = {
+                'code': symbol[2:],
+                'open': float(row.iloc[0]['open']),
+                'close': float(row.iloc[0]['close']),
+                'high': float(row.iloc[0]['high']),
+                'low': float(row.iloc[0]['low']),
+                'volume': float(row.iloc[0]['volume']),
+                'change': round(row.iloc[0]['close'] - row.iloc[0]['open'], 2),
+                'change_pct': round((row.iloc[0]['close'] - row.iloc[0]['open']) / row.iloc[0]['open'] * 100, 2)
+            }
+    return indices
+
+
+def bench_indices(sizes, years: int) -> int:
+    """不同日期数下，逐日提取与批量提取的耗时和结果一致性"""
+    days = pd.bdate_range(end='2025-12-31', periods=years * 250)
+    histories = {symbol: synthetic_history(symbol, days) for symbol in INDEX_SYMBOLS.values()}
+    # 旧版对字符串日期筛选
+    frames = {symbol: df.assign(date=df['date'].astype(str)) for symbol, df in histories.items()}
+    index_history.ak.stock_zh_index_daily = lambda symbol: histories[symbol]
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fetcher = EnhancedMarketDataFetcher()
+        fetcher.index_cache = IndexHistoryCache(Path(tmp_dir))
+        fetcher.fetch_indices_batch([days[-1].strftime('%Y-%m-%d')])  # 预热：写入缓存
+
+        all_dates = pd.date_range(days[0], days[-1]).strftime('%Y-%m-%d').tolist()
+        rng = np.random.default_rng(0)
+        print(f"指数日线: {len(days)} 个交易日 x {len(INDEX_SYMBOLS)} 个指数")
+        for size in sizes:
+            dates = sorted(rng.choice(all_dates, size=size, replace=False).tolist())
+            start = time.perf_counter()
+            expected = {date: legacy_indices(frames, date) for date in dates}
+            old = time.perf_counter() - start
+            start = time.perf_counter()
+            actual = fetcher.fetch_indices_batch(dates)
+            new = time.perf_counter() - start
+            failures += actual != expected
+            print(f"{size:>5} 个日期: 逐日筛选 {old * 1000:8.1f}ms  批量对齐 {new * 1000:6.1f}ms  "
+                  f"加速 {old / new:.0f}x")
+    return failures
+
+
+def synthetic_universe(n: int, rng, new_listings: bool = True):
+    """合成股票池：代码、简称、涨跌幅限制（主板/创业板/科创板/北交所、ST，新股不设限制）"""
+    prefixes = rng.choice(["600", "000", "002", "300", "301", "688", "830", "920"], n,
+                          p=[0.3, 0.15, 0.15, 0.15, 0.05, 0.1, 0.05, 0.05])
+    codes = np.array([f"{prefix}{i:03d}" for i, prefix in enumerate(prefixes)])
+    kind = rng.choice(["", "ST", "*ST", "N"], n, p=[0.93, 0.03, 0.02, 0.02] if new_listings else [0.95, 0.03, 0.02, 0])
+    names = np.array([f"{k}股票{i}" if k != "N" else f"N新股{i}" for i, k in enumerate(kind)])
+    limit = np.select([np.isin(prefixes, ["300", "301", "688"]), np.isin(prefixes, ["830", "920"]),
+                       np.isin(kind, ["ST", "*ST"])], [0.2, 0.3, 0.05], 0.1)
+    limit[kind == "N"] = 2.0
+    return codes, names, limit
+
+
+def synthetic_move(prev: np.ndarray, limit: np.ndarray, rng):
+    """一个交易日的收盘价和涨跌幅：随机波动，3% 封涨停、1% 封跌停"""
+    change = np.clip(rng.normal(0, 0.03, len(prev)), -limit, limit)
+    sealed = rng.random(len(prev))
+    change[sealed < 0.03] = limit[sealed < 0.03]
+    change[sealed > 0.99] = -limit[sealed > 0.99]
+    close = np.maximum(np.round(prev * (1 + change) + 1e-9, 2), 0.01)
+    return close, np.round((close / prev - 1) * 100, 2)
+
+
+def synthetic_spot(n: int, seed: int = 0) -> pd.DataFrame:
+    """合成全市场快照：各板块、ST、新股、1% 停牌，部分股票封在涨跌停价"""
+    rng = np.random.default_rng(seed)
+    codes, names, limit = synthetic_universe(n, rng)
+    prev = np.round(np.exp(rng.uniform(np.log(1.5), np.log(150), n)), 2)
+    close, pct = synthetic_move(prev, limit, rng)
+    suspended = rng.random(n) < 0.01
+    close[suspended], pct[suspended] = np.nan, np.nan
+    return pd.DataFrame({'代码': codes, '名称': names, '最新价': close, '昨收': prev, '涨跌幅': pct})
+
+
+def synthetic_stock_history(n: int, days: pd.DatetimeIndex, seed: int = 0) -> pd.DataFrame:
+    """合成个股日线（个股日线库的格式）：全部股票在首日之前上市，每天 1% 停牌"""
+    rng = np.random.default_rng(seed)
+    codes, names, limit = synthetic_universe(n, rng, new_listings=False)
+    st = np.char.find(names.astype(str), "ST") >= 0
+    prev = np.round(np.exp(rng.uniform(np.log(1.5), np.log(150), n)), 2)
+    frames = []
+    for day in days.strftime('%Y-%m-%d'):
+        close, pct = synthetic_move(prev, limit, rng)
+        traded = rng.random(n) >= 0.01
+        frames.append(pd.DataFrame({
+            'date': day, 'code': codes[traded], 'open': prev[traded],
+            'high': np.maximum(prev, close)[traded], 'low': np.minimum(prev, close)[traded],
+            'close': close[traded], 'prev_close': prev[traded], 'pct': pct[traded],
+            'volume': 1e6, 'amount': (close * 1e6)[traded], 'st': st[traded]}))
+        prev = np.where(traded, close, prev)
+    return pd.concat(frames, ignore_index=True)
+
+
+def to_spot(rows: pd.DataFrame) -> pd.DataFrame:
+    """个股日线行 -> 实时行情快照的列"""
+    return pd.DataFrame({
+        '代码': rows['code'].to_numpy(),
+        '名称': np.where(rows['st'], "ST股票", "股票"),
+        '今开': rows['open'].to_numpy(), '最高': rows['high'].to_numpy(), '最低': rows['low'].to_numpy(),
+        '最新价': rows['close'].to_numpy(), '昨收': rows['prev_close'].to_numpy(),
+        '涨跌幅': rows['pct'].to_numpy(), '成交量': rows['volume'].to_numpy(),
+        '成交额': rows['amount'].to_numpy()})
+
+
+def to_hist(rows: pd.DataFrame) -> pd.DataFrame:
+    """个股日线行 -> stock_zh_a_hist 的列"""
+    return pd.DataFrame({
+        '日期': rows['date'].to_numpy(), '开盘': rows['open'].to_numpy(), '收盘': rows['close'].to_numpy(),
+        '最高': rows['high'].to_numpy(), '最低': rows['low'].to_numpy(), '成交量': rows['volume'].to_numpy(),
+        '成交额': rows['amount'].to_numpy(), '涨跌幅': rows['pct'].to_numpy(),
+        '涨跌额': (rows['close'] - rows['prev_close']).round(2).to_numpy()})
+
+
+def reference_breadth(df: pd.DataFrame):
+    """逐行按板块规则判断涨跌停（用于核对向量化结果）"""
+    up = down = 0
+    for code, name, close, prev, pct in df[['代码', '名称', '最新价', '昨收', '涨跌幅']].itertuples(index=False):
+        if pct != pct or name.startswith(('N', 'C')):
+            continue
+        if code.startswith(('300', '301', '688', '689')):
+            limit = 0.2
+        elif code.startswith(('4', '8', '92')):
+            limit = 0.3
+        elif 'ST' in name:
+            limit = 0.05
+        else:
+            limit = 0.1
+        up += close >= round(prev * (1 + limit) + 1e-9, 2) - 1e-9
+        down += close <= round(prev * (1 - limit) + 1e-9, 2) + 1e-9
+    return up, down
+
+
+def bench_breadth(n_stocks: int, n_dates: int) -> int:
+    """每个日期各自筛选多个 DataFrame 计数，与整次运行一次向量化统计"""
+    df = synthetic_spot(n_stocks)
+    print(f"\n涨跌统计: {n_stocks} 只股票的快照，{n_dates} 个日期")
+
+    start = time.perf_counter()
+    for _ in range(n_dates):
+        legacy = {
+            'up_count': len(df[df['涨跌幅'] > 0]),
+            'down_count': len(df[df['涨跌幅'] < 0]),
+            'limit_up': len(df[df['涨跌幅'] >= 9.9]),
+            'limit_down': len(df[df['涨跌幅'] <= -9.9]),
+        }
+    old = time.perf_counter() - start
+    start = time.perf_counter()
+    stats = spot_breadth(df)
+    new = time.perf_counter() - start
+
+    expected = reference_breadth(df)
+    ok = (stats['limit_up'], stats['limit_down']) == expected \
+        and stats['up_count'] == legacy['up_count'] and stats['down_count'] == legacy['down_count']
+    print(f"逐日筛选 {old * 1000:7.1f}ms  一次向量化 {new * 1000:5.1f}ms  加速 {old / new:.0f}x  "
+          f"{'✓' if ok else '✗'}")
+    print(f"涨停/跌停: 按板块规则 {stats['limit_up']}/{stats['limit_down']}  "
+          f"旧口径(±9.9%) {legacy['limit_up']}/{legacy['limit_down']}  "
+          f"中位数 {stats['pct_p50']}%  P5~P95 {stats['pct_p5']}%~{stats['pct_p95']}%")
+    return 0 if ok else 1
+
+
+# 预置到个股日线库的小股票池（各项获取基准只关心请求，不做逐只导入）
+_BENCH_STOCKS = None
+
+
+def bench_stocks() -> pd.DataFrame:
+    global _BENCH_STOCKS
+    if _BENCH_STOCKS is None:
+        _BENCH_STOCKS = synthetic_stock_history(100, pd.bdate_range('2024-01-01', '2025-12-31'))
+    return _BENCH_STOCKS
+
+
+def offline_fetcher(tmp: Path, cache: ResponseCache) -> EnhancedMarketDataFetcher:
+    """存储和缓存指向临时目录、只走 akshare（替身）的获取器，个股日线库预置合成数据"""
+    fetcher = EnhancedMarketDataFetcher()
+    fetcher.market_store = MarketDataStore(tmp / "store")
+    fetcher.index_cache = IndexHistoryCache(tmp / "index")
+    fetcher.response_cache = cache
+    # 不加备用数据源，避免回退到真实的 efinance 接口
+    fetcher.sources = MarketDataSources([AkshareAdapter(cache)], timeout=None)
+    calendar = TradingCalendar(tmp / "trade_calendar.csv")
+    store = StockHistoryStore(tmp / "stock_history")
+    if store.coverage()["start"] is None:
+        stocks = bench_stocks()
+        store.append(stocks)
+        codes = sorted(stocks['code'].unique())
+        store._set_coverage({code: [stocks['date'].min(), stocks['date'].max()] for code in codes}, codes)
+    fetcher.breadth = BreadthEngine(fetcher.sources, store, SpotSnapshot(fetcher.sources, calendar), calendar)
+    fetcher.boards = SectorBoards(fetcher.sources, BoardHistoryCache(tmp / "boards"), calendar)
+    return fetcher
+
+
+class FakeAkshare:
+    """akshare 接口的本地替身：每次调用先睡 latency 秒，并记录调用时刻"""
+
+    ENDPOINTS = ["stock_zh_a_spot_em", "stock_hsgt_north_net_flow_in_em", "stock_board_industry_name_em",
+                 "stock_zh_index_daily", "tool_trade_date_hist_sina", "stock_zh_a_hist",
+                 "stock_board_concept_name_em", "stock_board_industry_hist_em", "stock_board_concept_hist_em"]
+
+    # 合成板块：部分与 SECTOR_BOARD_MAPPING 的目标同名，其余编号
+    INDUSTRY_BOARDS = ["半导体", "光伏设备", "煤炭行业", "化学制药", "证券", "白酒"] + [f"行业{i}" for i in range(74)]
+    CONCEPT_BOARDS = ["人工智能", "国防军工", "芯片概念", "券商概念", "锂电池", "储能", "CPO概念",
+                      "算力概念", "固态电池"] + [f"概念{i}" for i in range(291)]
+
+    # 合成交易日历中当作节假日的工作日
+    HOLIDAYS = ["2025-12-24", "2025-12-25"]
+
+    def __init__(self, latency: float, days: pd.DatetimeIndex, stocks: pd.DataFrame = None):
+        """stocks 为个股日线（个股日线库的格式）时，实时快照取其最后一天，逐只日线按它返回"""
+        self.latency = latency
+        self.calls = []
+        self._lock = threading.Lock()
+        rng = np.random.default_rng(1)
+        self.frames = {
+            "stock_zh_a_spot_em": synthetic_spot(5000),
+            "stock_hsgt_north_net_flow_in_em": pd.DataFrame({
+                '日期': days.strftime('%Y-%m-%d'),
+                '当日资金流入': rng.normal(0, 50, len(days)).round(2)}),
+            "stock_board_industry_name_em": pd.DataFrame({
+                '板块名称': self.INDUSTRY_BOARDS,
+                '涨跌幅': rng.normal(0, 2, len(self.INDUSTRY_BOARDS)).round(2),
+                '领涨股票': [f"股票{i}" for i in range(len(self.INDUSTRY_BOARDS))]}),
+            "stock_board_concept_name_em": pd.DataFrame({
+                '板块名称': self.CONCEPT_BOARDS,
+                '涨跌幅': rng.normal(0, 2, len(self.CONCEPT_BOARDS)).round(2),
+                '领涨股票': [f"股票{i}" for i in range(len(self.CONCEPT_BOARDS))]}),
+            "tool_trade_date_hist_sina": pd.DataFrame({
+                'trade_date': days[~days.strftime('%Y-%m-%d').isin(self.HOLIDAYS)].date}),
+        }
+        self.histories = {symbol: synthetic_history(symbol, days) for symbol in INDEX_SYMBOLS.values()}
+        self.board_hist = {name: pd.DataFrame({
+            '日期': days.strftime('%Y-%m-%d'),
+            '收盘': (1000 * np.cumprod(1 + rng.normal(0, 0.015, len(days)))).round(2),
+            '涨跌幅': rng.normal(0, 1.5, len(days)).round(2)})
+            for name in self.INDUSTRY_BOARDS + self.CONCEPT_BOARDS}
+        self.stock_hist = {}
+        # 逐只日线接口对这些股票报错
+        self.failing = set()
+        if stocks is not None:
+            # 当天停牌的股票也在快照里，价格和涨跌幅为空
+            last = stocks[stocks['date'] == stocks['date'].max()].set_index('code')
+            last = last.reindex(sorted(stocks['code'].unique())).rename_axis('code').reset_index()
+            self.frames["stock_zh_a_spot_em"] = to_spot(last.assign(st=last['st'].fillna(False)))
+            self.stock_hist = {code: to_hist(rows) for code, rows in stocks.groupby('code')}
+
+    def _endpoint(self, name: str):
+        def call(symbol=None, **kwargs):
+            with self._lock:
+                self.calls.append(time.monotonic())
+            time.sleep(self.latency)
+            if name == "stock_zh_index_daily":
+                return self.histories[symbol]
+            if name in ("stock_zh_a_hist", "stock_board_industry_hist_em", "stock_board_concept_hist_em"):
+                if name == "stock_zh_a_hist" and symbol in self.failing:
+                    raise ConnectionError(f"{symbol} 连接被重置")
+                source = self.stock_hist if name == "stock_zh_a_hist" else self.board_hist
+                df = source.get(symbol, pd.DataFrame(columns=['日期']))
+                start, end = (pd.Timestamp(kwargs[key]).strftime('%Y-%m-%d') for key in ("start_date", "end_date"))
+                return df[(df['日期'] >= start) & (df['日期'] <= end)]
+            return self.frames[name]
+        # 响应缓存以接口名为键的一部分
+        call.__name__ = name
+        return call
+
+    def install(self):
+        """替换 akshare 模块上的接口（各模块共享同一个 akshare 模块对象），返回原接口"""
+        # 部分接口在新版 akshare 中已更名，不存在时恢复阶段删除替身
+        saved = {name: getattr(akshare, name, None) for name in self.ENDPOINTS}
+        for name in self.ENDPOINTS:
+            setattr(akshare, name, self._endpoint(name))
+        return saved
+
+    def max_excess(self, rate: float, burst: float) -> float:
+        """任意时间窗内实际请求数超出 burst + rate * 窗长 的最大值（<=0 表示未超限）"""
+        calls = sorted(self.calls)
+        excess = float('-inf')
+        for i, start in enumerate(calls):
+            for j in range(i, len(calls)):
+                excess = max(excess, (j - i + 1) - (burst + rate * (calls[j] - start)))
+        return excess
+
+
+def bench_concurrency(n_dates: int, latency: float, rate: float, burst: float, levels) -> int:
+    """串行与不同并发数下获取多个日期的耗时、请求速率和结果一致性"""
+    days = pd.bdate_range(end='2025-12-31', periods=250)
+    dates = days[-n_dates:].strftime('%Y-%m-%d').tolist()
+    failures = 0
+    baseline, baseline_time = None, 0.0
+    print(f"\n并发获取: {n_dates} 个日期，接口延迟 {latency * 1000:.0f}ms，"
+          f"限速 {rate:g} 次/秒（突发 {burst:g}）")
+    for concurrency in levels:
+        fake = FakeAkshare(latency, days)
+        saved = fake.install()
+        set_rate_limit("akshare", rate, burst)
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                # 关闭响应缓存，只看并发与限速
+                fetcher = offline_fetcher(Path(tmp_dir), ResponseCache(enabled=False))
+                start = time.perf_counter()
+                results = fetcher.fetch_all_data_for_dates(dates, concurrency=concurrency)
+                elapsed = time.perf_counter() - start
+        finally:
+            for name, func in saved.items():
+                if func is None:
+                    delattr(akshare, name)
+                else:
+                    setattr(akshare, name, func)
+
+        for data in results.values():
+            data.pop('timestamp')
+        if baseline is None:
+            baseline, baseline_time = results, elapsed
+        excess = fake.max_excess(rate, burst)
+        # 允许 0.05 个请求的计时误差
+        ok = results == baseline and list(results) == dates and excess <= 0.05
+        failures += not ok
+        print(f"并发 {concurrency:>3}: {elapsed:6.2f}s  {len(fake.calls) / elapsed:6.1f} 次/秒  "
+              f"加速 {baseline_time / elapsed:4.1f}x  {'✓' if ok else '✗'}")
+    return failures
+
+
+def bench_cache(n_dates: int, latency: float) -> int:
+    """冷缓存与热缓存（模拟下一次运行）的接口调用数、耗时和结果一致性，以及过期与淘汰"""
+    days = pd.bdate_range(end='2025-12-31', periods=250)
+    dates = days[-n_dates:].strftime('%Y-%m-%d').tolist()
+    set_rate_limit("akshare", None)
+    failures = 0
+    print(f"\n响应缓存: {n_dates} 个日期，接口延迟 {latency * 1000:.0f}ms")
+
+    fake = FakeAkshare(latency, days)
+    saved = fake.install()
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp = Path(tmp_dir)
+            runs = []
+            for label in ["不缓存", "冷缓存", "热缓存"]:
+                # 每次运行新建缓存对象，只共享磁盘上的缓存目录
+                fetcher = offline_fetcher(tmp, ResponseCache(tmp / "responses", enabled=label != "不缓存"))
+                calls = len(fake.calls)
+                start = time.perf_counter()
+                results = fetcher.fetch_all_data_for_dates(dates, concurrency=1)
+                elapsed = time.perf_counter() - start
+                fetcher.response_cache.flush()
+                for data in results.values():
+                    data.pop('timestamp')
+                runs.append(results)
+                stats = fetcher.response_cache.stats()
+                print(f"{label}: {elapsed:6.2f}s  接口调用 {len(fake.calls) - calls:>4} 次  "
+                      f"命中率 {stats['hit_rate']:.0%}")
+            failures += not (runs[0] == runs[1] == runs[2])
+
+            # 实时快照有效期为0时每次都重新请求；历史日期参数的请求永久有效
+            cache = ResponseCache(tmp / "ttl", ttl={"stock_zh_a_spot_em": 0})
+            cache.call("akshare", akshare.stock_zh_a_spot_em)
+            cache.call("akshare", akshare.stock_zh_a_spot_em)
+            expired_ok = cache.stats()["misses"] == 2
+            immutable_ok = cache.ttl_for("stock_zh_index_daily_em", (),
+                                         {"start_date": "20200101", "end_date": "20201231"}) is None
+            print(f"过期策略: 快照过期重取 {'✓' if expired_ok else '✗'}  "
+                  f"历史区间永久有效 {'✓' if immutable_ok else '✗'}")
+            failures += not (expired_ok and immutable_ok)
+
+            # 上限只够放一个响应时，旧条目被淘汰
+            cache = ResponseCache(tmp / "lru", max_bytes=1)
+            cache.call("akshare", akshare.stock_zh_a_spot_em)
+            cache.call("akshare", akshare.stock_board_industry_name_em)
+            stats = cache.stats()
+            lru_ok = stats["entries"] == 1 and stats["evictions"] == 1
+            print(f"LRU淘汰: 剩余 {stats['entries']} 条，淘汰 {stats['evictions']} 条 "
+                  f"{'✓' if lru_ok else '✗'}")
+            failures += not lru_ok
+    finally:
+        for name, func in saved.items():
+            if func is None:
+                delattr(akshare, name)
+            else:
+                setattr(akshare, name, func)
+    return failures
+
+
+def restore(saved):
+    """恢复 FakeAkshare.install 替换掉的接口"""
+    for name, func in saved.items():
+        if func is None:
+            delattr(akshare, name)
+        else:
+            setattr(akshare, name, func)
+
+
+def reference_new_highs(panel, col: int, window: int):
+    """逐只股票判断某一天是否创新高/新低（用于核对面板计算）"""
+    highs = lows = 0
+    for pct in panel["pct"]:
+        if np.isnan(pct[col]) or col < window:
+            continue
+        adjusted = np.cumprod(1 + np.nan_to_num(pct[:col + 1]) / 100)
+        prior = adjusted[col - window:col]
+        highs += adjusted[col] > prior.max()
+        lows += adjusted[col] < prior.min()
+    return highs, lows
+
+
+def bench_history(n_stocks: int, n_days: int, window: int = 250) -> int:
+    """个股日线面板一次算出整段历史的涨跌统计，与逐日计算对比；以及日线库的首次导入和增量更新"""
+    days = pd.bdate_range(end='2025-12-31', periods=n_days + window + 30)
+    stocks = synthetic_stock_history(n_stocks, days)
+    dates = days[-n_days:].strftime('%Y-%m-%d').tolist()
+    failures = 0
+    print(f"\n历史涨跌统计: {n_stocks} 只股票，{n_days} 个交易日（创新高回看 {window} 个交易日）")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = StockHistoryStore(Path(tmp_dir))
+        start = time.perf_counter()
+        store.append(stocks)
+        written = time.perf_counter() - start
+        start = time.perf_counter()
+        panel = store.panel(days[0].strftime('%Y-%m-%d'), dates[-1])
+        loaded = time.perf_counter() - start
+        start = time.perf_counter()
+        stats = history_breadth(panel, dates[0], window)
+        new = time.perf_counter() - start
+
+    # 逐日把当天的行当作快照计算（不含新高新低）
+    by_date = dict(tuple(stocks[stocks['date'] >= dates[0]].groupby('date')))
+    start = time.perf_counter()
+    daily = {day: spot_breadth(to_spot(by_date[day])) for day in dates}
+    old = time.perf_counter() - start
+
+    keys = [key for key in daily[dates[0]] if key != 'suspended']
+    same = all({k: stats[day][k] for k in keys} == {k: daily[day][k] for k in keys} for day in dates)
+    cols = [len(panel["dates"]) - n_days, len(panel["dates"]) - 1]
+    highs_ok = all(reference_new_highs(panel, col, window)
+                   == (stats[panel["dates"][col]]['new_high'], stats[panel["dates"][col]]['new_low'])
+                   for col in cols)
+    ok = list(stats) == dates and same and highs_ok
+    failures += not ok
+    last = stats[dates[-1]]
+    print(f"写入 {written:5.2f}s  读取面板 {loaded:5.2f}s  面板计算 {new * 1000:6.0f}ms  "
+          f"逐日计算 {old * 1000:6.0f}ms  加速 {old / new:.1f}x  {'✓' if ok else '✗'}")
+    print(f"{dates[-1]}: 上涨 {last['up_count']} 下跌 {last['down_count']} 涨停 {last['limit_up']} "
+          f"跌停 {last['limit_down']} 新高 {last['new_high']} 新低 {last['new_low']}")
+
+    # 日线库：首次导入部分股票失败时不给出统计、补齐时只重取失败的股票，
+    # 重跑不联网，只差收盘快照的交易日时用一次快照更新
+    small = synthetic_stock_history(60, days, seed=1)
+    failing = set(sorted(small['code'].unique())[:5])
+    fake = FakeAkshare(0.0, days, small)
+    saved = fake.install()
+    set_rate_limit("akshare", None)
+    now = datetime(2025, 12, 31, 16, 0)
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp = Path(tmp_dir)
+            expected = None
+            # 补齐：失败的股票各一次，加一次实时快照
+            runs = [("首次导入（5 只失败）", dates[-20:-1], None, failing), ("补齐失败股票", dates[-20:-1], 6, set()),
+                    ("重跑", dates[-20:-1], 0, set()), ("收盘快照", dates[-1:], 1, set())]
+            for label, needed, max_calls, fail in runs:
+                fake.failing = fail
+                calendar = TradingCalendar(tmp / "trade_calendar.csv")
+                sources = MarketDataSources([AkshareAdapter(ResponseCache(enabled=False))], retries=0,
+                                            timeout=None, failure_threshold=100)
+                engine = BreadthEngine(sources, StockHistoryStore(tmp / "stock_history"),
+                                       SpotSnapshot(sources, calendar, now=now), calendar, window)
+                calls = len(fake.calls)
+                engine.prepare(needed)
+                calls = len(fake.calls) - calls
+                result = {day: engine.stats_for(day) for day in needed}
+                if expected is None:
+                    full = StockHistoryStore(tmp / "expected")
+                    full.append(small)
+                    expected = history_breadth(full.panel(days[0].strftime('%Y-%m-%d'), dates[-1]),
+                                               dates[-20], window)
+                # 日线不全时不能用不完整的面板计算，历史日期没有统计（也就不会当作已存储）
+                wanted = {day: {} if fail else expected[day] for day in needed}
+                ok = result == wanted and (max_calls is None or calls <= max_calls)
+                failures += not ok
+                print(f"{label}: {len(needed)} 天，接口调用 {calls} 次 {'✓' if ok else '✗'}")
+    finally:
+        restore(saved)
+    return failures
+
+
+def bench_sectors(n_dates: int, latency: float) -> int:
+    """语料板块词：逐日逐个请求板块日线，与每次运行一次板块快照 + 按板块缓存日线"""
+    days = pd.bdate_range(end='2025-12-31', periods=250)
+    dates = days[-n_dates:].strftime('%Y-%m-%d').tolist()
+    keywords = ["半导体", "芯片", "AI", "人工智能", "军工", "光伏", "储能", "锂电", "券商", "煤炭",
+                "CPO", "算力", "白酒", "短剧"]
+    now = datetime(2025, 12, 31, 16, 0)
+    failures = 0
+    print(f"\n板块数据: {n_dates} 个日期 x {len(keywords)} 个板块词，接口延迟 {latency * 1000:.0f}ms")
+
+    fake = FakeAkshare(latency, days)
+    saved = fake.install()
+    set_rate_limit("akshare", None)
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp = Path(tmp_dir)
+            calendar = TradingCalendar(tmp / "trade_calendar.csv")
+            calendar.ensure(dates[-1])
+
+            # 对照：每个日期的每个板块词各请求一次当天的板块日线（板块名已知）
+            boards = SectorBoards(MarketDataSources([AkshareAdapter(ResponseCache(enabled=False))], timeout=None),
+                                  BoardHistoryCache(tmp / "unused"), calendar, now)
+            resolved = boards.resolve(keywords)
+            calls = len(fake.calls)
+            start = time.perf_counter()
+            naive = {}
+            for day in dates:
+                naive[day] = {}
+                for keyword, (kind, name) in resolved.items():
+                    endpoint = akshare.stock_board_industry_hist_em if kind == "industry" \
+                        else akshare.stock_board_concept_hist_em
+                    df = endpoint(symbol=name, start_date=day.replace('-', ''), end_date=day.replace('-', ''))
+                    if not df.empty:
+                        naive[day][keyword] = float(df['涨跌幅'].iloc[0])
+            old, old_calls = time.perf_counter() - start, len(fake.calls) - calls
+
+            results = []
+            for label in ["首次运行", "重跑"]:
+                sources = MarketDataSources([AkshareAdapter(ResponseCache(enabled=False))], timeout=None)
+                boards = SectorBoards(sources, BoardHistoryCache(tmp / "boards"), calendar, now)
+                calls = len(fake.calls)
+                start = time.perf_counter()
+                boards.prepare(dates, keywords)
+                result = {day: boards.lookup(day, keywords) for day in dates}
+                elapsed = time.perf_counter() - start
+                results.append((label, elapsed, len(fake.calls) - calls, result))
+
+            snapshot = fake.frames["stock_board_industry_name_em"].set_index('板块名称')['涨跌幅'].to_dict()
+            snapshot.update(fake.frames["stock_board_concept_name_em"].set_index('板块名称')['涨跌幅'].to_dict())
+            expected = {day: {k: v for k, v in naive[day].items()} for day in dates[:-1]}
+            expected[dates[-1]] = {keyword: snapshot[name] for keyword, (_, name) in resolved.items()}
+            print(f"板块词解析: {len(resolved)}/{len(keywords)} 个，如 AI→{resolved['AI'][1]}、"
+                  f"军工→{resolved['军工'][1]}、CPO→{resolved['CPO'][1]}")
+            print(f"逐日逐个请求: {old:6.2f}s  接口调用 {old_calls:>4} 次")
+            for label, elapsed, calls, result in results:
+                values = {day: {k: v['change_pct'] for k, v in result[day].items()} for day in dates}
+                ok = values == expected and (label == "首次运行" or calls <= 2)
+                failures += not ok
+                print(f"{label}: {elapsed:6.2f}s  接口调用 {calls:>4} 次（快照 2 + 板块日线 {calls - 2}）"
+                      f"{'✓' if ok else '✗'}")
+
+            # 先取后段日期，再向前回补更早的日期：回补不能丢掉已缓存的后段日线
+            recent, earlier = dates[-10:], dates[:-10]
+            for part in (recent, earlier, recent):
+                sources = MarketDataSources([AkshareAdapter(ResponseCache(enabled=False))], timeout=None)
+                boards = SectorBoards(sources, BoardHistoryCache(tmp / "backfill"), calendar, now)
+                calls = len(fake.calls)
+                boards.prepare(part, keywords)
+                result = {day: {k: v['change_pct'] for k, v in boards.lookup(day, keywords).items()}
+                          for day in part}
+            calls = len(fake.calls) - calls
+            ok = result == {day: expected[day] for day in recent} and calls <= 2
+            failures += not ok
+            print(f"向前回补后重取后段: 接口调用 {calls} 次（快照 2），日线未丢失 {'✓' if ok else '✗'}")
+    finally:
+        restore(saved)
+    return failures
+
+
+def synthetic_records(days: pd.DatetimeIndex):
+    """合成增强版获取器输出的逐日市场数据记录"""
+    rng = np.random.default_rng(2)
+    for day in days.strftime('%Y-%m-%d'):
+        yield {
+            'date': day,
+            'indices': {name: {'code': symbol[2:], 'open': 3000.0, 'high': 3020.0, 'low': 2990.0,
+                               'close': round(3000 + rng.normal(0, 20), 2), 'volume': 3.2e10,
+                               'change': 1.5, 'change_pct': 0.05}
+                        for name, symbol in INDEX_SYMBOLS.items()},
+            'market_stats': {'up_count': int(rng.integers(0, 5000)), 'down_count': 2100,
+                             'limit_up': 60, 'limit_down': 8, 'total': 5300,
+                             'note': '当日数据或最近交易日数据'},
+            'fund_flow': {'北向资金': {'net_inflow': round(rng.normal(0, 50), 2), 'unit': '亿元'}},
+            'top_sectors': [{'name': f"板块{i}", 'change_pct': round(rng.normal(0, 2), 2),
+                             'lead_stock': f"股票{i}"} for i in range(10)],
+            'timestamp': '2025-12-31T15:00:00',
+        }
+
+
+def best_of(func: Callable, repeat: int) -> Tuple[float, object]:
+    """运行 repeat 次，返回最快一次的耗时和结果"""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_store(years: int, repeat: int = 5) -> int:
+    """旧版逐日JSON文件与列式存储：写入体积、读取多年市场数据的耗时和一致性"""
+    days = pd.bdate_range(end='2025-12-31', periods=years * 250)
+    records = list(synthetic_records(days))
+    print(f"\n市场数据存储: {len(records)} 个交易日")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp = Path(tmp_dir)
+        for data in records:
+            with open(tmp / f"market_data_{data['date']}.json", 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+        store = MarketDataStore(tmp / "store")
+        for i in range(0, len(records), 50):
+            store.append(records[i:i + 50])
+        # 获取结束时合并分片
+        store.compact()
+
+        json_bytes = sum(path.stat().st_size for path in tmp.glob("market_data_*.json"))
+        store_bytes = sum(path.stat().st_size for path in store.root.rglob("part-*"))
+
+        def read_json() -> Dict[str, Dict]:
+            legacy = {}
+            for day in days.strftime('%Y-%m-%d'):
+                with open(tmp / f"market_data_{day}.json", 'r', encoding='utf-8') as f:
+                    legacy[day] = json.load(f)
+            return legacy
+
+        def tables_from_json() -> Dict[str, pd.DataFrame]:
+            # 分析代码的旧写法：逐日读JSON，展开成各表的行再建 DataFrame
+            rows = {table: [] for table in TABLES[1:]}
+            for data in read_json().values():
+                for table, table_rows in flatten(data).items():
+                    if table in rows:
+                        rows[table].extend(table_rows)
+            return {table: pd.DataFrame(table_rows) for table, table_rows in rows.items()}
+
+        # 各取 repeat 次中最快的一次，减小机器抖动的影响
+        old, legacy = best_of(read_json, repeat)
+        new, loaded = best_of(store.load_range, repeat)
+        old_tables, frames = best_of(tables_from_json, repeat)
+        new_tables, queried = best_of(lambda: {table: store.query(table) for table in TABLES[1:]}, repeat)
+
+    same = loaded == legacy
+    same_tables = all(len(queried[table]) == len(frames[table]) for table in frames)
+    ok = same and new < old and same_tables and new_tables < old_tables
+    print(f"体积: JSON {json_bytes / 1e6:6.1f}MB  列式 {store_bytes / 1e6:5.1f}MB")
+    print(f"读取全部记录: 逐日JSON {old * 1000:7.0f}ms  列式 {new * 1000:6.0f}ms  加速 {old / new:.1f}x  "
+          f"结果一致 {'✓' if same else '✗'}")
+    print(f"读取四张表（DataFrame）: 逐日JSON {old_tables * 1000:7.0f}ms  列式 {new_tables * 1000:6.0f}ms  "
+          f"加速 {old_tables / new_tables:.1f}x  行数一致 {'✓' if same_tables else '✗'}  "
+          f"{'✓' if ok else '✗ 未快于逐日JSON'}")
+    return (0 if ok else 1) + bench_append(records[-250:])
+
+
+def bench_append(records) -> int:
+    """逐日追加（save_market_data 的写法）：每次追加都合并 vs 分片超过阈值才合并，最后都 compact"""
+    timings = {}
+    loaded = {}
+    threshold = market_store.COMPACT_PARTS
+    for label, parts in [("每次合并", 1), (f"超过{threshold}个分片合并", threshold)]:
+        market_store.COMPACT_PARTS = parts
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                store = MarketDataStore(Path(tmp_dir))
+                start = time.perf_counter()
+                for data in records:
+                    store.append([data])
+                store.compact()
+                timings[label] = time.perf_counter() - start
+                loaded[label] = store.load_range()
+        finally:
+            market_store.COMPACT_PARTS = threshold
+    old, new = timings.values()
+    same = len(set(map(json.dumps, loaded.values()))) == 1
+    ok = same and new < old
+    print(f"逐日追加 {len(records)} 天: " + "  ".join(f"{label} {t:5.2f}s" for label, t in timings.items())
+          + f"  加速 {old / new:.1f}x  结果一致 {'✓' if same else '✗'}")
+    return 0 if ok else 1
+
+
+def bench_planner(n_days: int) -> int:
+    """按交易日历增量获取：首次只取交易日，重跑不联网，新增日期只取增量"""
+    days = pd.bdate_range(end='2025-12-31', periods=250)
+    trading = set(days.strftime('%Y-%m-%d')) - set(FakeAkshare.HOLIDAYS)
+    needed = pd.date_range(end='2025-12-31', periods=n_days).strftime('%Y-%m-%d').tolist()
+    now = datetime(2025, 12, 31, 16, 0)
+    set_rate_limit("akshare", None)
+    print(f"\n增量获取: 语料需要 {n_days} 个自然日（含周末和 {len(FakeAkshare.HOLIDAYS)} 个节假日）")
+
+    # (说明, 语料日期, 期望获取的日期, 期望的接口调用数上限)
+    runs = [
+        ("首次运行", needed[:-5], sorted(trading & set(needed[:-5])), None),
+        ("重跑", needed[:-5], [], 0),
+        ("新增5天", needed, sorted(trading & set(needed[-5:])), None),
+    ]
+    failures = 0
+    fake = FakeAkshare(0.0, days)
+    saved = fake.install()
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp = Path(tmp_dir)
+            for label, dates, expected, max_calls in runs:
+                # 每次运行新建对象，只共享磁盘上的日历、指数缓存和存储
+                calendar = TradingCalendar(tmp / "trade_calendar.csv")
+                fetcher = offline_fetcher(tmp, ResponseCache(enabled=False))
+                calls = len(fake.calls)
+                plan = plan_fetch(dates, fetcher.market_store, calendar, now=now)
+                if plan["fetch"]:
+                    fetcher.fetch_all_data_for_dates(plan["fetch"], concurrency=1)
+                calls = len(fake.calls) - calls
+                ok = plan["fetch"] == expected and (max_calls is None or calls <= max_calls)
+                failures += not ok
+                print(f"{label}: {describe_plan(plan)}，接口调用 {calls} 次 {'✓' if ok else '✗'}")
+    finally:
+        for name, func in saved.items():
+            if func is None:
+                delattr(akshare, name)
+            else:
+                setattr(akshare, name, func)
+    return failures
+
+
+class FakeAdapter(SourceAdapter):
+    """可注入延迟和失败的数据源替身；fail_rate 可以是固定值或随调用序号变化的函数"""
+
+    DATASETS = ("spot",)
+
+    def __init__(self, name: str, latency: float = 0.0, fail_rate=0.0, seed: int = 0):
+        super().__init__(ResponseCache(enabled=False))
+        self.name = name
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.calls = 0
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+    def spot(self) -> pd.DataFrame:
+        with self._lock:
+            self.calls += 1
+            calls = self.calls
+            fail = self._rng.random() < (self.fail_rate(calls) if callable(self.fail_rate) else self.fail_rate)
+        time.sleep(self.latency)
+        if fail:
+            raise ConnectionError(f"{self.name} 注入的失败")
+        return pd.DataFrame({'代码': ['000001'], '涨跌幅': [1.0], 'source': [self.name]})
+
+
+def bench_failover(n_calls: int) -> int:
+    """主数据源正常、间歇失败、宕机、过慢、恢复、全部失败时的切换行为和耗时"""
+    print(f"\n多数据源切换: 每个场景 {n_calls} 次调用（重试2次，超时0.2s，连续3次失败熔断0.5s）")
+    options = dict(retries=2, base_delay=0.01, max_delay=0.05, timeout=0.2,
+                   failure_threshold=3, reset_timeout=0.5)
+    scenarios = [
+        # (说明, 主源参数, 检查函数(各源提供次数, 主源指标))
+        ("主源正常", dict(), lambda served, m: served == {"akshare": n_calls}),
+        ("主源间歇失败30%", dict(fail_rate=0.3),
+         lambda served, m: served.get("akshare", 0) >= n_calls * 0.9),
+        ("主源宕机", dict(fail_rate=1.0),
+         lambda served, m: served == {"efinance": n_calls} and m["calls"] <= 3 + n_calls // 10),
+        ("主源过慢", dict(latency=1.0),
+         lambda served, m: served == {"efinance": n_calls} and m["timeouts"] <= 3 + n_calls // 10),
+        ("主源宕机后恢复", dict(fail_rate=lambda call: 1.0 if call <= 3 else 0.0),
+         lambda served, m: served.get("akshare", 0) > 0 and m["state"] == "closed"),
+    ]
+    failures = 0
+    for label, primary_options, check in scenarios:
+        primary = FakeAdapter("akshare", seed=1, **primary_options)
+        backup = FakeAdapter("efinance", latency=0.01)
+        sources = MarketDataSources([primary, backup], **options)
+        served = {}
+        start = time.perf_counter()
+        for i in range(n_calls):
+            source = sources.fetch("spot")["source"].iloc[0]
+            served[source] = served.get(source, 0) + 1
+            if label == "主源宕机后恢复" and i == n_calls // 2:
+                time.sleep(options["reset_timeout"])  # 等熔断期满，试探调用成功后恢复主源
+        elapsed = time.perf_counter() - start
+        m = sources.metrics()["akshare"]
+        ok = check(served, m)
+        failures += not ok
+        print(f"{label:<10} {elapsed:5.2f}s  提供方 {served}  主源: 调用 {m['calls']} 错误 {m['errors']} "
+              f"超时 {m['timeouts']} 熔断跳过 {m['rejected']} 状态 {m['state']} {'✓' if ok else '✗'}")
+
+    sources = MarketDataSources([FakeAdapter("akshare", fail_rate=1.0), FakeAdapter("efinance", fail_rate=1.0)],
+                                **options)
+    try:
+        sources.fetch("spot")
+        ok = False
+    except SourceUnavailableError:
+        ok = True
+    failures += not ok
+    print(f"全部失败     抛出 SourceUnavailableError {'✓' if ok else '✗'}")
+    return failures
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="行情获取基准测试")
+    arg_parser.add_argument("--sizes", type=int, nargs='+', default=[29, 250, 1000],
+                            help="批量提取的日期数")
+    arg_parser.add_argument("--years", type=int, default=20, help="合成指数历史的年数")
+    arg_parser.add_argument("--dates", type=int, default=30, help="并发获取的日期数")
+    arg_parser.add_argument("--latency", type=float, default=0.05, help="替身接口的延迟（秒）")
+    arg_parser.add_argument("--rate", type=float, default=40.0, help="akshare 限速（次/秒）")
+    arg_parser.add_argument("--burst", type=float, default=5.0, help="akshare 突发请求数")
+    arg_parser.add_argument("--concurrency", type=int, nargs='+', default=[1, 4, 16],
+                            help="对比的并发数（第一个作为基准）")
+    args = arg_parser.parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    failures = bench_indices(args.sizes, args.years)
+    failures += bench_concurrency(args.dates, args.latency, args.rate, args.burst, args.concurrency)
+    failures += bench_cache(args.dates, args.latency)
+    failures += bench_store(args.years)
+    failures += bench_planner(60)
+    failures += bench_failover(40)
+    failures += bench_breadth(5500, args.dates)
+    failures += bench_history(5500, 250)
+    failures += bench_sectors(args.dates, args.latency)
+
+    print("✓ 结果一致" if not failures else f"✗ {failures} 处结果不一致")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,394 @@
+"""语料解析基准测试 - 关键词自动机对比逐词 in 扫描，线性数值提取对比 .*? 正则，多进程解析扩展性"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from loguru import logger
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import KEYWORDS_FILE
+from corpus_store import load_parsed_corpus, write_parsed_corpus
+from entity_index import EntityIndex, FIELDS, SECTIONS
+from keyword_matcher import KeywordMatcher, load_keywords
+from numeric_extractor import extract_numbers
+from parse_corpus import CorpusParser, STOCK_PATTERNS
+from stock_recognizer import StockRecognizer, load_recognizer
+
+
+def legacy_keyword_scan(content: str, keywords):
+    """旧版实现：每个关键词单独 in 扫描一遍"""
+    return {category: [kw for kw in words if kw in content]
+            for category, words in keywords.items()}
+
+
+def legacy_numbers(content: str):
+    """旧版实现：指数、资金流向各自用 .*? 正则 findall，成交额取自生成脚本的正则"""
+    indices = []
+    for pattern in [r'(\d{4})点', r'上证.*?(\d{4})', r'沪指.*?(\d{4})',
+                    r'深成指.*?(\d{4})', r'创业板.*?(\d{4})']:
+        indices.extend(re.findall(pattern, content))
+    fund_flow = [f"{m[0]}{m[1]}亿" for m in re.findall(r'(净流入|净流出).*?(\d+\.?\d*)亿', content)]
+    turnover = re.findall(r'(\d+\.?\d*)万亿', content)
+    return {"indices": indices, "fund_flow": fund_flow, "turnover": turnover}
+
+
+def same_numbers(a, b) -> bool:
+    """指数点位最终会去重，按集合比较；资金流向、成交额按顺序比较"""
+    return (set(a["indices"]) == set(b["indices"]) and a["fund_flow"] == b["fund_flow"]
+            and a["turnover"] == b["turnover"])
+
+
+def long_section(sections, target_chars: int) -> str:
+    """真实章节反复拼接成 1MB 以上的长章节"""
+    joined = '\n'.join(sections)
+    return joined * (target_chars // len(joined) + 1)
+
+
+def dense_line(target_chars: int) -> str:
+    """锚点密集、没有可配对数字的单行文本：旧版正则会从每个锚点扫到行尾"""
+    filler = '上证指数缩量震荡，创业板和沪指跟随，资金净流入3个板块，'
+    return filler * (target_chars // len(filler) + 1)
+
+
+def time_numbers(text: str):
+    """返回 (旧版耗时, 新版耗时, 不限前瞻时结果是否一致)"""
+    start = time.perf_counter()
+    legacy = legacy_numbers(text)
+    old = time.perf_counter() - start
+    start = time.perf_counter()
+    extract_numbers(text)
+    new = time.perf_counter() - start
+    return old, new, same_numbers(extract_numbers(text, lookahead=None), legacy)
+
+
+def bench_numbers(sections, target_chars: int, dense_sizes) -> int:
+    """数值提取：正确性（不限制前瞻时与旧版一致）、长章节耗时、单行长度扩展性"""
+    failures = 0
+    changed = 0
+    for section in sections:
+        legacy = legacy_numbers(section)
+        if not same_numbers(extract_numbers(section, lookahead=None), legacy):
+            failures += 1
+        if not same_numbers(extract_numbers(section), legacy):
+            changed += 1
+    print(f"数值提取: {len(sections)} 个章节, 默认前瞻窗口下结果变化 {changed} 个")
+
+    text = long_section(sections, target_chars)
+    old, new, same = time_numbers(text)
+    failures += not same
+    print(f"长章节 {len(text.encode('utf-8')) / 1024 / 1024:.1f} MB: "
+          f".*?正则 {old * 1000:8.1f}ms  线性扫描 {new * 1000:8.1f}ms  加速 {old / new:.1f}x")
+
+    for size in dense_sizes:
+        old, new, same = time_numbers(dense_line(size))
+        failures += not same
+        print(f"锚点密集单行 {size // 1000:>4}K 字: "
+              f".*?正则 {old * 1000:8.1f}ms  线性扫描 {new * 1000:8.1f}ms  加速 {old / new:.1f}x")
+    return failures
+
+
+def bench_workers(num_files: int, worker_counts, seed: int) -> int:
+    """把真实语料复制成 num_files 个按日期命名的文件，对比不同进程数的全量解析耗时"""
+    rng = random.Random(seed)
+    sources = [f.read_text(encoding='utf-8') for f in sorted(CorpusParser().data_dir.glob("*.md"))
+               if f.name != "ReadMe.md"]
+    failures = 0
+    # 每个文件都会打一条日志，计时期间只保留警告以上级别
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        first = date(2000, 1, 1)
+        for i in range(num_files):
+            day = first + timedelta(days=i)
+            Path(tmp_dir, f"{day.isoformat()}.md").write_text(rng.choice(sources), encoding='utf-8')
+        size = sum(f.stat().st_size for f in Path(tmp_dir).iterdir())
+        print(f"合成语料: {num_files} 个文件, {size / 1024 / 1024:.1f} MB, CPU核数 {os.cpu_count()}")
+
+        parser = CorpusParser(data_dir=Path(tmp_dir))
+        baseline = None
+        serial = None
+        for workers in worker_counts:
+            start = time.perf_counter()
+            results = parser.parse_all(use_cache=False, workers=workers)
+            elapsed = time.perf_counter() - start
+            if baseline is None:
+                baseline, serial = results, elapsed
+            elif results != baseline:
+                failures += 1
+            print(f"{workers:>2} 进程: {elapsed:7.2f}s  {num_files / elapsed:7.0f} 文件/s  "
+                  f"加速 {serial / elapsed:.2f}x")
+        failures += bench_compact(baseline, Path(tmp_dir))
+    return failures
+
+
+def bench_compact(results, data_dir: Path) -> int:
+    """对比带正文与只存字节偏移的解析语料：文件大小、加载耗时，并校验懒加载章节一致"""
+    timings = {}
+    with tempfile.TemporaryDirectory() as out_dir:
+        for label, compact in [("带正文", False), ("字节偏移", True)]:
+            path = Path(out_dir, f"{label}.jsonl")
+            write_parsed_corpus(results, path, compact=compact)
+            start = time.perf_counter()
+            loaded = load_parsed_corpus(path, data_dir)
+            timings[label] = time.perf_counter() - start
+            print(f"解析语料（{label}）: {path.stat().st_size / 1024 / 1024:7.1f} MB  "
+                  f"加载 {timings[label] * 1000:8.1f}ms")
+
+        start = time.perf_counter()
+        same = all(dict(item["sections"]) == result["sections"]
+                   for item, result in zip(loaded, results))
+        print(f"懒加载全部章节: {time.perf_counter() - start:.2f}s  "
+              f"加载加速 {timings['带正文'] / timings['字节偏移']:.1f}x")
+    return 0 if same and len(loaded) == len(results) else 1
+
+
+def linear_query(records, all_of, any_of, start, end):
+    """旧做法：逐条扫描 key_info"""
+    def has(entities, term):
+        field, _, entity = term.partition(':')
+        if entity and field in entities:
+            return entity in entities[field]
+        return any(term in values for values in entities.values())
+
+    hits = []
+    for record in records:
+        if (start and record["date"] < start) or (end and record["date"] > end):
+            continue
+        for section in SECTIONS:
+            info = record["key_info"].get(section)
+            if not info:
+                continue
+            entities = {field: set(info.get(field, [])) for field in FIELDS}
+            if all(has(entities, t) for t in all_of) and (not any_of or any(has(entities, t) for t in any_of)):
+                hits.append((record["date"], section))
+    return hits
+
+
+def bench_index(records, years: int, seed: int) -> int:
+    """把真实解析结果平移成多年的日报，对比倒排索引查询与逐条扫描，并校验增量更新"""
+    rng = random.Random(seed)
+    first = date(2015, 1, 1)
+    days = [first + timedelta(days=i) for i in range(years * 365) if (first + timedelta(days=i)).weekday() < 5]
+    synthetic = [{"date": day.isoformat(), "key_info": rng.choice(records)["key_info"]} for day in days]
+
+    start = time.perf_counter()
+    index = EntityIndex()
+    index.update(synthetic[:-1])
+    build = time.perf_counter() - start
+    start = time.perf_counter()
+    index.update(synthetic, prune=True)
+    incremental = time.perf_counter() - start
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir, "entity_index.json.gz")
+        index.save(path)
+        start = time.perf_counter()
+        loaded = EntityIndex.load(path)
+        load = time.perf_counter() - start
+        size = path.stat().st_size
+    rebuilt = EntityIndex()
+    rebuilt.update(synthetic)
+    failures += loaded.postings != rebuilt.postings or loaded.days != rebuilt.days
+    print(f"实体索引: {len(days)} 天  全量构建 {build * 1000:.0f}ms  增量加一天 {incremental * 1000:.1f}ms  "
+          f"文件 {size / 1024:.0f} KB  加载 {load * 1000:.0f}ms")
+
+    sectors = sorted(index.entities("sectors"), key=index.entities("sectors").get, reverse=True)
+    mid = days[len(days) // 3].isoformat(), days[len(days) // 2].isoformat()
+    queries = [
+        ([sectors[0]], [], None, None),
+        ([f"sectors:{sectors[0]}", "predictions:反弹"], [], None, None),
+        ([], sectors[:5], *mid),
+        ([sectors[1]], sectors[2:6], mid[0], None),
+    ]
+    for all_of, any_of, lo, hi in queries:
+        start = time.perf_counter()
+        hits = index.query(all_of, any_of, lo, hi)
+        fast = time.perf_counter() - start
+        start = time.perf_counter()
+        expected = linear_query(synthetic, all_of, any_of, lo, hi)
+        slow = time.perf_counter() - start
+        failures += hits != expected
+        desc = ' AND '.join(all_of) + (' AND ' if all_of and any_of else '') + (
+            '(' + ' OR '.join(any_of) + ')' if any_of else '') + (f" [{lo}~{hi or ''}]" if lo else '')
+        print(f"  {desc}: {len(hits)} 条  索引 {fast * 1000:.2f}ms  逐条扫描 {slow * 1000:.1f}ms")
+    return failures
+
+
+def synthetic_stocks(sections, total: int, rng: random.Random):
+    """合成股票快照：首字按语料字频抽取（候选起点密度接近真实），其余字随机"""
+    chars = [ch for section in sections for ch in section if '\u4e00' <= ch <= '\u9fa5']
+    stocks = {}
+    names = set()
+    while len(stocks) < total:
+        name = rng.choice(chars) + ''.join(chr(rng.randint(0x4e00, 0x9fa5))
+                                           for _ in range(rng.randint(1, 3)))
+        code = f"{rng.choice(['600', '601', '000', '002', '300', '688'])}{rng.randint(0, 999):03d}"
+        if name not in names and code not in stocks:
+            names.add(name)
+            stocks[code] = name
+    return stocks
+
+
+def plant_stocks(sections, stocks, rng: random.Random):
+    """在每个章节随机位置插入若干股票名称（或代码），返回 (新章节, 每章节真实名称集合)"""
+    items = list(stocks.items())
+    planted, truth = [], []
+    for section in sections:
+        text = section
+        names = set()
+        for _ in range(rng.randint(0, 8)):
+            code, name = rng.choice(items)
+            pos = rng.randint(0, len(text))
+            text = text[:pos] + (f" {code} " if rng.random() < 0.2 else name) + text[pos:]
+            names.add(name)
+        planted.append(text)
+        truth.append(names)
+    return planted, truth
+
+
+def legacy_stocks(text: str):
+    """旧版公司简称正则"""
+    found = []
+    for pattern in STOCK_PATTERNS:
+        found.extend(re.findall(pattern, text))
+    return list(dict.fromkeys(found))
+
+
+def precision_recall(predicted, truth):
+    hit = sum(len(set(p) & t) for p, t in zip(predicted, truth))
+    total_pred = sum(len(set(p)) for p in predicted)
+    total_true = sum(len(t) for t in truth)
+    return hit / max(total_pred, 1), hit / max(total_true, 1)
+
+
+def bench_stocks(sections, total: int, repeat: int, seed: int) -> int:
+    """股票识别：前缀表最长匹配 vs 公司简称正则，对比吞吐、精确率/召回率与加载耗时"""
+    rng = random.Random(seed)
+    stocks = synthetic_stocks(sections, total, rng)
+    planted, truth = plant_stocks(sections, stocks, rng)
+    chars = sum(len(text) for text in planted)
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        snapshot = Path(tmp_dir, "stock_names.csv")
+        snapshot.write_text("code,name\n" + ''.join(f"{c},{n}\n" for c, n in stocks.items()),
+                            encoding='utf-8')
+        cache = Path(tmp_dir, "stock_recognizer.pkl")
+        start = time.perf_counter()
+        recognizer = load_recognizer(snapshot, cache)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        cached = load_recognizer(snapshot, cache)
+        load = time.perf_counter() - start
+        failures += cached.names != recognizer.names
+        print(f"股票快照 {len(recognizer.names)} 只: 构建 {build * 1000:.0f}ms  "
+              f"pickle {cache.stat().st_size / 1024:.0f} KB 加载 {load * 1000:.1f}ms")
+
+    for label, func in [("简称正则", legacy_stocks), ("快照识别", recognizer.names_in)]:
+        elapsed = bench(func, planted, repeat)
+        precision, recall = precision_recall([func(text) for text in planted], truth)
+        print(f"{label}: {chars / elapsed / 1e6:6.2f}M 字/s  精确率 {precision:6.1%}  召回率 {recall:6.1%}")
+    return failures
+
+
+def load_sections():
+    """读取 data/ 下所有非空章节"""
+    parser = CorpusParser()
+    sections = []
+    for file_path in sorted(parser.data_dir.glob("*.md")):
+        if file_path.name == "ReadMe.md":
+            continue
+        content = file_path.read_text(encoding='utf-8')
+        sections.extend(s for s in parser.split_sections(content).values() if s)
+    return sections
+
+
+def synthetic_keywords(base, total: int, seed: int):
+    """在真实关键词基础上补充随机中文词，模拟扩充到上千个词的配置"""
+    rng = random.Random(seed)
+    keywords = {category: list(words) for category, words in base.items()}
+    existing = {kw for words in keywords.values() for kw in words}
+    while len(existing) < total:
+        word = ''.join(chr(rng.randint(0x4e00, 0x9fa5)) for _ in range(rng.randint(2, 4)))
+        if word not in existing:
+            existing.add(word)
+            keywords["sectors"].append(word)
+    return keywords
+
+
+def bench(func, sections, repeat: int) -> float:
+    """返回最佳一轮耗时（秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for section in sections:
+            func(section)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="关键词自动机基准测试")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="每组重复次数")
+    arg_parser.add_argument("--sizes", type=int, nargs='+', default=[0, 1000, 5000],
+                            help="关键词总数（0表示使用原始配置）")
+    arg_parser.add_argument("--seed", type=int, default=42)
+    arg_parser.add_argument("--long-chars", type=int, default=400_000,
+                            help="数值提取长章节字符数（默认约1.3MB）")
+    arg_parser.add_argument("--dense-sizes", type=int, nargs='+', default=[10_000, 20_000, 40_000],
+                            help="锚点密集单行的字符数（旧版耗时随长度平方增长）")
+    arg_parser.add_argument("--files", type=int, default=10_000,
+                            help="多进程解析的合成文件数（0表示跳过）")
+    arg_parser.add_argument("--workers", type=int, nargs='+', default=[1, 2, 4, 8],
+                            help="对比的进程数（第一个作为基准）")
+    arg_parser.add_argument("--stocks", type=int, default=5000,
+                            help="股票识别基准的合成快照股票数（0表示跳过）")
+    arg_parser.add_argument("--index-years", type=int, default=10,
+                            help="实体索引基准的合成年数（0表示跳过）")
+    args = arg_parser.parse_args()
+
+    sections = load_sections()
+    base = load_keywords(KEYWORDS_FILE)
+    total_chars = sum(len(s) for s in sections)
+    print(f"章节: {len(sections)} 个, {total_chars / 1000:.0f}K 字")
+
+    failures = 0
+    for size in args.sizes:
+        keywords = synthetic_keywords(base, size, args.seed) if size else base
+        count = sum(len(words) for words in keywords.values())
+        old = bench(lambda s: legacy_keyword_scan(s, keywords), sections, args.repeat)
+
+        start = time.perf_counter()
+        matcher = KeywordMatcher(keywords)
+        build = time.perf_counter() - start
+        for section in sections:
+            expected = legacy_keyword_scan(section, keywords)
+            hits = matcher.scan(section)
+            if any(set(hits[c]) != set(expected[c]) for c in keywords):
+                failures += 1
+        new = bench(matcher.scan, sections, args.repeat)
+        print(f"关键词 {count:>5} 个: 逐词扫描 {old * 1000:8.1f}ms  "
+              f"自动机 {new * 1000:8.1f}ms（构建 {build * 1000:.1f}ms）  加速 {old / new:.1f}x")
+
+    failures += bench_numbers(sections, args.long_chars, args.dense_sizes)
+    if args.stocks:
+        failures += bench_stocks(sections, args.stocks, args.repeat, args.seed)
+    if args.index_years:
+        failures += bench_index(CorpusParser().parse_all(), args.index_years, args.seed)
+    if args.files:
+        failures += bench_workers(args.files, args.workers, args.seed)
+
+    print("✓ 结果一致" if not failures else f"✗ {failures} 处结果不一致")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""解析语料存储 - JSONL逐条写入与流式读取，兼容旧版 parsed_corpus.json
+
+紧凑格式只记录每个章节在源文件中的字节偏移和源文件哈希，章节正文在访问时
+从内存映射的源文件中切出。
+"""
+import hashlib
+import json
+import mmap
+import os
+import re
+import sys
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# orjson是可选的，没有时用标准库json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import DATA_DIR, PROCESSED_DATA_DIR
+
+# 每行一条解析结果（按文件名排序）
+PARSED_CORPUS_FILE = PROCESSED_DATA_DIR / "parsed_corpus.jsonl"
+
+# 旧版格式：整个语料一个带缩进的JSON数组
+LEGACY_CORPUS_FILE = PROCESSED_DATA_DIR / "parsed_corpus.json"
+
+
+_NEWLINE_RE = re.compile(r'\r\n?')
+
+
+def translate_newlines(text: str) -> str:
+    """与文本模式读取一致：CRLF和单独的CR都转成LF"""
+    return _NEWLINE_RE.sub('\n', text) if '\r' in text else text
+
+
+def section_text(raw: str) -> str:
+    """把源文件切片还原成章节正文：转换换行，开头不是标题时补上「# 」"""
+    text = translate_newlines(raw)
+    return text if text.startswith('#') else '# ' + text
+
+
+class LazySections(Mapping):
+    """按字节偏移从源文件懒加载章节正文，可当作 {章节名: 正文} 字典使用
+
+    每次访问单独映射源文件后切片，不长期占用文件句柄；首次访问时校验
+    源文件大小和哈希，源文件改动过则报错，需要重新解析。
+    """
+
+    def __init__(self, source: Path, offsets: Dict[str, Optional[List[int]]],
+                 sha256: str, size: int, verify: bool = True):
+        self.source = source
+        self.offsets = offsets
+        self.sha256 = sha256
+        self.size = size
+        self._verified = not verify
+
+    def _check(self, mapped):
+        if len(mapped) != self.size or hashlib.sha256(mapped).hexdigest() != self.sha256:
+            raise ValueError(f"源文件已改动，请重新解析: {self.source}")
+        self._verified = True
+
+    def __getitem__(self, name: str) -> str:
+        span = self.offsets[name]
+        if not span:
+            return ""
+        with open(self.source, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if not self._verified:
+                self._check(mapped)
+            start, end = span
+            return section_text(mapped[start:end].decode('utf-8'))
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __repr__(self):
+        return f"LazySections({self.source.name}, {list(self.offsets)})"
+
+
+def compact_record(record: Dict) -> Dict:
+    """去掉章节正文，只保留字节偏移（需要记录里有 section_offsets）"""
+    return {key: value for key, value in record.items() if key != "sections"}
+
+
+def attach_sections(record: Dict, source: Path, verify: bool = True) -> Dict:
+    """给紧凑记录挂上从 source 懒加载的 sections"""
+    record["sections"] = LazySections(Path(source), record["section_offsets"], record["sha256"],
+                                      record["size"], verify)
+    return record
+
+
+def find_parsed_corpus() -> Optional[Path]:
+    """返回可用的解析语料文件，优先JSONL，没有时回退到旧版JSON"""
+    for path in (PARSED_CORPUS_FILE, LEGACY_CORPUS_FILE):
+        if path.exists():
+            return path
+    return None
+
+
+def write_parsed_corpus(records: Iterable[Dict], path: Path = PARSED_CORPUS_FILE,
+                        compact: bool = False) -> int:
+    """逐条写入JSONL（先写临时文件再替换，中断不会留下半个文件），返回写入条数
+
+    compact=True 时不写章节正文，读取时由 LazySections 从源文件切出。
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    count = 0
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in records:
+                if compact and "section_offsets" in record:
+                    record = compact_record(record)
+                elif isinstance(record.get("sections"), LazySections):
+                    record = dict(record, sections=dict(record["sections"]))
+                f.write(json.dumps(record, ensure_ascii=False))
+                f.write('\n')
+                count += 1
+        os.replace(tmp_path, path)
+    except BaseException:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+    return count
+
+
+def export_legacy_json(path: Path = PARSED_CORPUS_FILE, output: Path = LEGACY_CORPUS_FILE) -> int:
+    """把JSONL转成旧版带缩进的JSON数组（供仍读取旧文件的外部工具使用），逐条写出"""
+    count = 0
+    with open(output, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for record in iter_parsed_corpus(path):
+            record["sections"] = dict(record["sections"])
+            item = json.dumps(record, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+            f.write(f"{',' if count else ''}\n  {item}")
+            count += 1
+        f.write('\n]' if count else ']')
+    return count
+
+
+def iter_parsed_corpus(path: Optional[Path] = None, data_dir: Path = DATA_DIR,
+                       verify: bool = True) -> Iterator[Dict]:
+    """逐条读取解析语料，内存占用与语料总量无关
+
+    path 为空时自动查找；旧版 .json 文件只能整体加载，仅作兼容。
+    紧凑记录的 sections 是 LazySections，从 data_dir 下的源文件按需读取。
+    """
+    path = path or find_parsed_corpus()
+    if path is None or not path.exists():
+        raise FileNotFoundError(f"未找到解析后的语料文件: {PARSED_CORPUS_FILE}")
+
+    if path.suffix != '.jsonl':
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+        return
+
+    loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = loads(line)
+            if "sections" not in record and "section_offsets" in record:
+                attach_sections(record, Path(data_dir) / record["filename"], verify)
+            yield record
+
+
+def load_parsed_corpus(path: Optional[Path] = None, data_dir: Path = DATA_DIR) -> List[Dict]:
+    """一次性加载全部解析语料（兼容需要列表的旧调用方）"""
+    return list(iter_parsed_corpus(path, data_dir))
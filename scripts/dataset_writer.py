@@ -0,0 +1,159 @@
+"""训练数据集写入 - 样本产生时追加到JSONL（可选按条数切分、gzip压缩），JSON数组视图只在结束或需要时生成"""
+import gzip
+import json
+import sys
+from pathlib import Path
+from typing import Dict, IO, Iterable, Iterator, List, Optional
+
+from loguru import logger
+
+# orjson是可选的，没有时用标准库json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import TRAINING_DATA_DIR, DATASET_SHARDS
+
+
+def dumps(obj) -> bytes:
+    """单行JSON（UTF-8，中文不转义）"""
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # 超出64位的整数等 orjson 不支持的值
+            pass
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+def dataset_files(name: str, directory: Path = TRAINING_DATA_DIR) -> List[Path]:
+    """数据集的JSONL文件：单个 {name}.jsonl，或按序号排列的分片 {name}-00000.jsonl[.gz]"""
+    single = directory / f"{name}.jsonl"
+    if single.exists():
+        return [single]
+    return sorted(directory.glob(f"{name}-[0-9][0-9][0-9][0-9][0-9].jsonl*"))
+
+
+def _open_read(path: Path) -> IO[bytes]:
+    return gzip.open(path, 'rb') if path.suffix == ".gz" else open(path, 'rb')
+
+
+def iter_lines(name: str, directory: Path = TRAINING_DATA_DIR) -> Iterator[bytes]:
+    """逐行读取数据集（不含换行符），分片按顺序读"""
+    for path in dataset_files(name, directory):
+        with _open_read(path) as f:
+            for line in f:
+                line = line.rstrip(b'\n')
+                if line:
+                    yield line
+
+
+def iter_dataset(name: str, directory: Path = TRAINING_DATA_DIR) -> Iterator[Dict]:
+    """逐条读取数据集样本"""
+    loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+    for line in iter_lines(name, directory):
+        yield loads(line)
+
+
+def write_json_view(name: str, directory: Path = TRAINING_DATA_DIR) -> Path:
+    """从JSONL流式生成 {name}.json 数组视图（每行一个样本，直接复用已编码的行）"""
+    path = directory / f"{name}.json"
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(b'[')
+        for i, line in enumerate(iter_lines(name, directory)):
+            f.write(b'\n' if i == 0 else b',\n')
+            f.write(line)
+        f.write(b'\n]\n')
+    tmp_path.replace(path)
+    return path
+
+
+class DatasetWriter:
+    """流式数据集写入器
+
+    write 把样本编码一次追加到JSONL，写入量只与新样本有关。shard_size 大于0时每 shard_size 条
+    切一个分片 {name}-00000.jsonl，compress 时分片用gzip压缩。写入过程中只写临时文件，close 时
+    一起替换正式文件并删除上次运行留下的多余文件；出错退出（with 块内异常）时丢弃临时文件，保留上次的数据集。
+    json_view 为真时 close 后生成 {name}.json 数组视图。
+    """
+
+    def __init__(self, name: str = "training_dataset", directory: Path = TRAINING_DATA_DIR,
+                 shard_size: int = DATASET_SHARDS["size"], compress: bool = DATASET_SHARDS["compress"],
+                 json_view: bool = True):
+        self.name = name
+        self.directory = directory
+        self.shard_size = shard_size if shard_size and shard_size > 0 else None
+        self.compress = compress and self.shard_size is not None
+        self.json_view = json_view
+        self.count = 0
+        self._paths: List[Path] = []
+        self._file: Optional[IO[bytes]] = None
+        self._shard_count = 0
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _next_path(self) -> Path:
+        if self.shard_size is None:
+            return self.directory / f"{self.name}.jsonl"
+        suffix = ".jsonl.gz" if self.compress else ".jsonl"
+        return self.directory / f"{self.name}-{len(self._paths):05d}{suffix}"
+
+    def _open(self):
+        path = self._next_path()
+        self._paths.append(path)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        self._file = gzip.open(tmp_path, 'wb', compresslevel=6) if self.compress else open(tmp_path, 'wb')
+        self._shard_count = 0
+
+    def write(self, samples: Iterable[Dict]) -> int:
+        """追加样本，返回本次写入的条数"""
+        written = 0
+        for sample in samples:
+            if self._file is None or (self.shard_size and self._shard_count >= self.shard_size):
+                if self._file is not None:
+                    self._file.close()
+                self._open()
+            self._file.write(dumps(sample) + b'\n')
+            self._shard_count += 1
+            written += 1
+        self.count += written
+        return written
+
+    def close(self) -> List[Path]:
+        """替换正式文件并清理旧文件，返回数据集文件"""
+        if self._file is None:
+            self._open()
+        self._file.close()
+        self._file = None
+        for path in self._paths:
+            path.with_name(f".{path.name}.tmp").replace(path)
+        # 上次运行的分片数更多、或换了单文件/分片方式时留下的文件
+        stale = set(self.directory.glob(f"{self.name}-[0-9][0-9][0-9][0-9][0-9].jsonl*"))
+        stale.add(self.directory / f"{self.name}.jsonl")
+        for path in stale - set(self._paths):
+            path.unlink(missing_ok=True)
+        logger.info(f"训练数据已保存到: {self._paths[0] if len(self._paths) == 1 else self.directory}"
+                    f"（{self.count} 个样本，{len(self._paths)} 个文件）")
+        if self.json_view:
+            logger.info(f"JSON格式已保存到: {write_json_view(self.name, self.directory)}")
+        return list(self._paths)
+
+    def abort(self):
+        """丢弃本次写入的临时文件"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        for path in self._paths:
+            path.with_name(f".{path.name}.tmp").unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,230 @@
+"""实体倒排索引 - 板块、个股、预测、情绪 -> (日期, 章节) 倒排表，支持增量更新与组合查询"""
+import argparse
+import bisect
+import gzip
+import hashlib
+import json
+import sys
+from datetime import date
+from itertools import accumulate
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import PROCESSED_DATA_DIR, LOG_DIR
+from corpus_store import iter_parsed_corpus
+
+# 索引文件（gzip压缩的JSON，倒排表按差值编码）
+ENTITY_INDEX_FILE = PROCESSED_DATA_DIR / "entity_index.json.gz"
+
+# 索引格式版本
+INDEX_VERSION = 1
+
+# 建索引的 key_info 字段
+FIELDS = ["sectors", "stocks", "predictions", "sentiments"]
+
+# 章节顺序，文档编号 = 日期序数 * 4 + 章节序号，编号顺序即时间顺序
+SECTIONS = ["早自习", "主1", "主2"]
+_SLOTS = 4
+
+
+def doc_id(day: str, section: str) -> int:
+    """(日期, 章节) -> 文档编号"""
+    return date.fromisoformat(day).toordinal() * _SLOTS + SECTIONS.index(section)
+
+
+def doc_key(doc: int) -> Tuple[str, str]:
+    """文档编号 -> (日期, 章节)"""
+    ordinal, slot = divmod(doc, _SLOTS)
+    return date.fromordinal(ordinal).isoformat(), SECTIONS[slot]
+
+
+def _fingerprint(key_info: Dict) -> str:
+    """一天的提取结果指纹，源文件或解析规则变化都会让它改变"""
+    terms = {section: {field: sorted(set(info.get(field, []))) for field in FIELDS}
+             for section, info in key_info.items()}
+    payload = json.dumps(terms, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class EntityIndex:
+    """倒排索引：{字段: {实体: 有序文档编号列表}}
+
+    只有新增或提取结果变化的日期才会重建其倒排项；查询用集合运算，
+    日期范围直接换算成文档编号区间。
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, List[int]]] = {field: {} for field in FIELDS}
+        # 已索引日期 -> 提取结果指纹
+        self.days: Dict[str, str] = {}
+
+    @classmethod
+    def load(cls, path: Path = ENTITY_INDEX_FILE) -> "EntityIndex":
+        """加载索引，文件不存在或版本不符时返回空索引"""
+        index = cls()
+        if not path.exists():
+            return index
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_VERSION:
+            logger.warning(f"实体索引版本不符，将重建: {path}")
+            return index
+        index.days = data["days"]
+        for field in FIELDS:
+            index.postings[field] = {
+                entity: list(accumulate(deltas))
+                for entity, deltas in data["postings"].get(field, {}).items()
+            }
+        return index
+
+    def save(self, path: Path = ENTITY_INDEX_FILE):
+        """保存索引（先写临时文件再替换）"""
+        postings = {
+            field: {
+                entity: [doc - prev for doc, prev in zip(docs, [0] + docs)]
+                for entity, docs in sorted(entities.items())
+            }
+            for field, entities in self.postings.items()
+        }
+        data = {"version": INDEX_VERSION, "days": dict(sorted(self.days.items())),
+                "postings": postings}
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        tmp_path.replace(path)
+
+    def _remove_days(self, days: List[str]):
+        """删除若干日期的全部倒排项"""
+        ordinals = {date.fromisoformat(day).toordinal() for day in days}
+        if not ordinals:
+            return
+        for entities in self.postings.values():
+            for entity in list(entities):
+                docs = [doc for doc in entities[entity] if doc // _SLOTS not in ordinals]
+                if docs:
+                    entities[entity] = docs
+                else:
+                    del entities[entity]
+        for day in days:
+            self.days.pop(day, None)
+
+    def _add_day(self, day: str, key_info: Dict):
+        """加入一天的倒排项（文档编号通常比已有的都大，追加即可）"""
+        for section, info in key_info.items():
+            if section not in SECTIONS:
+                continue
+            doc = doc_id(day, section)
+            for field in FIELDS:
+                entities = self.postings[field]
+                for entity in set(info.get(field, [])):
+                    docs = entities.setdefault(entity, [])
+                    if not docs or docs[-1] < doc:
+                        docs.append(doc)
+                    else:
+                        # 补录历史日期时按序插入
+                        i = bisect.bisect_left(docs, doc)
+                        if i == len(docs) or docs[i] != doc:
+                            docs.insert(i, doc)
+
+    def update(self, records: Iterable[Dict], prune: bool = False) -> Tuple[int, int]:
+        """用解析记录增量更新，返回 (更新的天数, 删除的天数)
+
+        prune=True 时 records 视为全量语料，不在其中的日期会被删除。
+        """
+        changed = {}
+        seen = set()
+        for record in records:
+            day = record["date"]
+            seen.add(day)
+            fingerprint = _fingerprint(record["key_info"])
+            if self.days.get(day) != fingerprint:
+                changed[day] = (fingerprint, record["key_info"])
+
+        removed = [day for day in self.days if day not in seen] if prune else []
+        self._remove_days([day for day in changed if day in self.days] + removed)
+        for day in sorted(changed):
+            fingerprint, key_info = changed[day]
+            self._add_day(day, key_info)
+            self.days[day] = fingerprint
+        return len(changed), len(removed)
+
+    def _docs(self, term: str) -> set:
+        """单个实体的文档集合；「字段:实体」只查该字段，否则合并所有字段"""
+        field, _, entity = term.partition(':')
+        if entity and field in self.postings:
+            return set(self.postings[field].get(entity, ()))
+        docs = set()
+        for entities in self.postings.values():
+            docs.update(entities.get(term, ()))
+        return docs
+
+    def query(self, all_of: Iterable[str] = (), any_of: Iterable[str] = (),
+              start: Optional[str] = None, end: Optional[str] = None) -> List[Tuple[str, str]]:
+        """组合查询，返回按时间排序的 [(日期, 章节), ...]
+
+        all_of 中的实体必须全部出现（AND），any_of 中至少出现一个（OR），
+        start/end 为闭区间日期（YYYY-MM-DD）；同一章节内出现即算命中。
+        """
+        all_of, any_of = list(all_of), list(any_of)
+        docs = None
+        for term in all_of:
+            docs = self._docs(term) if docs is None else docs & self._docs(term)
+            if not docs:
+                return []
+        if any_of:
+            union = set().union(*(self._docs(term) for term in any_of))
+            docs = union if docs is None else docs & union
+        if docs is None:
+            # 只有日期条件时返回区间内全部已索引章节
+            docs = set().union(*(postings for entities in self.postings.values()
+                                 for postings in entities.values()))
+
+        low = doc_id(start, SECTIONS[0]) if start else None
+        high = doc_id(end, SECTIONS[-1]) if end else None
+        return [doc_key(doc) for doc in sorted(docs)
+                if (low is None or doc >= low) and (high is None or doc <= high)]
+
+    def entities(self, field: str) -> Dict[str, int]:
+        """某字段下每个实体出现的章节数"""
+        return {entity: len(docs) for entity, docs in self.postings[field].items()}
+
+
+def update_entity_index(path: Path = ENTITY_INDEX_FILE) -> EntityIndex:
+    """从解析语料增量更新索引并保存"""
+    index = EntityIndex.load(path)
+    changed, removed = index.update(iter_parsed_corpus(), prune=True)
+    if changed or removed or not path.exists():
+        index.save(path)
+    logger.info(f"实体索引: 更新 {changed} 天，删除 {removed} 天，共 {len(index.days)} 天")
+    return index
+
+
+def main():
+    """命令行：更新索引后查询"""
+    logger.add(LOG_DIR / "entity_index.log", rotation="10 MB")
+    arg_parser = argparse.ArgumentParser(description="实体倒排索引查询")
+    arg_parser.add_argument("terms", nargs='*',
+                            help="实体（如 军工，或限定字段 sectors:军工）")
+    arg_parser.add_argument("--any", action="store_true", help="任一实体出现即命中（默认全部出现）")
+    arg_parser.add_argument("--start", help="起始日期 YYYY-MM-DD")
+    arg_parser.add_argument("--end", help="结束日期 YYYY-MM-DD")
+    args = arg_parser.parse_args()
+
+    index = update_entity_index()
+    if not args.terms and not (args.start or args.end):
+        return
+
+    if args.any:
+        hits = index.query(any_of=args.terms, start=args.start, end=args.end)
+    else:
+        hits = index.query(all_of=args.terms, start=args.start, end=args.end)
+    for day, section in hits:
+        print(f"{day}  {section}")
+    print(f"共 {len(hits)} 个章节")
+
+
+if __name__ == "__main__":
+    main()
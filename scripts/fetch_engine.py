@@ -0,0 +1,89 @@
+"""并发获取引擎 - 按数据源的令牌桶限速，线程池并发请求"""
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import SOURCE_RATE_LIMITS, FETCH_CONCURRENCY
+
+
+class TokenBucket:
+    """令牌桶：平均每秒 rate 个请求，最多攒 burst 个令牌用于突发
+
+    线程安全；acquire 在令牌不足时阻塞到刚好有令牌为止。rate 为空或不大于0时不限速。
+    """
+
+    def __init__(self, rate: Optional[float], burst: Optional[float] = None):
+        self.rate = rate if rate and rate > 0 else None
+        self.burst = burst or max(1.0, rate or 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        """取走 tokens 个令牌，不足时等待"""
+        if self.rate is None:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_limiters: Dict[str, TokenBucket] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(source: str) -> TokenBucket:
+    """数据源对应的令牌桶（进程内共享，未配置的数据源不限速）"""
+    with _limiters_lock:
+        limiter = _limiters.get(source)
+        if limiter is None:
+            limits = SOURCE_RATE_LIMITS.get(source, {})
+            limiter = TokenBucket(limits.get("rate"), limits.get("burst"))
+            _limiters[source] = limiter
+        return limiter
+
+
+def set_rate_limit(source: str, rate: Optional[float], burst: Optional[float] = None):
+    """运行时调整某个数据源的限速"""
+    with _limiters_lock:
+        _limiters[source] = TokenBucket(rate, burst)
+
+
+def limited_call(source: str, func: Callable, *args, **kwargs) -> Any:
+    """按数据源限速后调用接口"""
+    get_limiter(source).acquire()
+    return func(*args, **kwargs)
+
+
+def map_concurrently(func: Callable, items: Iterable, concurrency: Optional[int] = None
+                     ) -> Iterator[Tuple[Any, Any, Optional[BaseException]]]:
+    """线程池并发执行 func(item)，按完成顺序产出 (item, 结果, 异常)
+
+    并发数只决定同时在途的请求数，实际请求速率由各数据源的令牌桶控制。
+    """
+    items = list(items)
+    concurrency = concurrency or FETCH_CONCURRENCY
+    if concurrency <= 1 or len(items) <= 1:
+        for item in items:
+            try:
+                yield item, func(item), None
+            except Exception as e:
+                yield item, None, e
+        return
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(func, item): item for item in items}
+        for future in as_completed(futures):
+            error = future.exception()
+            yield futures[future], None if error else future.result(), error
@@ -1,17 +1,19 @@
 """市场数据爬取脚本"""
-import akshare as ak
-import efinance as ef
 import pandas as pd
-import json
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 from loguru import logger
 import sys
-import time
 
 sys.path.append(str(Path(__file__).parent.parent))
-from config import RAW_DATA_DIR, LOG_DIR, INDEX_CODES
+from config import LOG_DIR
+from index_history import IndexHistoryCache, INDEX_SYMBOLS
+from market_breadth import BreadthEngine
+from market_store import MarketDataStore
+from response_cache import get_response_cache
+from sector_boards import SectorBoards
+from source_adapters import MarketDataSources
 
 # 配置日志
 logger.add(LOG_DIR / "fetch_market_data.log", rotation="10 MB")
@@ -21,70 +23,39 @@ class MarketDataFetcher:
     """市场数据获取器"""
     
     def __init__(self):
-        self.raw_data_dir = RAW_DATA_DIR
+        # 列式市场数据存储（替代逐日的 market_data_{date}.json）
+        self.market_store = MarketDataStore()
+        # 指数日线缓存：每个指数每次运行最多联网一次
+        self.index_cache = IndexHistoryCache()
+        # 接口响应缓存：同一接口同一参数在有效期内只请求一次
+        self.response_cache = get_response_cache()
+        # 多数据源：失败重试、熔断后自动切换到备用数据源
+        self.sources = MarketDataSources(cache=self.response_cache)
+        # 涨跌统计：个股日线库按日期区间一次算出，库里没有的日期退回实时快照（每次运行只取一次）
+        self.breadth = BreadthEngine(self.sources)
+        # 板块行情：行业、概念板块快照每次运行只取一次，历史日期用缓存的板块日线
+        self.boards = SectorBoards(self.sources)
         
     def fetch_index_data(self, date: str) -> Dict:
-        """获取指数数据"""
+        """获取指数数据（从本地历史缓存按日期取行）"""
         logger.info(f"获取 {date} 的指数数据")
         result = {}
         
-        try:
-            # 格式化日期
-            date_obj = datetime.strptime(date, "%Y-%m-%d")
-            
-            # 获取上证指数
-            try:
-                sh_df = ak.stock_zh_index_daily(symbol="sh000001")
-                sh_data = sh_df[sh_df['date'] == date]
-                if not sh_data.empty:
-                    result['上证指数'] = {
-                        'open': float(sh_data.iloc[0]['open']),
-                        'close': float(sh_data.iloc[0]['close']),
-                        'high': float(sh_data.iloc[0]['high']),
-                        'low': float(sh_data.iloc[0]['low']),
-                        'volume': float(sh_data.iloc[0]['volume']),
-                        'change_pct': round((sh_data.iloc[0]['close'] - sh_data.iloc[0]['open']) / sh_data.iloc[0]['open'] * 100, 2)
-                    }
-                    logger.info(f"上证指数: {result['上证指数']['close']}")
-            except Exception as e:
-                logger.warning(f"获取上证指数失败: {e}")
-            
-            # 获取深证成指
+        for name, symbol in INDEX_SYMBOLS.items():
             try:
-                sz_df = ak.stock_zh_index_daily(symbol="sz399001")
-                sz_data = sz_df[sz_df['date'] == date]
-                if not sz_data.empty:
-                    result['深证成指'] = {
-                        'open': float(sz_data.iloc[0]['open']),
-                        'close': float(sz_data.iloc[0]['close']),
-                        'high': float(sz_data.iloc[0]['high']),
-                        'low': float(sz_data.iloc[0]['low']),
-                        'volume': float(sz_data.iloc[0]['volume']),
-                        'change_pct': round((sz_data.iloc[0]['close'] - sz_data.iloc[0]['open']) / sz_data.iloc[0]['open'] * 100, 2)
+                row = self.index_cache.row(symbol, date)
+                if row is not None:
+                    result[name] = {
+                        'open': float(row['open']),
+                        'close': float(row['close']),
+                        'high': float(row['high']),
+                        'low': float(row['low']),
+                        'volume': float(row['volume']),
+                        'change_pct': round(float((row['close'] - row['open']) / row['open'] * 100), 2)
                     }
-                    logger.info(f"深证成指: {result['深证成指']['close']}")
+                    logger.info(f"{name}: {result[name]['close']}")
             except Exception as e:
-                logger.warning(f"获取深证成指失败: {e}")
-            
-            # 获取创业板指
-            try:
-                cy_df = ak.stock_zh_index_daily(symbol="sz399006")
-                cy_data = cy_df[cy_df['date'] == date]
-                if not cy_data.empty:
-                    result['创业板指'] = {
-                        'open': float(cy_data.iloc[0]['open']),
-                        'close': float(cy_data.iloc[0]['close']),
-                        'high': float(cy_data.iloc[0]['high']),
-                        'low': float(cy_data.iloc[0]['low']),
-                        'volume': float(cy_data.iloc[0]['volume']),
-                        'change_pct': round((cy_data.iloc[0]['close'] - cy_data.iloc[0]['open']) / cy_data.iloc[0]['open'] * 100, 2)
-                    }
-                    logger.info(f"创业板指: {result['创业板指']['close']}")
-            except Exception as e:
-                logger.warning(f"获取创业板指失败: {e}")
-            
-        except Exception as e:
-            logger.error(f"获取指数数据失败: {e}")
+                logger.warning(f"获取{name}失败: {e}")
         
         return result
     
@@ -94,32 +65,17 @@ class MarketDataFetcher:
         result = {}
         
         try:
-            # 获取涨跌统计
-            date_formatted = date.replace('-', '')
-            try:
-                market_df = ak.stock_zh_a_spot_em()
-                if not market_df.empty:
-                    up_count = len(market_df[market_df['涨跌幅'] > 0])
-                    down_count = len(market_df[market_df['涨跌幅'] < 0])
-                    flat_count = len(market_df[market_df['涨跌幅'] == 0])
-                    
-                    result['market_stats'] = {
-                        'up_count': int(up_count),
-                        'down_count': int(down_count),
-                        'flat_count': int(flat_count),
-                        'total_count': int(len(market_df))
-                    }
-                    logger.info(f"市场统计: 上涨{up_count}, 下跌{down_count}")
-            except Exception as e:
-                logger.warning(f"获取涨跌统计失败: {e}")
+            # 获取涨跌统计（个股日线库的历史统计）
+            stats = self.breadth.stats_for(date)
+            if stats:
+                result['market_stats'] = stats
             
             # 获取成交额（使用上证指数的成交量作为参考）
             try:
-                sh_df = ak.stock_zh_index_daily(symbol="sh000001")
-                sh_data = sh_df[sh_df['date'] == date]
-                if not sh_data.empty:
+                sh_row = self.index_cache.row(INDEX_SYMBOLS['上证指数'], date)
+                if sh_row is not None:
                     result['turnover'] = {
-                        'amount': float(sh_data.iloc[0]['volume']) / 100000000,  # 转换为亿元
+                        'amount': float(sh_row['volume']) / 100000000,  # 转换为亿元
                         'unit': '亿元'
                     }
             except Exception as e:
@@ -131,40 +87,12 @@ class MarketDataFetcher:
         return result
     
     def fetch_sector_data(self, date: str, sectors: List[str]) -> Dict:
-        """获取板块数据"""
+        """获取板块数据（板块快照和板块日线每次运行只取一次，每天的全部板块一次查出）"""
         logger.info(f"获取 {date} 的板块数据")
         result = {}
         
-        # 板块映射（映射到东方财富的板块名称）
-        sector_mapping = {
-            '半导体': '半导体',
-            '芯片': '芯片',
-            'AI': '人工智能',
-            '人工智能': '人工智能',
-            '军工': '国防军工',
-            '新能源': '新能源',
-            '光伏': '光伏',
-            '医药': '医药',
-            '消费': '消费',
-            '券商': '券商',
-            '煤炭': '煤炭',
-        }
-        
         try:
-            # 获取板块行情
-            for sector in sectors[:10]:  # 限制数量避免请求过多
-                mapped_sector = sector_mapping.get(sector, sector)
-                try:
-                    time.sleep(0.5)  # 避免请求过快
-                    # 注意：实际实现时需要根据具体数据源API调整
-                    result[sector] = {
-                        'name': sector,
-                        'change_pct': 0.0,  # 占位
-                        'note': '需要实际API数据'
-                    }
-                except Exception as e:
-                    logger.warning(f"获取板块 {sector} 数据失败: {e}")
-                    
+            result = self.boards.lookup(date, sectors)
         except Exception as e:
             logger.error(f"获取板块数据失败: {e}")
         
@@ -178,7 +106,7 @@ class MarketDataFetcher:
         try:
             # 获取北向资金
             try:
-                north_df = ak.stock_hsgt_north_net_flow_in_em(symbol="沪股通")
+                north_df = self.sources.fetch("north_flow", symbol="沪股通")
                 north_data = north_df[north_df['日期'] == date]
                 if not north_data.empty:
                     result['北向资金'] = {
@@ -223,14 +151,15 @@ class MarketDataFetcher:
         return data
     
     def save_market_data(self, date: str, data: Dict):
-        """保存市场数据"""
-        filename = f"market_data_{date}.json"
-        filepath = self.raw_data_dir / filename
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        
-        logger.info(f"市场数据已保存到: {filepath}")
+        """保存单日市场数据到列式存储"""
+        self.market_store.append([data])
+        logger.info(f"{date} 市场数据已保存到: {self.market_store.root}")
+    
+    def save_market_batch(self, records: List[Dict]):
+        """一次写入多天的市场数据（一个批次一组分片），然后合并各年的分片"""
+        count = self.market_store.append(records)
+        self.market_store.compact()
+        logger.info(f"{count} 天市场数据已保存到: {self.market_store.root}")
 
 
 def main():
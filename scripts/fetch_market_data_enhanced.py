@@ -1,55 +1,99 @@
 """增强版市场数据爬取 - 整合多个数据源"""
-import akshare as ak
 import pandas as pd
-import json
+import argparse
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional
 from loguru import logger
 from tqdm import tqdm
 import sys
-import time
 
 sys.path.append(str(Path(__file__).parent.parent))
-from config import RAW_DATA_DIR, PROCESSED_DATA_DIR, LOG_DIR
+from config import LOG_DIR
+from corpus_store import iter_parsed_corpus
+from fetch_engine import map_concurrently
+from fetch_planner import plan_fetch, describe_plan
+from index_history import IndexHistoryCache, INDEX_SYMBOLS
+from market_breadth import BreadthEngine
+from market_store import MarketDataStore
+from response_cache import get_response_cache
+from sector_boards import SectorBoards
+from source_adapters import MarketDataSources
 
 # 配置日志
 logger.add(LOG_DIR / "fetch_market.log", rotation="10 MB")
 
+# 批量获取时每攒够这么多天写入一次存储
+SAVE_BATCH = 50
+
 
 class EnhancedMarketDataFetcher:
     """增强版市场数据获取器"""
     
     def __init__(self):
-        self.raw_data_dir = RAW_DATA_DIR
+        # 列式市场数据存储（替代逐日的 market_data_{date}.json）
+        self.market_store = MarketDataStore()
+        # 指数日线缓存：每个指数每次运行最多联网一次
+        self.index_cache = IndexHistoryCache()
+        # 接口响应缓存：同一接口同一参数在有效期内只请求一次
+        self.response_cache = get_response_cache()
+        # 多数据源：失败重试、熔断后自动切换到备用数据源
+        self.sources = MarketDataSources(cache=self.response_cache)
+        # 涨跌统计：个股日线库按日期区间一次算出，库里没有的日期退回实时快照（每次运行只取一次）
+        self.breadth = BreadthEngine(self.sources)
+        # 板块行情：行业、概念板块快照每次运行只取一次
+        self.boards = SectorBoards(self.sources)
+        
+    def fetch_all_data_for_dates(self, dates: List[str], concurrency: Optional[int] = None):
+        """批量获取多个日期的数据
         
-    def fetch_all_data_for_dates(self, dates: List[str]):
-        """批量获取多个日期的数据"""
+        多个日期并发获取（concurrency 为同时在途的请求数，默认 FETCH_CONCURRENCY），
+        请求速率由各数据源的令牌桶控制；返回结果按 dates 的顺序排列。
+        """
         logger.info(f"开始批量获取 {len(dates)} 个日期的市场数据")
         
         results = {}
+        pending = []
+        failed = 0
+        # 指数行情一次性按全部日期对齐
+        indices_by_date = self.fetch_indices_batch(dates)
+        # 涨跌统计一次算出全部日期
+        self.breadth.prepare(dates)
         
-        with tqdm(dates, desc="📈 爬取市场数据", unit="天", colour="cyan") as pbar:
-            for date in pbar:
-                pbar.set_description(f"📈 爬取 {date}")
-                try:
-                    data = self.fetch_date_data(date)
+        def fetch(date: str) -> Dict:
+            return self.fetch_date_data(date, indices_by_date.get(date))
+        
+        with tqdm(total=len(dates), desc="📈 爬取市场数据", unit="天", colour="cyan") as pbar:
+            for date, data, error in map_concurrently(fetch, dates, concurrency):
+                if error is None:
                     results[date] = data
-                    self.save_market_data(date, data)
-                    pbar.set_postfix({"成功": len(results)})
-                    time.sleep(1)  # 避免请求过快
-                except Exception as e:
-                    logger.error(f"获取 {date} 失败: {e}")
-                    pbar.set_postfix({"成功": len(results), "失败": len(dates)-len(results)})
+                    pending.append(data)
+                else:
+                    failed += 1
+                    logger.error(f"获取 {date} 失败: {error}")
+                # 攒够一批再写入存储，中断时最多丢失一批
+                if len(pending) >= SAVE_BATCH:
+                    self.market_store.append(pending)
+                    pending = []
+                pbar.update(1)
+                pbar.set_postfix({"成功": len(results), "失败": failed})
+        if pending:
+            self.market_store.append(pending)
+        # 本次运行的分片合并成每年一个，读取时少打开文件
+        self.market_store.compact()
         
         logger.info(f"✅ 成功获取 {len(results)}/{len(dates)} 个日期的数据")
-        return results
+        stats = self.response_cache.stats()
+        logger.info(f"响应缓存: 命中 {stats['hits']}，未命中 {stats['misses']}，"
+                    f"命中率 {stats['hit_rate']:.0%}")
+        self.sources.log_metrics()
+        return {date: results[date] for date in dates if date in results}
     
-    def fetch_date_data(self, date: str) -> Dict:
-        """获取单日所有市场数据"""
+    def fetch_date_data(self, date: str, indices: Optional[Dict] = None) -> Dict:
+        """获取单日所有市场数据（indices 为批量预取的指数行情）"""
         data = {
             'date': date,
-            'indices': self.fetch_indices(date),
+            'indices': indices if indices is not None else self.fetch_indices(date),
             'market_stats': self.fetch_market_stats(date),
             'fund_flow': self.fetch_fund_flow(date),
             'top_sectors': self.fetch_top_sectors(date),
@@ -59,85 +103,36 @@ class EnhancedMarketDataFetcher:
     
     def fetch_indices(self, date: str) -> Dict:
         """获取三大指数数据"""
-        indices = {}
-        
-        try:
-            # 上证指数
-            df = ak.stock_zh_index_daily(symbol="sh000001")
-            row = df[df['date'] == date]
-            if not row.empty:
-                indices['上证指数'] = {
-                    'code': '000001',
-                    'open': float(row.iloc[0]['open']),
-                    'close': float(row.iloc[0]['close']),
-                    'high': float(row.iloc[0]['high']),
-                    'low': float(row.iloc[0]['low']),
-                    'volume': float(row.iloc[0]['volume']),
-                    'change': round(row.iloc[0]['close'] - row.iloc[0]['open'], 2),
-                    'change_pct': round((row.iloc[0]['close'] - row.iloc[0]['open']) / row.iloc[0]['open'] * 100, 2)
-                }
-        except Exception as e:
-            logger.debug(f"获取上证指数失败: {e}")
+        return self.fetch_indices_batch([date]).get(date, {})
+    
+    def fetch_indices_batch(self, dates: List[str]) -> Dict[str, Dict]:
+        """批量获取多个日期的三大指数数据，返回 {日期: {指数名: 行情}}
         
-        try:
-            # 深证成指
-            df = ak.stock_zh_index_daily(symbol="sz399001")
-            row = df[df['date'] == date]
-            if not row.empty:
-                indices['深证成指'] = {
-                    'code': '399001',
-                    'open': float(row.iloc[0]['open']),
-                    'close': float(row.iloc[0]['close']),
-                    'high': float(row.iloc[0]['high']),
-                    'low': float(row.iloc[0]['low']),
-                    'volume': float(row.iloc[0]['volume']),
-                    'change': round(row.iloc[0]['close'] - row.iloc[0]['open'], 2),
-                    'change_pct': round((row.iloc[0]['close'] - row.iloc[0]['open']) / row.iloc[0]['open'] * 100, 2)
-                }
-        except Exception as e:
-            logger.debug(f"获取深证成指失败: {e}")
+        每个指数的日线只取一次，用 reindex 一次对齐全部日期，涨跌额、涨跌幅
+        整列计算，非交易日不出现在结果中。
+        """
+        dates = list(dict.fromkeys(dates))
+        results: Dict[str, Dict] = {date: {} for date in dates}
+        if not dates:
+            return results
         
-        try:
-            # 创业板指
-            df = ak.stock_zh_index_daily(symbol="sz399006")
-            row = df[df['date'] == date]
-            if not row.empty:
-                indices['创业板指'] = {
-                    'code': '399006',
-                    'open': float(row.iloc[0]['open']),
-                    'close': float(row.iloc[0]['close']),
-                    'high': float(row.iloc[0]['high']),
-                    'low': float(row.iloc[0]['low']),
-                    'volume': float(row.iloc[0]['volume']),
-                    'change': round(row.iloc[0]['close'] - row.iloc[0]['open'], 2),
-                    'change_pct': round((row.iloc[0]['close'] - row.iloc[0]['open']) / row.iloc[0]['open'] * 100, 2)
-                }
-        except Exception as e:
-            logger.debug(f"获取创业板指失败: {e}")
+        for name, symbol in INDEX_SYMBOLS.items():
+            try:
+                df = self.index_cache.history(symbol, until=max(dates))
+                frame = df.reindex(dates).dropna(subset=['close'])
+                frame['change'] = (frame['close'] - frame['open']).round(2)
+                frame['change_pct'] = ((frame['close'] - frame['open']) / frame['open'] * 100).round(2)
+                frame.insert(0, 'code', symbol[2:])
+                for date, fields in frame.to_dict('index').items():
+                    results[date][name] = fields
+            except Exception as e:
+                logger.warning(f"获取{name}失败: {e}")
         
-        return indices
+        return results
     
     def fetch_market_stats(self, date: str) -> Dict:
-        """获取市场涨跌统计"""
-        stats = {}
-        
-        try:
-            # 获取A股实时数据（注意：只能获取当日或最近的数据）
-            # 对于历史数据，这个方法可能不准确
-            df = ak.stock_zh_a_spot_em()
-            if not df.empty:
-                stats = {
-                    'up_count': int(len(df[df['涨跌幅'] > 0])),
-                    'down_count': int(len(df[df['涨跌幅'] < 0])),
-                    'limit_up': int(len(df[df['涨跌幅'] >= 9.9])),
-                    'limit_down': int(len(df[df['涨跌幅'] <= -9.9])),
-                    'total': int(len(df)),
-                    'note': '当日数据或最近交易日数据'
-                }
-        except Exception as e:
-            logger.debug(f"获取市场统计失败: {e}")
-        
-        return stats
+        """获取市场涨跌统计（涨跌家数、涨跌停、创新高/新低、涨跌幅分位数）"""
+        return self.breadth.stats_for(date)
     
     def fetch_fund_flow(self, date: str) -> Dict:
         """获取资金流向"""
@@ -145,7 +140,7 @@ class EnhancedMarketDataFetcher:
         
         try:
             # 北向资金
-            df = ak.stock_hsgt_north_net_flow_in_em(symbol="北上资金")
+            df = self.sources.fetch("north_flow", symbol="北上资金")
             row = df[df['日期'] == date]
             if not row.empty:
                 fund_flow['北向资金'] = {
@@ -153,55 +148,51 @@ class EnhancedMarketDataFetcher:
                     'unit': '亿元'
                 }
         except Exception as e:
-            logger.debug(f"获取北向资金失败: {e}")
+            logger.warning(f"获取北向资金失败: {e}")
         
         return fund_flow
     
     def fetch_top_sectors(self, date: str) -> List[Dict]:
-        """获取涨跌幅前10的板块"""
+        """获取涨跌幅前10的行业板块（板块快照只对应最近一个交易日，其他日期为空）"""
         sectors = []
         
         try:
-            # 获取板块行情
-            df = ak.stock_board_industry_name_em()
-            if not df.empty and len(df) > 0:
-                # 按涨跌幅排序，取前10
-                df_sorted = df.sort_values('涨跌幅', ascending=False).head(10)
-                for _, row in df_sorted.iterrows():
-                    sectors.append({
-                        'name': str(row['板块名称']),
-                        'change_pct': float(row['涨跌幅']),
-                        'lead_stock': str(row.get('领涨股票', 'N/A'))
-                    })
+            sectors = self.boards.top(date, 10)
         except Exception as e:
-            logger.debug(f"获取板块数据失败: {e}")
+            logger.warning(f"获取板块数据失败: {e}")
         
         return sectors
     
     def save_market_data(self, date: str, data: Dict):
-        """保存市场数据"""
-        filepath = self.raw_data_dir / f"market_data_{date}.json"
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        """保存单日市场数据到列式存储"""
+        self.market_store.append([data])
 
 
 def main():
     """主函数"""
-    # 从parsed_corpus.json读取所有日期
-    corpus_file = PROCESSED_DATA_DIR / "parsed_corpus.json"
+    arg_parser = argparse.ArgumentParser(description="增强版市场数据爬取")
+    arg_parser.add_argument("--concurrency", type=int, default=None,
+                            help="同时在途的请求数（默认取配置 FETCH_CONCURRENCY）")
+    arg_parser.add_argument("--refetch", action="store_true",
+                            help="重新获取已存储的日期（默认只获取缺失的交易日）")
+    args = arg_parser.parse_args()
     
-    if not corpus_file.exists():
+    # 从解析语料逐条读取所有日期
+    try:
+        dates = [item['date'] for item in iter_parsed_corpus()]
+    except FileNotFoundError:
         logger.error("请先运行 parse_corpus.py 解析语料")
         return
     
-    with open(corpus_file, 'r', encoding='utf-8') as f:
-        corpus_data = json.load(f)
-    
-    dates = [item['date'] for item in corpus_data]
-    logger.info(f"准备爬取 {len(dates)} 个日期的数据")
-    
     fetcher = EnhancedMarketDataFetcher()
-    fetcher.fetch_all_data_for_dates(dates)
+    plan = plan_fetch(dates, fetcher.market_store, refetch=args.refetch)
+    logger.info(f"需要 {len(set(dates))} 个日期: {describe_plan(plan)}")
+    if not plan["fetch"]:
+        logger.info("✅ 市场数据已是最新，无需获取")
+        return
+    
+    logger.info(f"准备爬取 {len(plan['fetch'])} 个日期的数据")
+    fetcher.fetch_all_data_for_dates(plan["fetch"], concurrency=args.concurrency)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,174 @@
+"""增量获取计划 - 按本地缓存的交易日历去掉周末和节假日，只获取存储中还没有的交易日"""
+import argparse
+import csv
+import sys
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+from loguru import logger
+
+# akshare是可选的，只有刷新交易日历时才需要
+try:
+    import akshare as ak
+    AKSHARE_AVAILABLE = True
+except ImportError:
+    AKSHARE_AVAILABLE = False
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import RAW_DATA_DIR, LOG_DIR
+from corpus_store import iter_parsed_corpus
+from fetch_engine import limited_call
+from market_store import MarketDataStore
+
+# 交易日历缓存（新浪历史交易日，包含当年剩余的交易日）
+TRADE_CALENDAR_FILE = RAW_DATA_DIR / "trade_calendar.csv"
+
+# 收盘后才获取当天的数据，避免把盘中数据当作当日结果存下来
+MARKET_CLOSE = "15:30"
+# 开盘前的实时快照仍是上一个交易日的收盘数据
+MARKET_OPEN = "09:30"
+
+
+class TradingCalendar:
+    """交易日历
+
+    缓存覆盖不到所需日期时联网刷新一次；无法刷新时，日历范围之外的日期按工作日判断。
+    """
+
+    def __init__(self, path: Path = TRADE_CALENDAR_FILE):
+        self.path = path
+        self._days = self._load()
+        self._day_set = set(self._days)
+        self._refreshed = False
+
+    def _load(self) -> List[str]:
+        if not self.path.exists():
+            return []
+        with open(self.path, 'r', encoding='utf-8', newline='') as f:
+            return sorted(row["trade_date"] for row in csv.DictReader(f))
+
+    def refresh(self) -> int:
+        """用akshare拉取交易日历并写入缓存，返回交易日数"""
+        if not AKSHARE_AVAILABLE:
+            raise ImportError("刷新交易日历需要 akshare: pip install akshare")
+        df = limited_call("akshare", ak.tool_trade_date_hist_sina)
+        days = sorted(pd.to_datetime(df["trade_date"]).dt.strftime("%Y-%m-%d"))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["trade_date"])
+            writer.writerows([day] for day in days)
+        tmp_path.replace(self.path)
+        self._days, self._day_set = days, set(days)
+        return len(days)
+
+    def covers(self, day: str) -> bool:
+        """日期是否在缓存的日历范围内"""
+        return bool(self._days) and self._days[0] <= day <= self._days[-1]
+
+    def ensure(self, until: str):
+        """缓存覆盖不到 until 时刷新（每次运行最多一次）"""
+        if self.covers(until) or self._refreshed:
+            return
+        self._refreshed = True
+        try:
+            count = self.refresh()
+            logger.info(f"交易日历已更新: {count} 个交易日")
+        except Exception as e:
+            logger.warning(f"更新交易日历失败，日历范围外按工作日判断: {e}")
+
+    def is_trading_day(self, day: str) -> bool:
+        if self.covers(day):
+            return day in self._day_set
+        return date.fromisoformat(day).weekday() < 5
+
+    def trading_days(self, start: str, end: str) -> List[str]:
+        """闭区间内的交易日"""
+        days = pd.date_range(start, end).strftime("%Y-%m-%d")
+        return [day for day in days if self.is_trading_day(day)]
+
+    def last_session(self, now: Optional[datetime] = None) -> str:
+        """now 时刻实时行情快照所属的交易日（已开盘的最近一个交易日）"""
+        now = now or datetime.now()
+        day = now.date()
+        if now.strftime("%H:%M") < MARKET_OPEN:
+            day -= timedelta(days=1)
+        self.ensure(day.isoformat())
+        while not self.is_trading_day(day.isoformat()):
+            day -= timedelta(days=1)
+        return day.isoformat()
+
+
+def plan_fetch(dates: Iterable[str], store: MarketDataStore,
+               calendar: Optional[TradingCalendar] = None,
+               refetch: bool = False, now: Optional[datetime] = None) -> Dict[str, List[str]]:
+    """把需要的日期分成 待获取/已存储/非交易日/未收盘 四类
+
+    已有指数行情和涨跌统计的日期视为已存储（refetch=True 时全部重新获取）；
+    晚于今天、或今天尚未收盘的日期留到以后。
+    """
+    dates = sorted(set(dates))
+    plan = {"fetch": [], "stored": [], "non_trading": [], "pending": []}
+    if not dates:
+        return plan
+
+    now = now or datetime.now()
+    today = now.strftime("%Y-%m-%d")
+    closed = now.strftime("%H:%M") >= MARKET_CLOSE
+
+    calendar = calendar or TradingCalendar()
+    calendar.ensure(min(dates[-1], today))
+    stored = set()
+    if not refetch:
+        # 涨跌统计缺失（个股日线不全时退回了快照）的日期不算已存储，下次重新获取
+        breadth = store.query("breadth", dates[0], dates[-1])
+        with_stats = set(breadth.loc[breadth["has_stats"].fillna(False).astype(bool), "date"]) \
+            if "has_stats" in breadth else set()
+        stored = set(store.query("indices", dates[0], dates[-1])["date"]) & with_stats
+
+    for day in dates:
+        if day > today or (day == today and not closed):
+            plan["pending"].append(day)
+        elif not calendar.is_trading_day(day):
+            plan["non_trading"].append(day)
+        elif day in stored:
+            plan["stored"].append(day)
+        else:
+            plan["fetch"].append(day)
+    return plan
+
+
+def describe_plan(plan: Dict[str, List[str]]) -> str:
+    """一行计划摘要"""
+    return (f"待获取 {len(plan['fetch'])} 天，已存储 {len(plan['stored'])} 天，"
+            f"非交易日 {len(plan['non_trading'])} 天，未收盘 {len(plan['pending'])} 天")
+
+
+def main():
+    """命令行：刷新交易日历，或查看语料日期的获取计划"""
+    logger.add(LOG_DIR / "fetch_planner.log", rotation="10 MB")
+    arg_parser = argparse.ArgumentParser(description="增量获取计划")
+    arg_parser.add_argument("--refresh", action="store_true", help="用akshare刷新交易日历")
+    args = arg_parser.parse_args()
+
+    calendar = TradingCalendar()
+    if args.refresh:
+        count = calendar.refresh()
+        logger.info(f"交易日历已更新: {TRADE_CALENDAR_FILE}（{count} 个交易日）")
+
+    try:
+        dates = [item['date'] for item in iter_parsed_corpus()]
+    except FileNotFoundError:
+        logger.error("请先运行 parse_corpus.py 解析语料")
+        return
+    plan = plan_fetch(dates, MarketDataStore(), calendar)
+    logger.info(describe_plan(plan))
+    for day in plan["fetch"]:
+        print(day)
+
+
+if __name__ == "__main__":
+    main()
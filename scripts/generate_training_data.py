@@ -3,9 +3,8 @@ import json
 import sys
 import re
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional, Tuple
 from loguru import logger
-import time
 from tqdm import tqdm
 
 # OpenAI是可选的，只有在使用GPT生成时才需要
@@ -17,38 +16,77 @@ except ImportError:
 
 sys.path.append(str(Path(__file__).parent.parent))
 from config import (
-    PROCESSED_DATA_DIR, RAW_DATA_DIR, TRAINING_DATA_DIR,
-    OPENAI_API_KEY, OPENAI_BASE_URL, TRAINING_CONFIG, LOG_DIR
+    RAW_DATA_DIR, OPENAI_API_KEY, OPENAI_BASE_URL, TRAINING_CONFIG, GENERATION_RETRY, LOG_DIR
 )
 
+from corpus_store import iter_parsed_corpus
+from dataset_writer import DatasetWriter
+from generation_engine import GenerationEngine
+from generation_journal import Entry, GenerationJournal, Unit
+from market_store import MarketDataStore
+from prompt_cache import PromptCache, prompt_key
+
 # 配置日志
 logger.add(LOG_DIR / "generate_training.log", rotation="10 MB")
 
+# 每天语料中生成训练样本的章节（样本按此顺序保存）
+SECTIONS = ['早自习', '主1', '主2']
+
+SYSTEM_PROMPT = "你是一个专业的金融数据标注专家，擅长将市场数据和专家分析转换为结构化的训练数据。"
+
 
 class TrainingDataGenerator:
     """训练数据生成器"""
     
-    def __init__(self):
-        if OPENAI_AVAILABLE and OPENAI_API_KEY:
-            self.client = OpenAI(
+    def __init__(self, client=None, concurrency: Optional[int] = None,
+                 prompt_cache: Optional[PromptCache] = None, journal: Optional[GenerationJournal] = None):
+        if client is None and OPENAI_AVAILABLE and OPENAI_API_KEY:
+            # 重试由 GenerationEngine 统一处理，这样429能反馈到并发控制
+            client = OpenAI(
                 api_key=OPENAI_API_KEY,
-                base_url=OPENAI_BASE_URL
+                base_url=OPENAI_BASE_URL,
+                max_retries=0,
+                timeout=GENERATION_RETRY["timeout"]
             )
-            self.model = TRAINING_CONFIG["model"]
-            self.temperature = TRAINING_CONFIG["temperature"]
-            self.max_tokens = TRAINING_CONFIG["max_tokens"]
-        else:
-            self.client = None
+        self.client = client
+        self.model = TRAINING_CONFIG["model"]
+        self.temperature = TRAINING_CONFIG["temperature"]
+        self.max_tokens = TRAINING_CONFIG["max_tokens"]
+        if self.client is None:
             logger.warning("OpenAI不可用，将使用简化方法生成训练数据")
+        self.engine = GenerationEngine(concurrency)
+        # 回复缓存只在调用API时用到
+        self.prompt_cache = prompt_cache or PromptCache(enabled=self.client is not None)
+        self.journal = journal or GenerationJournal()
+        # 日志里的章节是否都属于最近一次生成的语料（只生成部分语料时保留其他章节的进度）
+        self._journal_clearable = False
+        
+        self.market_store = MarketDataStore()
+        # 预加载的市场数据 {日期: 记录}，由 load_market_context 一次读入
+        self._market_context: Optional[Dict[str, Dict]] = None
         
     def load_parsed_corpus(self) -> List[Dict]:
         """加载解析后的语料"""
-        file_path = PROCESSED_DATA_DIR / "parsed_corpus.json"
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return list(self.iter_parsed_corpus())
+    
+    def iter_parsed_corpus(self) -> Iterator[Dict]:
+        """逐条读取解析后的语料（JSONL，兼容旧版 parsed_corpus.json）"""
+        return iter_parsed_corpus()
+    
+    def load_market_context(self, start: str = None, end: str = None) -> Dict[str, Dict]:
+        """一次读取日期区间内的全部市场数据，之后 load_market_data 直接查内存"""
+        self._market_context = self.market_store.load_range(start, end)
+        logger.info(f"加载了 {len(self._market_context)} 天的市场数据")
+        return self._market_context
     
     def load_market_data(self, date: str) -> Dict:
-        """加载市场数据"""
+        """加载市场数据（优先用预加载的结果，兼容旧版 market_data_{date}.json）"""
+        if self._market_context is not None and date in self._market_context:
+            return self._market_context[date]
+        if self._market_context is None:
+            data = self.market_store.get(date)
+            if data:
+                return data
         file_path = RAW_DATA_DIR / f"market_data_{date}.json"
         if file_path.exists():
             with open(file_path, 'r', encoding='utf-8') as f:
@@ -57,27 +95,47 @@ class TrainingDataGenerator:
     
     def generate_training_sample(self, corpus_item: Dict, market_data: Dict, section_name: str) -> List[Dict]:
         """生成单个训练样本"""
-        date = corpus_item['date']
+        return self._generate_section(corpus_item, market_data, section_name) or []
+    
+    def _section_request(self, corpus_item: Dict, market_data: Dict, section_name: str) -> Optional[Tuple[str, str]]:
+        """章节的 (prompt, 缓存键)；没有内容的章节为 None"""
         section_content = corpus_item['sections'].get(section_name, '')
-        
         if not section_content:
-            return []
+            return None
         
         # 构建prompt让GPT生成训练对
-        prompt = self._build_generation_prompt(date, section_name, section_content, market_data)
+        prompt = self._build_generation_prompt(corpus_item['date'], section_name, section_content, market_data)
+        return prompt, prompt_key(self.model, self.temperature, self.max_tokens, SYSTEM_PROMPT, prompt)
+    
+    def _generate_section(self, corpus_item: Dict, market_data: Dict, section_name: str,
+                          request: Optional[Tuple[str, str]] = None) -> Optional[List[Dict]]:
+        """生成一个章节的样本；请求或解析失败时为 None（没有内容的章节为空列表）"""
+        date = corpus_item['date']
+        if request is None:
+            request = self._section_request(corpus_item, market_data, section_name)
+            if request is None:
+                return []
+        prompt, cache_key = request
+        
+        # prompt 和模型参数都没变的章节直接用缓存的回复，不再请求
+        raw_text = self.prompt_cache.get(cache_key)
+        cached = raw_text is not None
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "你是一个专业的金融数据标注专家，擅长将市场数据和专家分析转换为结构化的训练数据。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=self.temperature,
-                max_tokens=self.max_tokens
-            )
+            if not cached:
+                response = self.engine.call(
+                    self.client.chat.completions.create,
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": SYSTEM_PROMPT},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens
+                )
+                raw_text = response.choices[0].message.content.strip()
             
-            result_text = response.choices[0].message.content.strip()
+            result_text = raw_text
             
             # 调试：打印API返回内容
             logger.debug(f"API返回内容前100字: {result_text[:100]}")
@@ -99,18 +157,21 @@ class TrainingDataGenerator:
             
             if not isinstance(training_samples, list):
                 logger.error(f"返回的不是数组: {type(training_samples)}")
-                return []
+                return None
             
-            logger.info(f"✓ 生成 {len(training_samples)} 个样本 ({date} - {section_name})")
+            # 只缓存能解析成样本的回复
+            if not cached:
+                self.prompt_cache.put(cache_key, raw_text, self.model)
+            logger.info(f"✓ {'缓存' if cached else '生成'} {len(training_samples)} 个样本 ({date} - {section_name})")
             return training_samples
             
         except json.JSONDecodeError as e:
             logger.error(f"JSON解析失败 ({date} - {section_name}): {e}")
             logger.error(f"返回内容: {result_text[:500]}")
-            return []
+            return None
         except Exception as e:
             logger.error(f"生成失败 ({date} - {section_name}): {e}")
-            return []
+            return None
     
     def _extract_market_context_from_content(self, content: str, date: str) -> str:
         """从语料内容中智能提取市场背景信息"""
@@ -244,10 +305,21 @@ class TrainingDataGenerator:
                 stats = overview['market_stats']
                 lines.append(f"\n**市场统计**: 上涨{stats.get('up_count', 'N/A')}家, "
                            f"下跌{stats.get('down_count', 'N/A')}家")
+                if 'limit_up' in stats:
+                    lines.append(f"涨停{stats['limit_up']}家, 跌停{stats.get('limit_down', 'N/A')}家")
+                if 'new_high' in stats:
+                    lines.append(f"创一年新高{stats['new_high']}家, 创一年新低{stats.get('new_low', 'N/A')}家")
             if 'turnover' in overview:
                 turnover = overview['turnover']
                 lines.append(f"**成交额**: {turnover.get('amount', 'N/A')}{turnover.get('unit', '')}")
         
+        # 语料提到的板块
+        if market_data.get('sectors'):
+            lines.append("\n**板块表现**:")
+            for sector, sector_data in market_data['sectors'].items():
+                lines.append(f"- {sector}（{sector_data.get('name', sector)}）: "
+                           f"涨跌幅{sector_data.get('change_pct', 'N/A')}%")
+        
         # 资金流向
         if 'fund_flow' in market_data and market_data['fund_flow']:
             lines.append("\n**资金流向**:")
@@ -256,84 +328,114 @@ class TrainingDataGenerator:
         
         return '\n'.join(lines) if lines else "暂无详细市场数据"
     
-    def generate_all_training_data(self) -> List[Dict]:
-        """生成所有训练数据"""
-        logger.info("开始生成训练数据（使用DeepSeek API）")
+    def iter_generated(self, corpus_data: List[Dict], done: Optional[Dict[Unit, Entry]] = None,
+                       journal: Optional[GenerationJournal] = None) -> Iterator[Tuple[Dict, str, List[Dict]]]:
+        """按语料顺序、章节顺序产出 (语料, 章节, 样本)
+
+        各章节的请求并发发出，产出顺序与完成顺序无关，同一份语料每次得到相同顺序的样本。
+        done 中 prompt 缓存键与本次一致的章节直接用记录的样本，键不同（解析器、prompt 模板或
+        市场数据变了）的重新生成；新完成的章节一完成就写入 journal（不等前面的章节）。
+        """
+        done = done or {}
+        tasks = [(corpus_item, section_name) for corpus_item in corpus_data for section_name in SECTIONS]
+        stale = []
+
+        def generate(task: Tuple[Dict, str]) -> Optional[List[Dict]]:
+            corpus_item, section_name = task
+            unit = (corpus_item['date'], section_name)
+            market_data = self.load_market_data(corpus_item['date'])
+            request = self._section_request(corpus_item, market_data, section_name)
+            key = request[1] if request else None
+            if unit in done:
+                done_key, done_samples = done[unit]
+                if done_key == key:
+                    return done_samples
+                stale.append(unit)
+            samples = self._generate_section(corpus_item, market_data, section_name, request) if request else []
+            # 失败的章节不记录，下次运行重试
+            if samples is not None and journal is not None:
+                journal.append(*unit, key, samples)
+            return samples
+
+        for (corpus_item, section_name), samples, error in self.engine.map(generate, tasks):
+            if error is not None:
+                logger.error(f"生成失败 ({corpus_item['date']} - {section_name}): {error}")
+            yield corpus_item, section_name, samples or []
+        if stale:
+            logger.info(f"生成日志中 {len(stale)} 个章节的 prompt 已变化，已重新生成")
+
+    def generate_all_training_data(self, writer: Optional[DatasetWriter] = None) -> List[Dict]:
+        """生成所有训练数据（中断后重新运行会跳过生成日志里 prompt 未变的章节）
+
+        传入 writer 时样本按顺序边生成边写入。生成日志不在这里删除，
+        数据集保存成功后由调用方调用 clear_journal。
+        """
+        logger.info(f"开始生成训练数据（使用DeepSeek API，并发 {self.engine.concurrency}）")
         
         # 加载解析后的语料
         corpus_data = self.load_parsed_corpus()
         logger.info(f"加载了 {len(corpus_data)} 个语料文件")
+        if corpus_data:
+            dates = [item['date'] for item in corpus_data]
+            self.load_market_context(min(dates), max(dates))
+        
+        units = {(item['date'], section_name) for item in corpus_data for section_name in SECTIONS}
+        done = self.journal.load()
+        resumed = len(units & set(done))
+        if resumed:
+            logger.info(f"生成日志中有 {resumed} 个已完成的章节，prompt 未变的直接复用")
         
         all_training_samples = []
-        total_sections = len(corpus_data) * 3  # 每天3个章节
         
         try:
             # 创建总进度条
-            with tqdm(total=total_sections, desc="🤖 DeepSeek生成训练数据", 
+            with tqdm(total=len(units), desc="🤖 DeepSeek生成训练数据", 
                       unit="章节", colour="green") as pbar:
                 
-                for idx, corpus_item in enumerate(corpus_data):
-                    date = corpus_item['date']
-                    
-                    # 尝试加载对应日期的市场数据（暂时跳过，使用语料信息）
-                    market_data = self.load_market_data(date)
-                    # if not market_data:
-                    #     logger.debug(f"{date} 没有市场数据，将使用语料中的信息")
+                for corpus_item, section_name, samples in self.iter_generated(corpus_data, done, self.journal):
+                    all_training_samples.extend(samples)
+                    if writer is not None:
+                        writer.write(samples)
                     
-                    # 为每个章节生成训练样本
-                    for section_name in ['早自习', '主1', '主2']:
-                        pbar.set_description(f"🤖 处理 {date} - {section_name}")
-                        
-                        samples = self.generate_training_sample(corpus_item, market_data, section_name)
-                        all_training_samples.extend(samples)
-                        
-                        pbar.update(1)
-                        pbar.set_postfix({"已生成样本": len(all_training_samples)})
-                        
-                        # 延迟避免API限流
-                        time.sleep(0.5)
-                    
-                    # 每处理5天保存一次（防止中断丢失）
-                    if (idx + 1) % 5 == 0:
-                        self.save_training_data(all_training_samples, "training_dataset_backup.json")
-                        logger.info(f"💾 已保存中间结果 ({idx+1}/{len(corpus_data)} 天)")
+                    pbar.set_description(f"🤖 处理 {corpus_item['date']} - {section_name}")
+                    pbar.update(1)
+                    pbar.set_postfix({"已生成样本": len(all_training_samples)})
         
         except KeyboardInterrupt:
-            logger.warning("⚠️ 检测到中断，保存已生成的数据...")
-            if all_training_samples:
-                self.save_training_data(all_training_samples, "training_dataset_interrupted.json")
-                logger.info(f"已保存 {len(all_training_samples)} 个样本到 training_dataset_interrupted.json")
+            logger.warning("⚠️ 检测到中断，已完成的章节都在生成日志中，重新运行会从中断处继续")
             raise
+        finally:
+            self.journal.close()
+        self._journal_clearable = set(done) <= units
         
+        stats = self.engine.stats()
+        logger.info(f"API请求 {stats['requests']} 次，重试 {stats['retried']} 次（限流 {stats['throttled']} 次），"
+                    f"峰值并发 {stats['peak']}")
+        cache_stats = self.prompt_cache.stats()
+        logger.info(f"回复缓存: 命中 {cache_stats['hits']}，未命中 {cache_stats['misses']}，"
+                    f"命中率 {cache_stats['hit_rate']:.0%}，共 {cache_stats['entries']} 条")
         logger.info(f"✅ 共生成 {len(all_training_samples)} 个训练样本")
         return all_training_samples
     
+    def clear_journal(self):
+        """数据集保存成功后删除生成日志（日志里有其他语料的章节时保留）"""
+        if self._journal_clearable:
+            self.journal.clear()
+            self._journal_clearable = False
+    
     def save_training_data(self, data: List[Dict], filename: str = "training_dataset.json"):
-        """保存训练数据"""
-        output_path = TRAINING_DATA_DIR / filename
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        
-        logger.info(f"训练数据已保存到: {output_path}")
-        
-        # 同时保存为jsonl格式（微调常用格式）
-        jsonl_path = TRAINING_DATA_DIR / filename.replace('.json', '.jsonl')
-        with open(jsonl_path, 'w', encoding='utf-8') as f:
-            for item in data:
-                f.write(json.dumps(item, ensure_ascii=False) + '\n')
-        
-        logger.info(f"JSONL格式已保存到: {jsonl_path}")
+        """保存训练数据（JSONL，同时生成JSON数组视图）"""
+        with DatasetWriter(Path(filename).stem) as writer:
+            writer.write(data)
     
     def generate_simple_training_data(self) -> List[Dict]:
         """生成简化版训练数据（不依赖GPT，直接从语料生成）"""
         logger.info("生成简化版训练数据（不使用API）")
         
-        corpus_data = self.load_parsed_corpus()
         all_samples = []
         
-        # 添加进度条
-        for corpus_item in tqdm(corpus_data, desc="📝 生成简化训练数据", 
+        # 添加进度条（逐条读取语料）
+        for corpus_item in tqdm(self.iter_parsed_corpus(), desc="📝 生成简化训练数据", 
                                 unit="文件", colour="blue"):
             date = corpus_item['date']
             sections = corpus_item['sections']
@@ -378,7 +480,9 @@ class TrainingDataGenerator:
 def main():
     """主函数"""
     import sys
-    generator = TrainingDataGenerator()
+    # --no-cache: 忽略已缓存的回复，全部重新请求
+    no_cache = '--no-cache' in sys.argv
+    generator = TrainingDataGenerator(prompt_cache=PromptCache(enabled=False) if no_cache else None)
     
     # 检查命令行参数
     use_gpt = '--use-gpt' in sys.argv or '-g' in sys.argv
@@ -390,12 +494,13 @@ def main():
     
     if use_gpt and OPENAI_AVAILABLE and OPENAI_API_KEY:
         logger.info("使用DeepSeek API生成高质量训练数据")
-        training_data = generator.generate_all_training_data()
+        with DatasetWriter() as writer:
+            generator.generate_all_training_data(writer)
+        generator.clear_journal()
     else:
         logger.info("使用简化版本生成训练数据（不调用API）")
         training_data = generator.generate_simple_training_data()
-    
-    generator.save_training_data(training_data)
+        generator.save_training_data(training_data)
     
     logger.info("训练数据生成完成！")
 
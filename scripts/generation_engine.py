@@ -0,0 +1,172 @@
+"""并发生成引擎 - 限制同时在途的LLM请求数，遇到429自适应降低并发并退避，结果按提交顺序返回"""
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+# openai是可选的，只用来识别连接错误、超时
+try:
+    import openai
+    OPENAI_AVAILABLE = True
+except ImportError:
+    OPENAI_AVAILABLE = False
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import GENERATION_CONCURRENCY, GENERATION_RETRY
+
+# 可重试的HTTP状态码：429 限流，5xx 服务端临时错误
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def _status(error: BaseException) -> Optional[int]:
+    return getattr(error, "status_code", None)
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """服务端在 Retry-After 头里给出的等待秒数（HTTP日期格式不处理）"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """限流、服务端临时错误、连接错误和超时可以重试，其他错误（如参数错误、鉴权失败）直接抛出"""
+    if _status(error) in RETRY_STATUS:
+        return True
+    return OPENAI_AVAILABLE and isinstance(error, openai.APIConnectionError)
+
+
+class AdaptiveConcurrency:
+    """自适应在途请求上限（加性增、乘性减）
+
+    最多 max_inflight 个请求同时在途。收到429时上限减半，并让所有新请求暂停到退避结束；
+    同一轮发出的请求一起收到429只减半一次。之后每连续成功 limit 次，上限加一，直到回到 max_inflight。
+    """
+
+    def __init__(self, max_inflight: int, min_inflight: int = 1):
+        self.max_inflight = max(1, max_inflight)
+        self.min_inflight = max(1, min(min_inflight, self.max_inflight))
+        self.limit = self.max_inflight
+        self.inflight = 0
+        self.peak = 0
+        self.throttled = 0
+        self._successes = 0
+        self._epoch = 0
+        self._resume_at = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> int:
+        """占用一个在途名额（暂停中或已满时等待），返回本次请求所属的轮次"""
+        with self._cond:
+            while True:
+                wait = self._resume_at - time.monotonic()
+                if wait <= 0 and self.inflight < self.limit:
+                    self.inflight += 1
+                    self.peak = max(self.peak, self.inflight)
+                    return self._epoch
+                self._cond.wait(wait if wait > 0 else None)
+
+    def release(self, ok: bool = True):
+        """归还名额；成功的请求累计到上限恢复"""
+        with self._cond:
+            self.inflight -= 1
+            if ok:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_inflight:
+                    self.limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+    def throttle(self, epoch: int, delay: float):
+        """epoch 轮发出的请求收到429：上限减半（每轮一次），delay 秒内不发新请求"""
+        with self._cond:
+            self.throttled += 1
+            if epoch == self._epoch:
+                self._epoch += 1
+                self.limit = max(self.min_inflight, self.limit // 2)
+                self._successes = 0
+            self._resume_at = max(self._resume_at, time.monotonic() + delay)
+            self._cond.notify_all()
+
+
+class GenerationEngine:
+    """LLM请求引擎
+
+    call 占用一个在途名额调用接口，429、5xx、连接错误按退避重试（优先用 Retry-After，
+    否则指数退避 + 随机抖动）；map 用线程池并发执行任务，按提交顺序产出结果。
+    """
+
+    def __init__(self, concurrency: Optional[int] = None, retries: int = GENERATION_RETRY["retries"],
+                 base_delay: float = GENERATION_RETRY["base_delay"],
+                 max_delay: float = GENERATION_RETRY["max_delay"]):
+        self.concurrency = max(1, concurrency or GENERATION_CONCURRENCY)
+        self.limiter = AdaptiveConcurrency(self.concurrency)
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.requests = 0
+        self.retried = 0
+        self._lock = threading.Lock()
+
+    def _delay(self, error: BaseException, attempt: int) -> float:
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, func: Callable, *args, **kwargs) -> Any:
+        """调用一次接口，可重试的错误最多重试 retries 次"""
+        for attempt in range(self.retries + 1):
+            epoch = self.limiter.acquire()
+            with self._lock:
+                self.requests += 1
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self.limiter.release(ok=False)
+                if attempt >= self.retries or not is_retryable(e):
+                    raise
+                with self._lock:
+                    self.retried += 1
+                delay = self._delay(e, attempt)
+                if _status(e) == 429:
+                    # 限流影响所有请求：降低并发并整体暂停，本线程在下一次 acquire 时等待
+                    self.limiter.throttle(epoch, delay)
+                else:
+                    time.sleep(delay)
+                continue
+            self.limiter.release(ok=True)
+            return result
+
+    def map(self, func: Callable, items: Iterable) -> Iterator[Tuple[Any, Any, Optional[BaseException]]]:
+        """并发执行 func(item)，按 items 的顺序产出 (item, 结果, 异常)
+
+        线程数等于最大并发数，实际同时在途的请求数由 call 的自适应上限控制；
+        提前停止迭代（如中断）时取消还没开始的任务。
+        """
+        items = list(items)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = [pool.submit(func, item) for item in items]
+            try:
+                for item, future in zip(items, futures):
+                    error = future.exception()
+                    yield item, None if error else future.result(), error
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def stats(self) -> Dict:
+        """请求数、重试数、429次数、当前和峰值在途上限"""
+        return {
+            "requests": self.requests,
+            "retried": self.retried,
+            "throttled": self.limiter.throttled,
+            "limit": self.limiter.limit,
+            "peak": self.limiter.peak,
+        }
@@ -0,0 +1,108 @@
+"""生成日志 - 每完成一个 (日期, 章节) 追加一行JSONL，分批fsync，重启后跳过日志里 prompt 未变的章节"""
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import TRAINING_DATA_DIR, GENERATION_JOURNAL_SYNC
+
+GENERATION_JOURNAL_FILE = TRAINING_DATA_DIR / "generation_journal.jsonl"
+
+# 生成单元：(日期, 章节)
+Unit = Tuple[str, str]
+# 日志条目：(prompt 缓存键, 样本)；没有内容的章节键为 None
+Entry = Tuple[Optional[str], List[Dict]]
+
+
+class GenerationJournal:
+    """追加写的生成日志
+
+    每行一条 {"date", "section", "key", "samples"}，key 是生成该章节时的 prompt 缓存键，
+    解析器、prompt 模板或市场数据变化后键随之变化，调用方据此判断记录是否过期。
+    每条写入后立即刷到操作系统，进程被杀（kill -9）也不会丢；fsync 按 records 条或
+    seconds 秒一批，断电最多丢最近一批。
+    读取时丢弃崩溃时写了一半的末行。只在数据集保存成功之后才 clear 删除日志，
+    保存失败时重新运行仍能从日志恢复全部章节。
+    """
+
+    def __init__(self, path: Path = GENERATION_JOURNAL_FILE,
+                 sync_records: int = GENERATION_JOURNAL_SYNC["records"],
+                 sync_seconds: float = GENERATION_JOURNAL_SYNC["seconds"]):
+        self.path = path
+        self.sync_records = sync_records
+        self.sync_seconds = sync_seconds
+        self._file = None
+        self._pending = 0
+        self._synced_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[Unit, Entry]:
+        """已完成的生成单元 -> (键, 样本)；同一单元出现多次时以最后一次为准
+
+        旧格式的条目没有 key，读出为 None，有内容的章节会被当作过期重新生成。
+        """
+        done: Dict[Unit, Entry] = {}
+        if not self.path.exists():
+            return done
+        valid_bytes = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                done[(record["date"], record["section"])] = (record.get("key"), record["samples"])
+                valid_bytes += len(line)
+        size = self.path.stat().st_size
+        if valid_bytes < size:
+            # 截掉损坏的末行，之后的追加从完整的行尾开始
+            logger.warning(f"生成日志末尾有 {size - valid_bytes} 字节不完整，已截断")
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid_bytes)
+        return done
+
+    def append(self, date: str, section: str, key: Optional[str], samples: List[Dict]):
+        """记录一个完成的生成单元及其 prompt 缓存键（线程安全）"""
+        line = json.dumps({"date": date, "section": section, "key": key, "samples": samples},
+                          ensure_ascii=False) + '\n'
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(line)
+            self._file.flush()
+            self._pending += 1
+            if self._pending >= self.sync_records or time.monotonic() - self._synced_at >= self.sync_seconds:
+                self._sync()
+
+    def _sync(self):
+        """fsync 已写入的记录（调用方持有锁）"""
+        if self._file is not None and self._pending:
+            os.fsync(self._file.fileno())
+        self._pending = 0
+        self._synced_at = time.monotonic()
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
+
+    def clear(self):
+        """数据集保存成功后删除日志"""
+        self.close()
+        self.path.unlink(missing_ok=True)
+
@@ -0,0 +1,137 @@
+"""指数历史行情缓存 - 每个指数每次运行最多下载一次，落盘后按日期O(1)查询，之后只补最新缺失的交易日"""
+import math
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+import akshare as ak
+import pandas as pd
+from loguru import logger
+
+# pyarrow是可选的，没有时退回pickle存储
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import RAW_DATA_DIR
+from fetch_engine import limited_call
+
+# 指数名称 -> 行情代码
+INDEX_SYMBOLS = {
+    "上证指数": "sh000001",
+    "深证成指": "sz399001",
+    "创业板指": "sz399006",
+}
+
+# 缓存目录：每个指数一个文件
+INDEX_HISTORY_DIR = RAW_DATA_DIR / "index_history"
+
+COLUMNS = ["open", "high", "low", "close", "volume"]
+
+
+def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+    """统一为以 YYYY-MM-DD 字符串为索引、按日期排序的 OHLCV 表"""
+    if df is None or df.empty:
+        return pd.DataFrame(columns=COLUMNS, index=pd.Index([], name="date"), dtype=float)
+    df = df.copy()
+    df["date"] = pd.to_datetime(df["date"]).dt.strftime("%Y-%m-%d")
+    df = df.set_index("date")[COLUMNS].astype(float)
+    return df[~df.index.duplicated(keep="last")].sort_index()
+
+
+class IndexHistoryCache:
+    """指数日线缓存
+
+    首次使用时下载全部历史（新浪），之后只用东方财富日线接口补上最后缓存日
+    之后的数据。补数从最后一个缓存日开始，用重叠的那一天校验收盘价并对齐
+    两个数据源的成交量单位，对不上时重新下载全部历史。
+    """
+
+    def __init__(self, cache_dir: Path = INDEX_HISTORY_DIR):
+        self.cache_dir = cache_dir
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._frames: Dict[str, pd.DataFrame] = {}
+        # 本次运行已经联网更新过的指数
+        self._refreshed = set()
+        # 并发获取时多个线程可能同时请求同一指数
+        self._lock = threading.Lock()
+
+    def _path(self, symbol: str) -> Path:
+        return self.cache_dir / (f"{symbol}.parquet" if PARQUET_AVAILABLE else f"{symbol}.pkl")
+
+    def _load(self, symbol: str) -> pd.DataFrame:
+        path = self._path(symbol)
+        if path.exists():
+            try:
+                return pd.read_parquet(path) if PARQUET_AVAILABLE else pd.read_pickle(path)
+            except Exception as e:
+                logger.warning(f"指数缓存损坏，重新下载 {symbol}: {e}")
+        return _normalize(None)
+
+    def _save(self, symbol: str, df: pd.DataFrame):
+        path = self._path(symbol)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        if PARQUET_AVAILABLE:
+            df.to_parquet(tmp_path)
+        else:
+            df.to_pickle(tmp_path)
+        tmp_path.replace(path)
+
+    def _fetch_full(self, symbol: str) -> pd.DataFrame:
+        logger.info(f"下载 {symbol} 全部历史行情")
+        return _normalize(limited_call("akshare", ak.stock_zh_index_daily, symbol=symbol))
+
+    def _fetch_tail(self, symbol: str, cached: pd.DataFrame) -> pd.DataFrame:
+        """补最后缓存日（含）之后的数据，返回合并后的表"""
+        last = cached.index[-1]
+        logger.info(f"补充 {symbol} {last} 之后的行情")
+        tail = _normalize(limited_call(
+            "akshare", ak.stock_zh_index_daily_em, symbol=symbol, start_date=last.replace('-', ''),
+            end_date=datetime.now().strftime("%Y%m%d")))
+        if tail.empty:
+            return cached
+        if last not in tail.index:
+            return self._fetch_full(symbol)
+
+        overlap_old, overlap_new = cached.loc[last], tail.loc[last]
+        if abs(overlap_new["close"] - overlap_old["close"]) > abs(overlap_old["close"]) * 1e-4:
+            logger.warning(f"{symbol} 补数与缓存在 {last} 不一致，重新下载全部历史")
+            return self._fetch_full(symbol)
+        if overlap_new["volume"] > 0:
+            # 两个数据源的成交量单位可能不同（股/手），按重叠日换算到缓存的单位
+            scale = overlap_old["volume"] / overlap_new["volume"]
+            if scale > 0:
+                tail["volume"] *= 10 ** round(math.log10(scale))
+        # 重叠日以新数据为准（上次可能缓存了盘中数据）
+        return pd.concat([cached.drop(index=last), tail]).sort_index()
+
+    def history(self, symbol: str, until: Optional[str] = None) -> pd.DataFrame:
+        """返回指数日线；until 晚于缓存最后一天时联网补数（每次运行每个指数最多一次）"""
+        with self._lock:
+            df = self._frames.get(symbol)
+            if df is None:
+                df = self._load(symbol)
+
+            needs_fetch = df.empty or (until is not None and until > df.index[-1])
+            if needs_fetch and symbol not in self._refreshed:
+                self._refreshed.add(symbol)
+                try:
+                    df = self._fetch_full(symbol) if df.empty else self._fetch_tail(symbol, df)
+                    self._save(symbol, df)
+                except Exception as e:
+                    logger.warning(f"更新 {symbol} 行情失败，使用已有缓存: {e}")
+
+            self._frames[symbol] = df
+            return df
+
+    def row(self, symbol: str, date: str) -> Optional[pd.Series]:
+        """指定日期的一行行情（非交易日或没有数据时返回 None）"""
+        df = self.history(symbol, until=date)
+        if date in df.index:
+            return df.loc[date]
+        return None
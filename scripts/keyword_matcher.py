@@ -0,0 +1,106 @@
+"""多模式关键词匹配 - Aho-Corasick自动机，一次扫描找出所有关键词及其位置"""
+import json
+import re
+from pathlib import Path
+from typing import Dict, List, Union
+
+
+def load_keywords(file_path: Path) -> Dict[str, List[str]]:
+    """加载关键词配置：{类别: [关键词, ...]}"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        keywords = json.load(f)
+    return {category: list(dict.fromkeys(words)) for category, words in keywords.items()}
+
+
+class KeywordMatcher:
+    """分类关键词自动机
+
+    构建一次后可反复调用 scan，扫描时间只与文本长度和命中数有关，
+    与关键词数量无关。重叠命中全部保留（如「固态电池」同时命中「电池」）。
+    """
+
+    def __init__(self, keywords: Dict[str, List[str]]):
+        self.categories = list(keywords)
+        # 关键词 -> 所属类别（同一个词可以属于多个类别）
+        self.keyword_categories: Dict[str, List[str]] = {}
+        for category, words in keywords.items():
+            for word in words:
+                if word:
+                    self.keyword_categories.setdefault(word, []).append(category)
+
+        self._build_automaton()
+
+    def _build_automaton(self):
+        """构建goto/fail/output表"""
+        goto: List[Dict[str, int]] = [{}]
+        output: List[List[str]] = [[]]
+        for word in self.keyword_categories:
+            state = 0
+            for ch in word:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    output.append([])
+                state = nxt
+            output[state].append(word)
+
+        # 按BFS顺序计算失败指针，并把失败状态的输出合并进来
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                output[nxt] = output[nxt] + output[fail[nxt]]
+
+        self._goto = goto
+        self._fail = fail
+        self._output = output
+        # 不在任何关键词里的字符会把自动机打回根状态，只需扫描由关键词字符组成、
+        # 且不短于最短关键词的连续片段，其余部分交给正则在C层跳过
+        alphabet = {ch for word in self.keyword_categories for ch in word}
+        min_len = min(map(len, self.keyword_categories), default=0)
+        self._run_re = (re.compile('[' + ''.join(re.escape(ch) for ch in sorted(alphabet)) + ']'
+                                   + f'{{{min_len},}}')
+                        if alphabet else None)
+
+    def _iter_matches(self, text: str):
+        """产出所有命中 (起始位置, 关键词)，按结束位置排序"""
+        if self._run_re is None:
+            return
+        goto, fail, output = self._goto, self._fail, self._output
+        for run in self._run_re.finditer(text):
+            base = run.start()
+            state = 0
+            for i, ch in enumerate(run.group()):
+                while True:
+                    nxt = goto[state].get(ch)
+                    if nxt is not None:
+                        state = nxt
+                        break
+                    if not state:
+                        break
+                    state = fail[state]
+                for word in output[state]:
+                    yield base + i - len(word) + 1, word
+
+    def scan(self, text: str, positions: bool = False) -> Dict[str, Dict[str, Union[int, List[int]]]]:
+        """扫描文本，返回 {类别: {关键词: 命中次数}}；positions 为真时返回 {类别: {关键词: [起始位置, ...]}}"""
+        found: Dict[str, Union[int, List[int]]] = {}
+        if positions:
+            for start, word in self._iter_matches(text):
+                found.setdefault(word, []).append(start)
+        else:
+            for _, word in self._iter_matches(text):
+                found[word] = found.get(word, 0) + 1
+
+        hits: Dict[str, Dict[str, Union[int, List[int]]]] = {category: {} for category in self.categories}
+        for word, value in found.items():
+            for category in self.keyword_categories[word]:
+                hits[category][word] = value
+        return hits
@@ -0,0 +1,259 @@
+"""市场宽度统计 - 对全市场涨跌幅做一次向量化计算：涨跌家数、按板块涨跌停、涨跌幅分位数、创新高/新低
+
+实时快照只对应最近一个交易日；历史日期由个股日线库的 (股票 × 交易日) 面板一次算出。
+"""
+import sys
+import threading
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import BREADTH_HIGH_LOW_WINDOW
+from fetch_planner import TradingCalendar, MARKET_CLOSE
+from stock_history import StockHistoryStore
+
+# 各板块涨跌幅限制
+LIMIT_MAIN = 0.10      # 沪深主板
+LIMIT_GROWTH = 0.20    # 创业板（300/301）、科创板（688/689）
+LIMIT_BSE = 0.30       # 北交所（4/8/92 开头）
+LIMIT_ST = 0.05        # 主板 ST / *ST
+
+# 没有价格时按涨跌幅判断涨跌停的容差（百分点），覆盖到分的四舍五入误差
+PCT_TOLERANCE = 0.15
+
+PERCENTILES = [5, 25, 50, 75, 95]
+
+# 新股上市后不设涨跌幅限制的交易日数（注册制为前5日，主板首日）
+LISTING_DAYS = 5
+
+
+def board_limits(codes: pd.Series, names: Optional[pd.Series] = None) -> np.ndarray:
+    """每只股票的涨跌幅限制（比例）；上市初期不设涨跌幅限制的新股为 NaN"""
+    codes = codes.astype(str).str.zfill(6)
+    limits = np.full(len(codes), LIMIT_MAIN)
+    limits[codes.str.match(r'^(30[01]|68[89])').to_numpy()] = LIMIT_GROWTH
+    limits[codes.str.match(r'^(4|8|92)').to_numpy()] = LIMIT_BSE
+    if names is not None:
+        names = names.astype(str)
+        # ST 只在主板收窄到 5%，创业板、科创板的 ST 仍是 20%
+        st = names.str.contains('ST', regex=False).to_numpy() & (limits == LIMIT_MAIN)
+        limits[st] = LIMIT_ST
+        # N/C 开头：新股上市首日 / 注册制新股前5日，不设涨跌幅限制
+        limits[names.str.match(r'^[NC]').to_numpy()] = np.nan
+    return limits
+
+
+def limit_hits(pct: np.ndarray, limits: np.ndarray,
+               close: Optional[np.ndarray] = None, prev_close: Optional[np.ndarray] = None):
+    """涨停、跌停的布尔数组
+
+    有昨收和现价时按交易所规则算出涨跌停价（四舍五入到分）精确比较，否则按涨跌幅加容差判断。
+    """
+    with np.errstate(invalid='ignore'):
+        if close is not None and prev_close is not None:
+            up_price = np.round(prev_close * (1 + limits) + 1e-9, 2)
+            down_price = np.round(prev_close * (1 - limits) + 1e-9, 2)
+            return close >= up_price - 1e-9, close <= down_price + 1e-9
+        threshold = limits * 100 - PCT_TOLERANCE
+        return pct >= threshold, pct <= -threshold
+
+
+def spot_breadth(df: pd.DataFrame) -> Dict:
+    """实时行情快照 -> 涨跌统计（停牌、无涨跌幅的股票不计入涨跌家数）"""
+    pct = pd.to_numeric(df['涨跌幅'], errors='coerce').to_numpy(dtype=float)
+    valid = ~np.isnan(pct)
+    limits = board_limits(df['代码'], df['名称'] if '名称' in df else None)
+
+    close = prev_close = None
+    if '最新价' in df and '昨收' in df:
+        close = pd.to_numeric(df['最新价'], errors='coerce').to_numpy(dtype=float)
+        prev_close = pd.to_numeric(df['昨收'], errors='coerce').to_numpy(dtype=float)
+    up_hit, down_hit = limit_hits(pct, limits, close, prev_close)
+
+    stats = {
+        'up_count': int(np.count_nonzero(pct > 0)),
+        'down_count': int(np.count_nonzero(pct < 0)),
+        'flat_count': int(np.count_nonzero(pct == 0)),
+        'limit_up': int(np.count_nonzero(up_hit & valid)),
+        'limit_down': int(np.count_nonzero(down_hit & valid)),
+        'suspended': int(np.count_nonzero(~valid)),
+        'total': int(np.count_nonzero(valid)),
+    }
+    if valid.any():
+        values = pct[valid]
+        # 与 history_breadth 一样用 numpy 取整，两条路径的结果逐位一致
+        for q, value in zip(PERCENTILES, np.percentile(values, PERCENTILES).round(2)):
+            stats[f'pct_p{q}'] = float(value)
+        stats['pct_mean'] = float(values.mean().round(2))
+    return stats
+
+
+
+
+def prior_extreme(values: np.ndarray, window: int, ufunc) -> np.ndarray:
+    """每行每个位置之前 window 列（不含当列）的最大/最小值，不足 window 列或窗口内有 NaN 时为 NaN
+
+    van Herk/Gil-Werman：按 window 分块做块内前缀、后缀累积，任意窗口由前一块的后缀和
+    后一块的前缀拼成，整个二维数组只需三次扫描，与窗口长度无关。
+    """
+    n_rows, n_cols = values.shape
+    result = np.full(values.shape, np.nan)
+    if n_cols <= window:
+        return result
+    n_blocks = -(-n_cols // window)
+    padded = np.full((n_rows, n_blocks * window), np.nan)
+    padded[:, :n_cols] = values
+    blocks = padded.reshape(n_rows, n_blocks, window)
+    prefix = ufunc.accumulate(blocks, axis=2).reshape(n_rows, -1)
+    suffix = ufunc.accumulate(blocks[:, :, ::-1], axis=2)[:, :, ::-1].reshape(n_rows, -1)
+    # 从第 i 列开始的窗口 [i, i + window - 1]，作为第 i + window 列的回看窗口
+    result[:, window:] = ufunc(suffix[:, :n_cols - window], prefix[:, window - 1:n_cols - 1])
+    return result
+
+
+def history_breadth(panel: Dict[str, np.ndarray], start: str,
+                    window: int = BREADTH_HIGH_LOW_WINDOW) -> Dict[str, Dict]:
+    """(股票 × 交易日) 面板 -> {日期: 涨跌统计}
+
+    start 之前的列只作为回看窗口。创新高/新低按涨跌幅累乘的复权价与此前 window 个交易日比较，
+    上市不满 window 个交易日的股票不参与；面板中途才出现的股票视为新股，前 LISTING_DAYS 天不计涨跌停。
+    """
+    dates = panel["dates"]
+    pct, close, prev_close = panel["pct"], panel["close"], panel["prev_close"]
+    valid = ~np.isnan(pct)
+    listed = np.cumsum(valid, axis=1)
+
+    base = board_limits(pd.Series(panel["codes"]))[:, None]
+    limits = np.where((panel["st"] > 0) & (base == LIMIT_MAIN), LIMIT_ST, base)
+    new_listing = (valid.argmax(axis=1) > 0)[:, None] & (listed <= LISTING_DAYS)
+    limits = np.where(new_listing, np.nan, limits)
+    up_hit, down_hit = limit_hits(pct, limits, close, prev_close)
+
+    # 复权价：除权除息日的涨跌幅已按除权参考价计算，累乘不会出现假的新低；上市前为 NaN
+    adjusted = np.cumprod(1 + np.nan_to_num(pct) / 100, axis=1)
+    adjusted[listed == 0] = np.nan
+    prior_high = prior_extreme(adjusted, window, np.maximum)
+    prior_low = prior_extreme(adjusted, window, np.minimum)
+    with np.errstate(invalid='ignore'):
+        new_high = valid & (adjusted > prior_high)
+        new_low = valid & (adjusted < prior_low)
+
+    cols = np.flatnonzero(dates >= start)
+    if not len(cols):
+        return {}
+    pct, valid = pct[:, cols], valid[:, cols]
+    counts = {
+        'up_count': (pct > 0).sum(axis=0),
+        'down_count': (pct < 0).sum(axis=0),
+        'flat_count': (pct == 0).sum(axis=0),
+        'limit_up': (up_hit[:, cols] & valid).sum(axis=0),
+        'limit_down': (down_hit[:, cols] & valid).sum(axis=0),
+        'new_high': new_high[:, cols].sum(axis=0),
+        'new_low': new_low[:, cols].sum(axis=0),
+        'suspended': ((listed[:, cols] > 0) & ~valid).sum(axis=0),
+        'total': valid.sum(axis=0),
+    }
+    percentiles = np.nanpercentile(pct, PERCENTILES, axis=0).round(2)
+    means = np.nanmean(pct, axis=0).round(2)
+
+    results = {}
+    for j, day in enumerate(dates[cols]):
+        stats = {key: int(values[j]) for key, values in counts.items()}
+        for q, values in zip(PERCENTILES, percentiles):
+            stats[f'pct_p{q}'] = float(values[j])
+        stats['pct_mean'] = float(means[j])
+        results[day] = stats
+    return results
+
+
+class SpotSnapshot:
+    """每次运行共享的一份全市场实时快照
+
+    快照只反映最近一个交易日（date），final 表示该交易日已收盘。并发调用时只请求一次，
+    失败也不重试（本次运行内视为没有快照）。now 为快照时刻，默认取第一次使用时的当前时间。
+    """
+
+    def __init__(self, sources, calendar: Optional[TradingCalendar] = None,
+                 now: Optional[datetime] = None):
+        self.sources = sources
+        self.calendar = calendar
+        self.now = now
+        self.date: Optional[str] = None
+        self.final = False
+        self._frame: Optional[pd.DataFrame] = None
+        self._stats: Optional[Dict] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def frame(self) -> Optional[pd.DataFrame]:
+        """快照行情，获取失败时为 None"""
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                try:
+                    now = self.now or datetime.now()
+                    self.date = (self.calendar or TradingCalendar()).last_session(now)
+                    self.final = self.date < now.strftime("%Y-%m-%d") or now.strftime("%H:%M") >= MARKET_CLOSE
+                    self._frame = self.sources.fetch("spot")
+                except Exception as e:
+                    logger.warning(f"获取实时行情快照失败: {e}")
+            return self._frame
+
+    def stats(self) -> Dict:
+        """快照的涨跌统计，获取失败时为空"""
+        frame = self.frame()
+        with self._lock:
+            if self._stats is None:
+                self._stats = spot_breadth(frame) if frame is not None else {}
+            return self._stats
+
+    def stats_for(self, date: str) -> Dict:
+        """date 的涨跌统计：只有快照所属的交易日才有"""
+        stats = self.stats()
+        return dict(stats) if stats and date == self.date else {}
+
+
+class BreadthEngine:
+    """按日期提供涨跌统计
+
+    先把个股日线库更新到覆盖所需区间（含新高新低的回看窗口），再对整个区间做一次面板计算；
+    日线库里没有的日期（如日线库更新失败）退回实时快照。结果在本次运行内复用。
+    """
+
+    def __init__(self, sources, store: Optional[StockHistoryStore] = None,
+                 snapshot: Optional[SpotSnapshot] = None, calendar: Optional[TradingCalendar] = None,
+                 window: int = BREADTH_HIGH_LOW_WINDOW):
+        self.sources = sources
+        self.calendar = calendar or TradingCalendar()
+        self.store = store or StockHistoryStore()
+        self.snapshot = snapshot or SpotSnapshot(sources, self.calendar)
+        self.window = window
+        self._stats: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def prepare(self, dates: Iterable[str]):
+        """更新日线库并一次算出 dates 的涨跌统计"""
+        with self._lock:
+            dates = sorted(set(dates) - set(self._stats))
+            if not dates:
+                return
+            # 回看窗口按自然日放宽，保证覆盖 window 个交易日
+            lookback = (date.fromisoformat(dates[0]) - timedelta(days=self.window * 3 // 2 + 15)).isoformat()
+            stats = {}
+            try:
+                self.store.update(self.sources, lookback, dates[-1], self.calendar, self.snapshot)
+                stats = history_breadth(self.store.panel(lookback, dates[-1]), dates[0], self.window)
+            except Exception as e:
+                logger.warning(f"计算历史涨跌统计失败，退回实时快照: {e}")
+            for day in dates:
+                self._stats[day] = stats.get(day) or self.snapshot.stats_for(day)
+
+    def stats_for(self, date: str) -> Dict:
+        """单个日期的涨跌统计（没有 prepare 过的日期单独计算一次）"""
+        self.prepare([date])
+        return dict(self._stats.get(date, {}))
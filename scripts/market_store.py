@@ -0,0 +1,465 @@
+"""列式市场数据存储 - 指数、涨跌统计、资金流向、板块分表按年分区存放，按日期区间一次读取"""
+import argparse
+import json
+import sys
+import time
+from itertools import repeat
+from operator import itemgetter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+# pyarrow是可选的，没有时退回pickle分片（不支持内存映射读取）
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import RAW_DATA_DIR, LOG_DIR
+
+# 存储目录：{表}/{年}/part-{批次}.parquet
+MARKET_STORE_DIR = RAW_DATA_DIR / "market_store"
+
+# meta 记录每个日期的最新批次、记录的顶层字段和获取时间，其他表按它去重
+TABLES = ["meta", "indices", "breadth", "fund_flow", "sectors"]
+
+# 同一年份的分片超过这个数时 append 顺带合并（合并要重写整年，不能每次追加都做）；
+# 一次获取结束时再调用 compact 把每张表每年合并成一个分片
+COMPACT_PARTS = 32
+
+# 这些列在重建记录时还原为整数（缺失值会让它们在列式存储中变成浮点）
+INT_COLUMNS = {"up_count", "down_count", "flat_count", "limit_up", "limit_down",
+               "new_high", "new_low", "suspended", "total", "total_count", "rank"}
+
+
+# 一张表按列转换后的结果：{列: Python值列表}，{有缺失值的列: 缺失掩码}
+Columns = Tuple[Dict[str, list], Dict[str, np.ndarray]]
+
+
+def _frame_columns(df: pd.DataFrame) -> Columns:
+    """DataFrame -> 列（整数列还原为 int，缺失位置的值不使用）"""
+    values, missing = {}, {}
+    for column in df.columns:
+        series = df[column]
+        mask = series.isna().to_numpy()
+        if mask.any():
+            missing[column] = mask
+            if column in INT_COLUMNS:
+                series = series.fillna(0)
+        if column in INT_COLUMNS and series.dtype != np.int64:
+            series = series.astype(np.int64)
+        values[column] = series.tolist()
+    return values, missing
+
+
+def _table_columns(table: "pa.Table") -> Columns:
+    """Arrow 表 -> 列（直接转成 Python 值，不经过 pandas）
+
+    字符串列先字典编码，每个不同的字符串只转换一次，按编码取值（重复的字符串共用同一个对象）；
+    没有缺失值的数值列经 numpy 转换。
+    """
+    values, missing = {}, {}
+    for column in table.column_names:
+        array = table.column(column)
+        if array.null_count:
+            missing[column] = array.is_null().to_numpy(zero_copy_only=False)
+        if column in INT_COLUMNS and pa.types.is_floating(array.type):
+            array = pc.cast(array, pa.int64(), safe=False)
+        if pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+            encoded = array.combine_chunks().dictionary_encode()
+            if len(encoded.dictionary):
+                strings = np.asarray(encoded.dictionary.to_pylist(), dtype=object)
+                values[column] = strings.take(encoded.indices.fill_null(0).to_numpy(zero_copy_only=False)).tolist()
+            else:
+                values[column] = [None] * len(array)
+        elif not array.null_count and (pa.types.is_integer(array.type) or pa.types.is_floating(array.type)
+                                       or pa.types.is_boolean(array.type)):
+            values[column] = array.to_numpy().tolist()
+        else:
+            values[column] = array.to_pylist()
+    return values, missing
+
+
+def _take(columns: Columns, index: List[int]) -> Columns:
+    """按行号取出部分行"""
+    values, missing = columns
+    if len(index) <= 1:
+        return ({column: [col[i] for i in index] for column, col in values.items()},
+                {column: mask[index] for column, mask in missing.items()})
+    getter = itemgetter(*index)
+    return ({column: list(getter(col)) for column, col in values.items()},
+            {column: mask[index] for column, mask in missing.items()})
+
+
+def _records(columns: Columns, names: List[str]) -> List[Dict]:
+    """列 -> 行字典（只含 names 列，去掉缺失值）
+
+    按列转换，不逐行检查缺失值：按缺失值的分布把行分组，每组只取有值的列 zip 成字典。
+    """
+    values, missing = columns
+    size = len(values["date"])
+    if not size:
+        return []
+    nullable = [name for name in names if name in missing]
+    if not names:
+        return [{} for _ in range(size)]
+    if not nullable:
+        return list(map(dict, map(zip, repeat(names), zip(*(values[name] for name in names)))))
+
+    # 同一缺失列组合的行一起转换
+    patterns, group = np.unique(np.column_stack([missing[name] for name in nullable]),
+                                axis=0, return_inverse=True)
+    group = group.reshape(-1)
+    rows: List[Optional[Dict]] = [None] * size
+    for g, pattern in enumerate(patterns):
+        index = np.flatnonzero(group == g).tolist()
+        absent = {name for name, flag in zip(nullable, pattern) if flag}
+        keys = [name for name in names if name not in absent]
+        if not keys:
+            for position in index:
+                rows[position] = {}
+            continue
+        part = _take(({key: values[key] for key in keys}, {}), index)[0]
+        for position, row in zip(index, map(dict, map(zip, repeat(keys), zip(*part.values())))):
+            rows[position] = row
+    return rows
+
+
+def _by_date(columns: Columns, key: Optional[str] = None, exclude: Iterable[str] = ()) -> Dict[str, object]:
+    """按日期分桶：{日期: [行]}，给出 key 时为 {日期: {key列的值: 行}}
+
+    行中不含 date、key 和 exclude 列。同一日期的行须是连续的一段，按段切片，不逐行分桶。
+    """
+    values = columns[0]
+    dates = values["date"]
+    if not dates:
+        return {}
+    skip = {"date", "_batch", key, *exclude}
+    rows = _records(columns, [column for column in values if column not in skip])
+    starts = [0] + [i for i in range(1, len(dates)) if dates[i] != dates[i - 1]]
+    ends = starts[1:] + [len(dates)]
+    if key is None:
+        return {dates[i]: rows[i:j] for i, j in zip(starts, ends)}
+    names = values[key]
+    return {dates[i]: dict(zip(names[i:j], rows[i:j])) for i, j in zip(starts, ends)}
+
+
+def flatten(data: Dict) -> Dict[str, List[Dict]]:
+    """一条市场数据记录 -> 各表的行"""
+    date = data["date"]
+    rows = {table: [] for table in TABLES}
+    rows["meta"].append({"date": date, "keys": ",".join(data),
+                         "timestamp": data.get("timestamp")})
+
+    for name, fields in (data.get("indices") or {}).items():
+        rows["indices"].append({"date": date, "index": name, **fields})
+
+    # 基础版放在 market_overview 下（含成交额），增强版直接是 market_stats
+    overview = data.get("market_overview") or {}
+    stats = data.get("market_stats") or overview.get("market_stats") or {}
+    turnover = overview.get("turnover") or {}
+    if stats or turnover:
+        breadth = {"date": date, **stats}
+        if turnover:
+            breadth["turnover_amount"] = turnover.get("amount")
+            breadth["turnover_unit"] = turnover.get("unit")
+        breadth["has_stats"] = bool(stats)
+        rows["breadth"].append(breadth)
+
+    for flow_type, fields in (data.get("fund_flow") or {}).items():
+        rows["fund_flow"].append({"date": date, "type": flow_type, **fields})
+
+    for rank, fields in enumerate(data.get("top_sectors") or [], 1):
+        rows["sectors"].append({"date": date, "kind": "top", "rank": rank, **fields})
+    for sector, fields in (data.get("sectors") or {}).items():
+        rows["sectors"].append({"date": date, "kind": "tracked", "key": sector, **fields})
+    return rows
+
+
+def rebuild(date: str, meta: Dict, grouped: Dict[str, Dict[str, object]]) -> Dict:
+    """一个日期各表的行 -> 与获取器输出结构一致的市场数据记录
+
+    grouped 由 load_range 按日期分好：indices {日期: {指数: 行}}、breadth {日期: [行]}、
+    fund_flow {日期: {类型: 行}}、top_sectors {日期: [按排名的行]}、sectors {日期: {板块词: 行}}。
+    """
+    keys = meta["keys"].split(",") if meta.get("keys") else []
+    data = {}
+    for key in keys:
+        if key in ("indices", "fund_flow", "sectors"):
+            data[key] = grouped[key].get(date, {})
+        elif key == "top_sectors":
+            data[key] = grouped[key].get(date, [])
+        elif key == "date":
+            data["date"] = date
+        elif key == "timestamp":
+            data["timestamp"] = meta.get("timestamp")
+        elif key in ("market_stats", "market_overview"):
+            breadth = grouped["breadth"].get(date)
+            breadth = dict(breadth[0]) if breadth else {}
+            has_stats = breadth.pop("has_stats", False)
+            amount, unit = breadth.pop("turnover_amount", None), breadth.pop("turnover_unit", None)
+            if key == "market_stats":
+                data[key] = breadth
+            else:
+                overview = {}
+                if has_stats:
+                    overview["market_stats"] = breadth
+                if amount is not None:
+                    overview["turnover"] = {"amount": amount, "unit": unit}
+                data[key] = overview
+    return data
+
+
+def _concat(tables: List["pa.Table"]) -> Optional["pa.Table"]:
+    """合并各批次的分片：列可能不同（新增字段、整数列出现缺失值），补齐并放宽类型；
+    旧版 pyarrow 不支持放宽类型时返回 None，由调用方逐个转换后用 pandas 合并"""
+    try:
+        return pa.concat_tables(tables, promote_options="permissive")
+    except (TypeError, pa.ArrowInvalid):
+        return None
+
+
+class MarketDataStore:
+    """按表、按年分区的列式市场数据存储
+
+    每次 append 写入一个新批次的分片（只追加，不改旧文件），同一日期以最新批次为准；
+    某年分片超过 COMPACT_PARTS 个时按年合并，一次获取结束后由调用方 compact。
+    读取时只打开日期区间涉及的年份，parquet 分片用内存映射读取并直接从 Arrow 列转换。
+    """
+
+    def __init__(self, root: Path = MARKET_STORE_DIR):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._last_batch = 0
+
+    def _suffix(self) -> str:
+        return ".parquet" if PARQUET_AVAILABLE else ".pkl"
+
+    def _parts(self, table: str, start: Optional[str] = None, end: Optional[str] = None) -> List[Path]:
+        """区间涉及年份的分片文件"""
+        table_dir = self.root / table
+        if not table_dir.exists():
+            return []
+        parts = []
+        for year_dir in sorted(table_dir.iterdir()):
+            year = year_dir.name
+            if (start and year < start[:4]) or (end and year > end[:4]):
+                continue
+            parts.extend(sorted(year_dir.glob(f"part-*{self._suffix()}")))
+        return parts
+
+    def _write_part(self, path: Path, df: pd.DataFrame):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        if PARQUET_AVAILABLE:
+            pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+        else:
+            df.to_pickle(tmp_path)
+        tmp_path.replace(path)
+
+    def _read_parts(self, table: str, start: Optional[str], end: Optional[str]) -> List["pa.Table"]:
+        """读取 parquet 分片的原始行（含 _batch 列），按日期过滤"""
+        # 分片很小，直接整个读入再按日期过滤（read_table 每次都要构建数据集，开销比读取本身大）
+        tables = []
+        for path in self._parts(table, start, end):
+            part = pq.ParquetFile(path, memory_map=True, pre_buffer=False).read(use_pandas_metadata=False)
+            if start:
+                part = part.filter(pc.greater_equal(part["date"], start))
+            if end:
+                part = part.filter(pc.less_equal(part["date"], end))
+            if part.num_rows:
+                tables.append(part)
+        return tables
+
+    def _read(self, table: str, start: Optional[str], end: Optional[str]) -> pd.DataFrame:
+        """读取未去重的原始行（含 _batch 列）"""
+        if not PARQUET_AVAILABLE:
+            frames = [pd.read_pickle(path) for path in self._parts(table, start, end)]
+            df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["date", "_batch"])
+            if start:
+                df = df[df["date"] >= start]
+            if end:
+                df = df[df["date"] <= end]
+            return df
+        tables = self._read_parts(table, start, end)
+        if not tables:
+            return pd.DataFrame(columns=["date", "_batch"])
+        arrow = _concat(tables)
+        if arrow is None:
+            return pd.concat([t.to_pandas() for t in tables], ignore_index=True)
+        return arrow.to_pandas()
+
+    def _latest(self, start: Optional[str], end: Optional[str]) -> pd.DataFrame:
+        """每个日期的最新批次的 meta 行"""
+        meta = self._read("meta", start, end)
+        if meta.empty:
+            return meta
+        meta = meta.sort_values("_batch").drop_duplicates("date", keep="last")
+        return meta.sort_values("date", ignore_index=True)
+
+    def _select(self, table: str, latest: pd.DataFrame, start: Optional[str], end: Optional[str]) -> pd.DataFrame:
+        """只保留各日期最新批次的行，按日期排序（同一日期的行连续）"""
+        df = self._read(table, start, end)
+        if df.empty or latest.empty:
+            return df.iloc[0:0]
+        # 按日期查最新批次号，与每行的批次号比较（不做 merge）
+        position = pd.Index(latest["date"]).get_indexer(df["date"])
+        batches = latest["_batch"].to_numpy()[position]
+        keep = df[(position >= 0) & (batches == df["_batch"].to_numpy())]
+        return keep.sort_values("date", kind="stable", ignore_index=True)
+
+    def _columns(self, table: str, latest: pd.DataFrame, start: Optional[str], end: Optional[str],
+                 order: Tuple[str, ...] = ("date",)) -> Columns:
+        """去重、按 order 排序（稳定排序，缺失值在后）后的一张表 -> 列
+
+        parquet 分片在 Arrow 里筛选、排序后直接转换，不经过 pandas。
+        """
+        tables = self._read_parts(table, start, end) if PARQUET_AVAILABLE else []
+        arrow = _concat(tables) if tables else None
+        if arrow is None:
+            df = self._select(table, latest, start, end)
+            order = [column for column in order if column in df.columns]
+            return _frame_columns(df.sort_values(order, kind="stable", ignore_index=True))
+        # 按日期查最新批次号，只保留批次号相同的行（查不到的日期为空值，filter 时丢弃）
+        position = pc.index_in(arrow["date"], value_set=pa.array(latest["date"].tolist(), pa.string()))
+        batches = pc.take(pa.array(latest["_batch"].to_numpy()), position)
+        arrow = arrow.filter(pc.equal(batches, arrow["_batch"]))
+        sort_keys = [(column, "ascending") for column in order if column in arrow.column_names]
+        return _table_columns(arrow.take(pc.sort_indices(arrow, sort_keys=sort_keys)))
+
+    def append(self, records: Iterable[Dict]) -> int:
+        """追加一批市场数据记录（同一日期再次追加会覆盖旧记录），返回记录数"""
+        rows = {table: [] for table in TABLES}
+        count = 0
+        for data in records:
+            for table, table_rows in flatten(data).items():
+                rows[table].extend(table_rows)
+            count += 1
+        if not count:
+            return 0
+
+        # 批次号单调递增，同一批次的各表分片同名
+        batch = max(time.time_ns(), self._last_batch + 1)
+        self._last_batch = batch
+        years = set()
+        for table in TABLES:
+            if not rows[table]:
+                continue
+            df = pd.DataFrame(rows[table])
+            df["_batch"] = batch
+            for year, part in df.groupby(df["date"].str[:4]):
+                self._write_part(self.root / table / year / f"part-{batch}{self._suffix()}",
+                                 part.reset_index(drop=True))
+                years.add(year)
+
+        for year in years:
+            if len(list((self.root / "meta" / year).glob(f"part-*{self._suffix()}"))) > COMPACT_PARTS:
+                self.compact(year)
+        return count
+
+    def compact(self, year: Optional[str] = None):
+        """把一年的全部分片合并成一个（只保留各日期的最新批次）；year 为空时合并所有年份"""
+        if year is None:
+            meta_dir = self.root / "meta"
+            for year_dir in sorted(meta_dir.iterdir()) if meta_dir.exists() else []:
+                if len(list(year_dir.glob(f"part-*{self._suffix()}"))) > 1:
+                    self.compact(year_dir.name)
+            return
+        start, end = f"{year}-01-01", f"{year}-12-31"
+        latest = self._latest(start, end)
+        for table in TABLES:
+            old_parts = self._parts(table, start, end)
+            if len(old_parts) <= 1:
+                continue
+            df = latest if table == "meta" else self._select(table, latest, start, end)
+            # 合并文件以其中最大批次命名，加 m 后缀避免与新批次的分片重名
+            batch = int(df["_batch"].max()) if not df.empty else 0
+            merged = self.root / table / year / f"part-{batch}m{self._suffix()}"
+            self._write_part(merged, df)
+            for path in old_parts:
+                if path != merged:
+                    path.unlink()
+        logger.debug(f"市场数据存储: 已合并 {year} 年的分片")
+
+    def query(self, table: str, start: Optional[str] = None, end: Optional[str] = None) -> pd.DataFrame:
+        """按日期闭区间（YYYY-MM-DD）查询一张表，已去重"""
+        if table not in TABLES:
+            raise ValueError(f"未知的表: {table}（可选 {', '.join(TABLES)}）")
+        latest = self._latest(start, end)
+        df = latest if table == "meta" else self._select(table, latest, start, end)
+        return df.drop(columns="_batch", errors="ignore")
+
+    def dates(self) -> List[str]:
+        """已存储的全部日期"""
+        return self._latest(None, None)["date"].tolist()
+
+    def load_range(self, start: Optional[str] = None, end: Optional[str] = None) -> Dict[str, Dict]:
+        """一次读取区间内全部日期，返回 {日期: 市场数据记录}"""
+        latest = self._latest(start, end)
+        if latest.empty:
+            return {}
+        # 整表按列转换后再按日期分桶，避免逐日期切片和逐行整理
+        columns = {table: self._columns(table, latest, start, end) for table in ("indices", "breadth", "fund_flow")}
+        # 板块表同一日期内按排名排序（跟踪板块没有排名，排在后面且保持原顺序），再拆成两类
+        sectors = self._columns("sectors", latest, start, end, order=("date", "rank"))
+        kinds = np.asarray(sectors[0].get("kind", []), dtype=object)
+        top = np.flatnonzero(kinds == "top").tolist()
+        tracked = np.flatnonzero(kinds == "tracked").tolist()
+        grouped = {
+            "indices": _by_date(columns["indices"], "index"),
+            "breadth": _by_date(columns["breadth"]),
+            "fund_flow": _by_date(columns["fund_flow"], "type"),
+            "top_sectors": _by_date(_take(sectors, top), exclude=("kind", "rank", "key")) if top else {},
+            "sectors": _by_date(_take(sectors, tracked), "key", exclude=("kind", "rank")) if tracked else {},
+        }
+        meta = _frame_columns(latest[["date", "keys", "timestamp"]])
+        return {row["date"]: rebuild(row["date"], row, grouped)
+                for row in _records(meta, ["date", "keys", "timestamp"])}
+
+    def get(self, date: str) -> Dict:
+        """单个日期的市场数据记录（没有时返回空字典）"""
+        return self.load_range(date, date).get(date, {})
+
+    def import_json(self, raw_dir: Path = RAW_DATA_DIR) -> int:
+        """导入旧版 market_data_{date}.json 文件，返回导入的日期数"""
+        records = []
+        for path in sorted(raw_dir.glob("market_data_*.json")):
+            with open(path, 'r', encoding='utf-8') as f:
+                records.append(json.load(f))
+        return self.append(records)
+
+
+def main():
+    """命令行：导入旧版JSON，或查询一张表"""
+    logger.add(LOG_DIR / "market_store.log", rotation="10 MB")
+    arg_parser = argparse.ArgumentParser(description="列式市场数据存储")
+    arg_parser.add_argument("table", nargs='?', choices=TABLES, help="要查询的表")
+    arg_parser.add_argument("--start", help="起始日期 YYYY-MM-DD")
+    arg_parser.add_argument("--end", help="结束日期 YYYY-MM-DD")
+    arg_parser.add_argument("--import-json", action="store_true",
+                            help="导入旧版 market_data_{date}.json 文件")
+    arg_parser.add_argument("--compact", action="store_true",
+                            help="把每张表每年的分片合并成一个")
+    args = arg_parser.parse_args()
+
+    store = MarketDataStore()
+    if args.import_json:
+        count = store.import_json()
+        logger.info(f"已导入 {count} 个日期的市场数据")
+    if args.compact:
+        store.compact()
+        logger.info("已合并市场数据分片")
+    if args.table:
+        with pd.option_context("display.max_rows", 200, "display.width", 200):
+            print(store.query(args.table, args.start, args.end))
+
+
+if __name__ == "__main__":
+    main()
@@ -28,9 +28,9 @@ while true; do
         echo "主文件: $LINES 个样本"
     fi
     
-    if [ -f "outputs/training_data/training_dataset_backup.json" ]; then
-        BACKUP_LINES=$(cat outputs/training_data/training_dataset_backup.json | jq '. | length' 2>/dev/null || echo "解析中...")
-        echo "备份文件: $BACKUP_LINES 个样本"
+    if [ -f "outputs/training_data/generation_journal.jsonl" ]; then
+        JOURNAL_LINES=$(wc -l < outputs/training_data/generation_journal.jsonl)
+        echo "生成日志: $JOURNAL_LINES 个已完成章节"
     fi
     
     echo ""
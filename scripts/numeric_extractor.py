@@ -0,0 +1,108 @@
+"""数值信息提取 - 一次线性扫描提取指数点位、资金流向和成交额"""
+import re
+from collections import deque
+from typing import Dict, List, Optional
+
+# 锚点之后最多向前看多少个字符寻找数字（None表示到行尾为止，与旧版正则一致）
+NUMBER_LOOKAHEAD = 30
+
+# 指数锚点（对应旧版 上证.*?(\d{4}) 等模式）
+INDEX_ANCHORS = ['上证', '沪指', '深成指', '创业板']
+
+# 资金流向锚点（对应旧版 (净流入|净流出).*?(\d+\.?\d*)亿）
+FLOW_ANCHORS = ['净流入', '净流出']
+
+# 词元：锚点，或可能参与配对的完整数字串（至少4位，或后接小数点/亿/万）
+# 开头的字符集前瞻让正则引擎在C层快速跳过无关字符
+_TOKEN_RE = re.compile(
+    '(?=[' + ''.join(a[0] for a in INDEX_ANCHORS + FLOW_ANCHORS) + r'\d])'
+    '(?:(?P<anchor>' + '|'.join(INDEX_ANCHORS + FLOW_ANCHORS) + r')'
+    r'|(?<!\d)\d+(?:(?<=\d{4})|(?=[.亿万])))'
+)
+_AMOUNT_RE = re.compile(r'\d+\.?\d*亿')
+_TURNOVER_RE = re.compile(r'\d+\.?\d*万亿')
+
+
+def extract_numbers(content: str, lookahead: Optional[int] = NUMBER_LOOKAHEAD) -> Dict[str, List[str]]:
+    """提取数值信息，返回 {"indices": [...], "fund_flow": [...], "turnover": [...]}
+
+    旧版每个模式用 .*? 从锚点懒惰匹配到行尾，锚点多、数字少的长行会从每个锚点
+    重新扫描一遍。这里用一个分词正则顺序扫描锚点和数字串，每个锚点只等待其后
+    lookahead 个字符以内、同一行的第一个候选数字，总耗时与文本长度成线性关系。
+    结果等价于把旧版的 .*? 换成 [^\n]{0,lookahead}?；lookahead=None 时与旧版完全一致。
+    """
+    indices: List[str] = []
+    fund_flow: List[str] = []
+    turnover: List[str] = []
+
+    # 每类锚点尚未配对的结束位置（同一行内、按出现顺序）
+    pending_index = {anchor: deque() for anchor in INDEX_ANCHORS}
+    pending_flow = deque()  # (锚点结束位置, 锚点)
+    pending = 0        # 尚未配对的锚点总数
+    last_end = 0       # 上一个词元的结束位置
+    flow_end = 0       # 上一个资金流向匹配的结束位置
+    turnover_end = 0   # 上一个成交额匹配的结束位置
+
+    for token in _TOKEN_RE.finditer(content):
+        start, end = token.span()
+
+        # 旧版 .*? 不跨行：与上一个词元之间出现换行，则所有待配对锚点作废
+        # （每段只查一次，总计仍是线性）
+        if pending and content.find('\n', last_end, start) != -1:
+            for queue in pending_index.values():
+                queue.clear()
+            pending_flow.clear()
+            pending = 0
+        last_end = end
+
+        anchor = token.group('anchor')
+        if anchor:
+            if anchor in pending_index:
+                pending_index[anchor].append(end)
+            else:
+                pending_flow.append((end, anchor))
+            pending += 1
+            continue
+
+        digits = token.group()
+        suffix = content[end:end + 1]
+
+        # (\d{4})点：数字串末尾紧跟「点」
+        if suffix == '点' and len(digits) >= 4:
+            indices.append(digits[-4:])
+
+        if pending and lookahead is not None:
+            # 丢弃距离数字超过 lookahead 的锚点，它们之后不可能再配对
+            for queue in pending_index.values():
+                while queue and start - queue[0] > lookahead:
+                    queue.popleft()
+                    pending -= 1
+            while pending_flow and start - pending_flow[0][0] > lookahead:
+                pending_flow.popleft()
+                pending -= 1
+
+        # 上证.*?(\d{4}) 等：锚点后第一个至少4位的数字串，取前4位
+        if pending and len(digits) >= 4:
+            for queue in pending_index.values():
+                if queue:
+                    indices.append(digits[:4])
+                    pending -= len(queue)
+                    queue.clear()
+
+        # (净流入|净流出).*?(\d+\.?\d*)亿
+        if pending_flow and start >= flow_end and suffix in ('亿', '.'):
+            match = _AMOUNT_RE.match(content, start)
+            if match:
+                fund_flow.append(f"{pending_flow[0][1]}{match.group()}")
+                flow_end = match.end()
+                pending -= len(pending_flow)
+                pending_flow.clear()
+
+        # (\d+\.?\d*)万亿
+        if start >= turnover_end and suffix in ('万', '.'):
+            match = _TURNOVER_RE.match(content, start)
+            if match:
+                turnover.append(match.group()[:-2])
+                turnover_end = match.end()
+
+    return {"indices": indices, "fund_flow": fund_flow, "turnover": turnover}
@@ -1,25 +1,108 @@
 """语料解析脚本 - 提取关键信息"""
+import argparse
 import re
 import json
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from loguru import logger
 from tqdm import tqdm
 import sys
 
 sys.path.append(str(Path(__file__).parent.parent))
-from config import DATA_DIR, PROCESSED_DATA_DIR, LOG_DIR
+from config import DATA_DIR, PROCESSED_DATA_DIR, LOG_DIR, KEYWORDS_FILE, STOCK_SNAPSHOT_FILE
+from keyword_matcher import KeywordMatcher, load_keywords
+from entity_index import update_entity_index
+from corpus_store import (PARSED_CORPUS_FILE, LEGACY_CORPUS_FILE, LazySections, attach_sections,
+                          compact_record, write_parsed_corpus, export_legacy_json, section_text,
+                          translate_newlines)
+from numeric_extractor import extract_numbers, INDEX_ANCHORS, FLOW_ANCHORS, NUMBER_LOOKAHEAD
+from stock_recognizer import load_recognizer, refresh_snapshot
 
 # 配置日志
 logger.add(LOG_DIR / "parse_corpus.log", rotation="10 MB")
 
+# 解析逻辑版本：修改解析规则时递增，使所有解析缓存失效
+PARSER_VERSION = "4"
+
+# 单文件解析缓存目录（每个语料目录一个子目录）
+PARSE_CACHE_DIR = PROCESSED_DATA_DIR / "parse_cache"
+
+# 个股（公司简称模式），仅在没有股票名称快照时使用
+STOCK_PATTERNS = [
+    r'[东西南北中][\u4e00-\u9fa5]{1,3}(?=[\s、，。！])',  # 方位+字
+    r'[\u4e00-\u9fa5]{2,4}(?=涨停|跌停|上涨|下跌)',
+]
+
+# 一级标题分隔（兼容未做换行转换的原文中的 \r\n 和 \r）
+_HEADING_SPLIT_RE = re.compile(r'(?:\r\n|\r|\n)# ')
+
+# 缺少股票名称快照的警告每个进程只打一次
+_snapshot_warned = False
+
+# 进程池工作进程内的解析器（由 _init_worker 设置）
+_worker_parser = None
+
+# 工作进程内当前任务产生的日志 (级别, 内容)
+_worker_logs: List[Tuple[str, str]] = []
+
+
+def _init_worker(parser: "CorpusParser"):
+    """工作进程初始化：关键词自动机只随解析器传入一次，日志改为收集后交给主进程"""
+    global _worker_parser
+    _worker_parser = parser
+    logger.remove()
+    logger.add(lambda message: _worker_logs.append(
+        (message.record["level"].name, message.record["message"])))
+
+
+def _parse_job(job: Tuple[Path, Optional[str]]) -> Tuple[Optional[Dict], bool, List[Tuple[str, str]]]:
+    """工作进程任务：返回 (解析结果, 是否命中缓存, 日志)，日志由主进程按文件顺序输出"""
+    file_path, config_hash = job
+    _worker_logs.clear()
+    if config_hash is None:
+        result, hit = _worker_parser.parse_file(file_path), False
+    else:
+        result, hit = _worker_parser.parse_file_cached(file_path, config_hash)
+    return result, hit, list(_worker_logs)
+
 
 class CorpusParser:
     """语料解析器"""
     
-    def __init__(self, data_dir: Path = DATA_DIR):
+    def __init__(self, data_dir: Path = DATA_DIR, keywords_file: Path = KEYWORDS_FILE,
+                 stock_snapshot: Path = STOCK_SNAPSHOT_FILE):
         self.data_dir = data_dir
+        # 关键词自动机只构建一次，所有章节共用
+        self.keywords = load_keywords(keywords_file)
+        self.keyword_matcher = KeywordMatcher(self.keywords)
+        # 股票名称识别器（基于快照）；没有快照时退回公司简称正则
+        self.stock_recognizer = load_recognizer(stock_snapshot)
+        global _snapshot_warned
+        if self.stock_recognizer is None and not _snapshot_warned:
+            _snapshot_warned = True
+            logger.warning(f"未找到股票名称快照 {stock_snapshot}，个股识别退回正则模式，"
+                           f"结果会混入非股票词（如「美股」「如果」）；"
+                           f"运行 python scripts/stock_recognizer.py --refresh 生成快照后重新解析")
+        # 按语料目录分开存放缓存，清理已删除文件的缓存时不影响其他目录
+        data_key = hashlib.sha1(str(Path(data_dir).resolve()).encode('utf-8')).hexdigest()[:16]
+        self.cache_dir = PARSE_CACHE_DIR / data_key
+        
+    def config_hash(self) -> str:
+        """解析配置（关键词、数值与个股规则、解析版本）的哈希，任一变化都会使缓存失效"""
+        config = {
+            "version": PARSER_VERSION,
+            "keywords": self.keywords,
+            "index_anchors": INDEX_ANCHORS,
+            "flow_anchors": FLOW_ANCHORS,
+            "number_lookahead": NUMBER_LOOKAHEAD,
+            "stock_patterns": STOCK_PATTERNS,
+            "stock_snapshot": self.stock_recognizer.snapshot_hash if self.stock_recognizer else None,
+        }
+        payload = json.dumps(config, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
         
     def parse_date_from_filename(self, filename: str) -> Optional[str]:
         """从文件名提取日期"""
@@ -29,31 +112,52 @@ class CorpusParser:
             return f"{year}-{int(month):02d}-{int(day):02d}"
         return None
     
-    def split_sections(self, content: str) -> Dict[str, str]:
-        """分割早自习、主1、主2"""
-        sections = {
-            "早自习": "",
-            "主1": "",
-            "主2": ""
+    def section_spans(self, content: str) -> Dict[str, Optional[Tuple[int, int]]]:
+        """定位早自习、主1、主2在原文中的字符区间 [start, end)
+        
+        content 可以是未做换行转换的原文；区间切片经 section_text 还原后
+        与 split_sections 的结果一致。
+        """
+        spans = {
+            "早自习": None,
+            "主1": None,
+            "主2": None
         }
         
         # 按一级标题分割
-        parts = re.split(r'\n# ', content)
+        starts = [0]
+        ends = []
+        for match in _HEADING_SPLIT_RE.finditer(content):
+            ends.append(match.start())
+            starts.append(match.end())
+        ends.append(len(content))
         
-        for part in parts:
+        for start, end in zip(starts, ends):
+            part = translate_newlines(content[start:end])
             if not part.strip():
                 continue
-            part = '# ' + part if not part.startswith('#') else part
+            if not part.startswith('#'):
+                part = '# ' + part
+                # 分隔符末尾的「# 」就是补上的标题前缀
+                if start:
+                    start -= 2
             
             # 判断是哪个部分
             if '早自习' in part[:50]:
-                sections["早自习"] = part
+                spans["早自习"] = (start, end)
             elif '（主1）' in part[:100] or '(主1)' in part[:100]:
-                sections["主1"] = part
+                spans["主1"] = (start, end)
             elif '（主2）' in part[:100] or '(主2)' in part[:100]:
-                sections["主2"] = part
+                spans["主2"] = (start, end)
                 
-        return sections
+        return spans
+    
+    def split_sections(self, content: str) -> Dict[str, str]:
+        """分割早自习、主1、主2"""
+        return {
+            name: section_text(content[span[0]:span[1]]) if span else ""
+            for name, span in self.section_spans(content).items()
+        }
     
     def extract_key_info(self, content: str, date: str) -> Dict:
         """提取关键信息"""
@@ -64,62 +168,42 @@ class CorpusParser:
             "stocks": [],  # 个股
             "predictions": [],  # 预测
             "fund_flow": [],  # 资金流向
+            "turnover": [],  # 成交额（万亿）
             "sentiments": [],  # 情绪判断
         }
         
-        # 提取指数点位
-        index_patterns = [
-            r'(\d{4})点',
-            r'上证.*?(\d{4})',
-            r'沪指.*?(\d{4})',
-            r'深成指.*?(\d{4})',
-            r'创业板.*?(\d{4})',
-        ]
-        for pattern in index_patterns:
-            matches = re.findall(pattern, content)
-            info["indices"].extend(matches)
-        
-        # 提取板块（中文词汇+可能的修饰词）
-        sector_keywords = [
-            '半导体', '芯片', 'AI', '人工智能', '军工', '新能源', '光伏', 
-            '储能', '锂电', '医药', '创新药', '消费', '零售', '券商',
-            '稀土', '有色', '煤炭', '航天', '机器人', '传媒', '游戏',
-            'CPO', 'PCB', '算力', '大模型', '存储', '光刻胶', '福建',
-            '海南', '两岸', '航母', '海防', '固态电池', '电池', '白酒',
-            '短剧', '影视', '跨境电商', '冰雪', '造纸', '有机硅',
-        ]
-        for keyword in sector_keywords:
-            if keyword in content:
-                info["sectors"].append(keyword)
-        
-        # 提取个股（公司简称模式）
-        stock_patterns = [
-            r'[东西南北中][\u4e00-\u9fa5]{1,3}(?=[\s、，。！])',  # 方位+字
-            r'[\u4e00-\u9fa5]{2,4}(?=涨停|跌停|上涨|下跌)',
-        ]
-        for pattern in stock_patterns:
-            matches = re.findall(pattern, content)
-            info["stocks"].extend(matches)
-        
-        # 提取预测关键词
-        prediction_keywords = ['看涨', '看跌', '震荡', '反弹', '分化', '承压', '企稳', '冲高回落']
-        for keyword in prediction_keywords:
-            if keyword in content:
-                info["predictions"].append(keyword)
-        
-        # 提取资金流向
-        fund_flow_pattern = r'(净流入|净流出).*?(\d+\.?\d*)亿'
-        matches = re.findall(fund_flow_pattern, content)
-        info["fund_flow"] = [f"{m[0]}{m[1]}亿" for m in matches]
-        
-        # 去重
-        for key in ['indices', 'sectors', 'stocks', 'predictions']:
-            info[key] = list(set(info[key]))
+        # 提取指数点位、资金流向、成交额（一次线性扫描）
+        numbers = extract_numbers(content)
+        info["indices"] = numbers["indices"]
+        info["fund_flow"] = numbers["fund_flow"]
+        info["turnover"] = numbers["turnover"]
+        
+        # 提取板块、预测、情绪关键词（自动机一次扫描）
+        hits = self.keyword_matcher.scan(content)
+        info["sectors"] = list(hits.get("sectors", {}))
+        info["predictions"] = list(hits.get("predictions", {}))
+        info["sentiments"] = list(hits.get("sentiments", {}))
+        
+        # 提取个股：快照词典最长匹配，没有快照时用公司简称模式
+        if self.stock_recognizer:
+            info["stocks"] = self.stock_recognizer.names_in(content)
+        else:
+            for pattern in STOCK_PATTERNS:
+                matches = re.findall(pattern, content)
+                info["stocks"].extend(matches)
+        
+        # 去重（保留首次出现顺序，缓存结果与重新解析逐字节一致）
+        for key in ['indices', 'stocks']:
+            info[key] = list(dict.fromkeys(info[key]))
         
         return info
     
-    def parse_file(self, file_path: Path) -> Optional[Dict]:
-        """解析单个文件"""
+    def parse_file(self, file_path: Path, raw: Optional[bytes] = None) -> Optional[Dict]:
+        """解析单个文件（raw为空时从磁盘读取）
+        
+        结果记录源文件哈希、大小和各章节的字节偏移，sections 是按偏移从源文件
+        懒加载正文的 LazySections，缓存和紧凑格式都只保存偏移。
+        """
         try:
             logger.info(f"解析文件: {file_path.name}")
             
@@ -129,17 +213,32 @@ class CorpusParser:
                 logger.warning(f"无法从文件名提取日期: {file_path.name}")
                 return None
             
-            # 读取内容
-            content = file_path.read_text(encoding='utf-8')
+            # 读取内容（保留原始换行，偏移按源文件字节计算）
+            if raw is None:
+                raw = file_path.read_bytes()
+            content = raw.decode('utf-8')
             
             # 分割章节
-            sections = self.split_sections(content)
+            spans = self.section_spans(content)
+            sections = {
+                name: section_text(content[span[0]:span[1]]) if span else ""
+                for name, span in spans.items()
+            }
+            offsets = {
+                name: [len(content[:span[0]].encode('utf-8')),
+                       len(content[:span[1]].encode('utf-8'))] if span else None
+                for name, span in spans.items()
+            }
+            sha256 = hashlib.sha256(raw).hexdigest()
             
-            # 提取关键信息
+            # 提取关键信息（正文只在这里用，结果里的章节按偏移懒加载）
             result = {
                 "filename": file_path.name,
                 "date": date,
-                "sections": sections,
+                "sha256": sha256,
+                "size": len(raw),
+                "sections": LazySections(file_path, offsets, sha256, len(raw)),
+                "section_offsets": offsets,
                 "key_info": {
                     section_name: self.extract_key_info(section_content, date)
                     for section_name, section_content in sections.items()
@@ -153,10 +252,65 @@ class CorpusParser:
             logger.error(f"解析文件失败 {file_path.name}: {e}")
             return None
     
-    def parse_all(self) -> List[Dict]:
-        """解析所有语料文件"""
-        results = []
+    def _cache_path(self, file_path: Path) -> Path:
+        """单文件缓存路径（按源文件绝对路径哈希命名）"""
+        key = hashlib.sha1(str(file_path.resolve()).encode('utf-8')).hexdigest()
+        return self.cache_dir / f"{key}.json"
+    
+    def parse_file_cached(self, file_path: Path, config_hash: str) -> tuple:
+        """带缓存解析单个文件，返回 (解析结果, 是否命中缓存)
+        
+        缓存只存紧凑记录（字节偏移，不含正文），命中时重新挂上懒加载的 sections。
+        大小和修改时间都没变时直接使用缓存，不读取源文件；
+        否则读取内容比对哈希，内容没变（如仅被touch）也沿用缓存。
+        """
+        cache_path = self._cache_path(file_path)
+        stat = file_path.stat()
         
+        entry = None
+        if cache_path.exists():
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"解析缓存损坏，重新解析 {file_path.name}: {e}")
+        if entry and (entry.get("config_hash") != config_hash
+                      or entry.get("path") != str(file_path.resolve())):
+            entry = None
+        
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return attach_sections(entry["result"], file_path), True
+        
+        raw = file_path.read_bytes()
+        content_hash = hashlib.sha256(raw).hexdigest()
+        if entry and entry["sha256"] == content_hash:
+            result, hit = attach_sections(entry["result"], file_path), True
+        else:
+            result, hit = self.parse_file(file_path, raw), False
+            if result is None:
+                # 解析失败不写缓存，下次重试
+                return None, False
+        
+        entry = {
+            "path": str(file_path.resolve()),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": content_hash,
+            "config_hash": config_hash,
+            "result": compact_record(result),
+        }
+        tmp_path = cache_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        tmp_path.replace(cache_path)
+        return result, hit
+    
+    def iter_parse_all(self, use_cache: bool = True, workers: int = 1) -> Iterator[Dict]:
+        """按文件名顺序逐个产出解析结果（默认只重新解析新增或修改过的文件）
+        
+        默认串行（语料文件少时进程池的启动和传输开销比解析本身大）；workers>1 时用进程池
+        并行解析，0 表示使用全部CPU核，结果与日志顺序与串行一致。
+        """
         # 获取所有.md文件（排除ReadMe.md）
         md_files = sorted([
             f for f in self.data_dir.glob("*.md")
@@ -165,34 +319,102 @@ class CorpusParser:
         
         logger.info(f"找到 {len(md_files)} 个语料文件")
         
-        # 添加进度条
-        for file_path in tqdm(md_files, desc="📖 解析语料文件", 
-                             unit="文件", colour="cyan"):
-            result = self.parse_file(file_path)
-            if result:
-                results.append(result)
+        config_hash = None
+        if use_cache:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            config_hash = self.config_hash()
+        jobs = [(file_path, config_hash) for file_path in md_files]
+        hits = 0
+        
+        if workers == 0:
+            workers = os.cpu_count() or 1
+        if len(jobs) > 1 and workers > 1:
+            # 分块提交减少进程间通信；map 按提交顺序返回，输出与串行一致
+            chunksize = max(1, len(jobs) // (workers * 4))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(self,)) as pool:
+                for result, hit, logs in tqdm(pool.map(_parse_job, jobs, chunksize=chunksize),
+                                              total=len(jobs), desc="📖 解析语料文件",
+                                              unit="文件", colour="cyan"):
+                    for level, message in logs:
+                        logger.log(level, message)
+                    hits += hit
+                    if result:
+                        yield result
+        else:
+            # 添加进度条
+            for file_path, _ in tqdm(jobs, desc="📖 解析语料文件", 
+                                     unit="文件", colour="cyan"):
+                if use_cache:
+                    result, hit = self.parse_file_cached(file_path, config_hash)
+                else:
+                    result, hit = self.parse_file(file_path), False
+                hits += hit
+                if result:
+                    yield result
+        
+        if not use_cache:
+            return
         
-        return results
+        # 清理本语料目录下已删除源文件的缓存
+        live = {self._cache_path(f).name for f in md_files}
+        for cache_file in self.cache_dir.glob("*.json"):
+            if cache_file.name not in live:
+                cache_file.unlink()
+        
+        logger.info(f"解析缓存命中 {hits} 个，重新解析 {len(md_files) - hits} 个")
+    
+    def parse_all(self, use_cache: bool = True, workers: int = 1) -> List[Dict]:
+        """解析所有语料文件，返回列表"""
+        return list(self.iter_parse_all(use_cache, workers))
     
-    def save_parsed_data(self, data: List[Dict], output_file: str = "parsed_corpus.json"):
-        """保存解析结果"""
+    def save_parsed_data(self, data: Iterable[Dict], output_file: str = PARSED_CORPUS_FILE.name,
+                         legacy_json: bool = False, compact: bool = True) -> int:
+        """逐条保存解析结果为JSONL，返回条数
+        
+        compact=True（默认）时章节只保存字节偏移，读取时从源文件切出；
+        legacy_json=True 时另外导出带正文的旧版 parsed_corpus.json。
+        """
         output_path = PROCESSED_DATA_DIR / output_file
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        count = write_parsed_corpus(data, output_path, compact=compact)
         logger.info(f"解析结果已保存到: {output_path}")
+        if legacy_json:
+            export_legacy_json(output_path)
+            logger.info(f"旧版格式已导出到: {LEGACY_CORPUS_FILE}")
+        return count
 
 
 def main():
     """主函数"""
+    arg_parser = argparse.ArgumentParser(description="解析语料")
+    arg_parser.add_argument("--refresh-stocks", action="store_true",
+                            help="解析前用akshare刷新股票名称快照（需要联网）")
+    arg_parser.add_argument("--workers", type=int, default=1,
+                            help="并行进程数（默认1为串行，0为全部CPU核）")
+    args = arg_parser.parse_args()
+    
+    if args.refresh_stocks:
+        count = refresh_snapshot()
+        logger.info(f"股票名称快照已更新: {STOCK_SNAPSHOT_FILE}（{count} 只）")
     parser = CorpusParser()
-    results = parser.parse_all()
-    parser.save_parsed_data(results)
+    total_sections = 0
+    
+    def counted(results):
+        # 边写边统计章节数，不在内存中保留全部结果
+        nonlocal total_sections
+        for r in results:
+            total_sections += sum(1 for span in r['section_offsets'].values() if span)
+            yield r
     
-    logger.info(f"成功解析 {len(results)} 个文件")
+    count = parser.save_parsed_data(counted(parser.iter_parse_all(workers=args.workers)))
+    
+    logger.info(f"成功解析 {count} 个文件")
     
     # 打印统计信息
-    total_sections = sum(len([s for s in r['sections'].values() if s]) for r in results)
     logger.info(f"总共章节数: {total_sections}")
+    
+    # 增量更新实体索引
+    update_entity_index()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,117 @@
+"""生成请求缓存 - 以模型参数 + 完整 prompt 的哈希为键，把LLM回复存进SQLite，按总大小做LRU淘汰"""
+import hashlib
+import json
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from loguru import logger
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import TRAINING_DATA_DIR, PROMPT_CACHE_MAX_BYTES
+
+PROMPT_CACHE_FILE = TRAINING_DATA_DIR / "prompt_cache.sqlite"
+
+
+def prompt_key(model: str, temperature: float, max_tokens: int, system: str, prompt: str) -> str:
+    """影响回复的全部请求参数 -> 缓存键（内容寻址：prompt 不变则键不变）"""
+    payload = json.dumps([model, temperature, max_tokens, system, prompt], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class PromptCache:
+    """LLM回复缓存
+
+    只缓存能解析成样本的回复原文（解析逻辑调整后仍然适用）。命中时更新最近访问时间，
+    总大小超过 max_bytes 时按最近访问时间淘汰。线程安全，多个生成线程共用一个连接。
+    """
+
+    def __init__(self, path: Path = PROMPT_CACHE_FILE, max_bytes: int = PROMPT_CACHE_MAX_BYTES,
+                 enabled: bool = True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._bytes = 0
+        if enabled:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY, model TEXT, text TEXT, bytes INTEGER, created REAL, accessed REAL)""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+            self._bytes = self._conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        """缓存的回复原文，没有时为 None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, text: str, model: str = ""):
+        """写入一条回复，然后按总大小淘汰最久未访问的条目"""
+        if not self.enabled:
+            return
+        size = len(text.encode('utf-8'))
+        now = time.time()
+        try:
+            with self._lock:
+                old = self._conn.execute("SELECT bytes FROM responses WHERE key = ?", (key,)).fetchone()
+                self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                                   (key, model, text, size, now, now))
+                self._bytes += size - (old[0] if old else 0)
+                self._evict(keep=key)
+        except sqlite3.Error as e:
+            logger.warning(f"写入生成请求缓存失败: {e}")
+
+    def _evict(self, keep: str):
+        """总大小超限时按最近访问时间淘汰（调用方持有锁）"""
+        if self._bytes <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, bytes FROM responses ORDER BY accessed").fetchall()
+        removed = []
+        for key, size in rows:
+            if self._bytes <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            removed.append((key,))
+            self._bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", removed)
+        self.evictions += len(removed)
+
+    def stats(self) -> Dict:
+        """命中/未命中计数和缓存占用"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] if self.enabled else 0
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": self._bytes,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self.enabled = False
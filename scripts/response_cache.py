@@ -0,0 +1,238 @@
+"""数据源响应缓存 - 以接口名+参数为键，按接口设置有效期，列式落盘，按总大小做LRU淘汰"""
+import atexit
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from datetime import date
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import pandas as pd
+from loguru import logger
+
+# pyarrow是可选的，没有时退回pickle存储
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import RAW_DATA_DIR, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_BYTES
+from fetch_engine import limited_call
+
+# 缓存目录：每个响应一个文件，manifest.json 记录键、有效期和最近访问时间
+RESPONSE_CACHE_DIR = RAW_DATA_DIR / "response_cache"
+MANIFEST_FILE = "manifest.json"
+
+# 参数中的日期（YYYY-MM-DD 或 YYYYMMDD）
+_DATE_RE = re.compile(r'^(\d{4})-?(\d{2})-?(\d{2})$')
+
+
+def cache_key(name: str, args: tuple, kwargs: Dict) -> str:
+    """接口名 + 参数 -> 缓存键"""
+    payload = json.dumps([name, list(args), sorted(kwargs.items())],
+                         ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _arg_dates(args: tuple, kwargs: Dict):
+    """参数中出现的日期（YYYY-MM-DD）"""
+    dates = []
+    for value in list(args) + list(kwargs.values()):
+        match = _DATE_RE.match(value) if isinstance(value, str) else None
+        if match:
+            dates.append('-'.join(match.groups()))
+    return dates
+
+
+class ResponseCache:
+    """接口响应缓存
+
+    只缓存非空的 DataFrame。有效期按接口名取 RESPONSE_CACHE_TTL（未配置的用
+    "default"）；参数里带日期且都早于今天的请求（已收盘的历史区间）永久有效。
+    总大小超过 max_bytes 时按最近访问时间淘汰。同一个键并发未命中时只请求一次。
+    """
+
+    def __init__(self, cache_dir: Path = RESPONSE_CACHE_DIR,
+                 max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+                 ttl: Optional[Dict[str, Optional[float]]] = None,
+                 enabled: bool = True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = {**RESPONSE_CACHE_TTL, **(ttl or {})}
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._dirty = False
+        self._entries: Dict[str, Dict] = {}
+        if enabled:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._entries = self._load_manifest()
+            # 命中只更新内存中的访问时间，退出时写回
+            atexit.register(self.flush)
+
+    def _load_manifest(self) -> Dict[str, Dict]:
+        path = self.cache_dir / MANIFEST_FILE
+        if path.exists():
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.warning(f"响应缓存清单损坏，清空缓存: {e}")
+        return {}
+
+    def flush(self):
+        """把清单写回磁盘（先写临时文件再替换）"""
+        with self._lock:
+            if not self._dirty:
+                return
+            path = self.cache_dir / MANIFEST_FILE
+            tmp_path = path.with_name(f".{path.name}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            tmp_path.replace(path)
+            self._dirty = False
+
+    def ttl_for(self, name: str, args: tuple, kwargs: Dict) -> Optional[float]:
+        """有效期（秒），None 表示永久有效"""
+        dates = _arg_dates(args, kwargs)
+        if dates and max(dates) < date.today().isoformat():
+            return None
+        return self.ttl.get(name, self.ttl.get("default"))
+
+    def _read(self, key: str) -> Optional[pd.DataFrame]:
+        """读取未过期的缓存，过期或损坏的条目直接删除"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry["expires"] is not None and entry["expires"] <= time.time():
+                self._remove(key)
+                return None
+        path = self.cache_dir / entry["file"]
+        try:
+            df = pd.read_parquet(path) if path.suffix == ".parquet" else pd.read_pickle(path)
+        except Exception as e:
+            logger.warning(f"响应缓存损坏，重新请求 {entry['name']}: {e}")
+            with self._lock:
+                self._remove(key)
+            return None
+        with self._lock:
+            entry["accessed"] = time.time()
+            self._dirty = True
+        return df
+
+    def _write(self, key: str, name: str, df: pd.DataFrame, ttl: Optional[float]):
+        """落盘一个响应，然后按总大小淘汰最久未访问的条目"""
+        path = None
+        if PARQUET_AVAILABLE:
+            path = self.cache_dir / f"{key}.parquet"
+            tmp_path = path.with_name(f".{path.name}.tmp")
+            try:
+                df.to_parquet(tmp_path)
+            except Exception:
+                # 混合类型的对象列等无法转成列式存储时退回pickle
+                tmp_path.unlink(missing_ok=True)
+                path = None
+        if path is None:
+            path = self.cache_dir / f"{key}.pkl"
+            tmp_path = path.with_name(f".{path.name}.tmp")
+            df.to_pickle(tmp_path)
+        tmp_path.replace(path)
+
+        now = time.time()
+        with self._lock:
+            old = self._entries.get(key)
+            if old and old["file"] != path.name:
+                (self.cache_dir / old["file"]).unlink(missing_ok=True)
+            self._entries[key] = {
+                "name": name,
+                "file": path.name,
+                "bytes": path.stat().st_size,
+                "created": now,
+                "accessed": now,
+                "expires": None if ttl is None else now + ttl,
+            }
+            self._evict(keep=key)
+            self._dirty = True
+        self.flush()
+
+    def _remove(self, key: str):
+        """删除条目和文件（调用方持有锁）"""
+        entry = self._entries.pop(key, None)
+        if entry:
+            (self.cache_dir / entry["file"]).unlink(missing_ok=True)
+            self._dirty = True
+
+    def _evict(self, keep: str):
+        """总大小超限时按最近访问时间淘汰（调用方持有锁）"""
+        total = sum(entry["bytes"] for entry in self._entries.values())
+        for key in sorted(self._entries, key=lambda k: self._entries[k]["accessed"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._entries[key]["bytes"]
+            self._remove(key)
+            self.evictions += 1
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def call(self, source: str, func: Callable, *args, **kwargs) -> Any:
+        """带缓存地调用数据源接口，未命中时按数据源限速后请求"""
+        if not self.enabled:
+            return limited_call(source, func, *args, **kwargs)
+
+        name = getattr(func, "__name__", repr(func))
+        key = cache_key(name, args, kwargs)
+        with self._key_lock(key):
+            df = self._read(key)
+            if df is not None:
+                with self._lock:
+                    self.hits += 1
+                return df
+
+            with self._lock:
+                self.misses += 1
+            result = limited_call(source, func, *args, **kwargs)
+            if isinstance(result, pd.DataFrame) and not result.empty:
+                try:
+                    self._write(key, name, result, self.ttl_for(name, args, kwargs))
+                except Exception as e:
+                    logger.warning(f"写入响应缓存失败 {name}: {e}")
+            return result
+
+    def stats(self) -> Dict:
+        """命中/未命中计数和缓存占用"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": sum(entry["bytes"] for entry in self._entries.values()),
+            }
+
+
+_default_cache: Optional[ResponseCache] = None
+_default_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """进程内共享的响应缓存（多个获取器共用同一份清单）"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
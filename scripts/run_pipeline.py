@@ -1,19 +1,26 @@
 """完整流程主控脚本"""
 import sys
 from pathlib import Path
+from typing import Dict
 from loguru import logger
 import argparse
 
 sys.path.append(str(Path(__file__).parent.parent))
-from config import LOG_DIR
+from config import LOG_DIR, STOCK_SNAPSHOT_FILE
 
 # 配置日志
 logger.add(LOG_DIR / "pipeline.log", rotation="10 MB")
 
 # 导入各个模块
 from parse_corpus import CorpusParser
+from corpus_store import iter_parsed_corpus
+from entity_index import SECTIONS, update_entity_index
+from fetch_engine import map_concurrently
 from fetch_market_data import MarketDataFetcher
+from fetch_planner import plan_fetch, describe_plan
 from generate_training_data import TrainingDataGenerator
+from stock_recognizer import refresh_snapshot
+from dataset_writer import DatasetWriter
 
 
 def parse_arguments():
@@ -26,24 +33,40 @@ def parse_arguments():
                       help='使用GPT生成训练数据（需要API key）')
     parser.add_argument('--dates', nargs='+',
                       help='指定要爬取数据的日期列表（格式: YYYY-MM-DD）')
+    parser.add_argument('--workers', type=int, default=1,
+                      help='解析语料的并行进程数（默认1为串行，0为全部CPU核）')
+    parser.add_argument('--fetch-concurrency', type=int, default=None,
+                      help='爬取数据时同时在途的请求数（默认取配置 FETCH_CONCURRENCY，1为串行）')
+    parser.add_argument('--refetch', action='store_true',
+                      help='重新爬取已存储的日期（默认只爬取缺失的交易日）')
+    parser.add_argument('--refresh-stocks', action='store_true',
+                      help='解析语料前用akshare刷新股票名称快照（需要联网）')
     return parser.parse_args()
 
 
-def step_parse_corpus():
+def step_refresh_stocks():
+    """刷新股票名称快照（个股识别用），失败时直接报错"""
+    logger.info("刷新股票名称快照")
+    count = refresh_snapshot()
+    logger.info(f"✓ 股票名称快照已更新: {STOCK_SNAPSHOT_FILE}（{count} 只）")
+    return count
+
+
+def step_parse_corpus(workers=1):
     """步骤1: 解析语料"""
     logger.info("=" * 50)
     logger.info("步骤1: 解析语料文件")
     logger.info("=" * 50)
     
     parser = CorpusParser()
-    results = parser.parse_all()
-    parser.save_parsed_data(results)
+    count = parser.save_parsed_data(parser.iter_parse_all(workers=workers))
+    update_entity_index()
     
-    logger.info(f"✓ 成功解析 {len(results)} 个语料文件")
-    return results
+    logger.info(f"✓ 成功解析 {count} 个语料文件")
+    return count
 
 
-def step_fetch_market_data(dates=None):
+def step_fetch_market_data(dates=None, concurrency=None, refetch=False):
     """步骤2: 爬取市场数据"""
     logger.info("=" * 50)
     logger.info("步骤2: 爬取市场数据")
@@ -51,35 +74,52 @@ def step_fetch_market_data(dates=None):
     
     fetcher = MarketDataFetcher()
     
-    if dates:
-        target_dates = dates
-    else:
-        # 从解析的语料中提取日期
-        import json
-        from config import PROCESSED_DATA_DIR
-        
-        parsed_file = PROCESSED_DATA_DIR / "parsed_corpus.json"
-        if parsed_file.exists():
-            with open(parsed_file, 'r', encoding='utf-8') as f:
-                corpus_data = json.load(f)
-            target_dates = [item['date'] for item in corpus_data]
-        else:
+    # 语料中每天各章节提到的板块词（逐条读取，只保留日期和板块）
+    sectors_by_date = {}
+    try:
+        for item in iter_parsed_corpus():
+            sectors = sectors_by_date.setdefault(item['date'], [])
+            for section in SECTIONS:
+                sectors.extend(item.get('key_info', {}).get(section, {}).get('sectors', []))
+    except FileNotFoundError:
+        if not dates:
             logger.error("未找到解析后的语料文件，请先运行parse步骤")
             return
+    target_dates = dates or list(sectors_by_date)
+    
+    # 去掉非交易日和已存储的日期，只爬取缺失的部分
+    plan = plan_fetch(target_dates, fetcher.market_store, refetch=refetch)
+    logger.info(f"需要 {len(set(target_dates))} 个日期: {describe_plan(plan)}")
+    target_dates = plan["fetch"]
+    if not target_dates:
+        logger.info("✓ 市场数据已是最新，无需爬取")
+        return
     
     logger.info(f"准备爬取 {len(target_dates)} 个日期的数据")
+    # 涨跌统计、板块日线按全部日期一次取齐，各日期直接取结果
+    fetcher.breadth.prepare(target_dates)
+    fetcher.boards.prepare(target_dates, [s for day in target_dates for s in sectors_by_date.get(day, [])])
+    
+    def fetch(date: str) -> Dict:
+        return fetcher.fetch_date_data(date, list(dict.fromkeys(sectors_by_date.get(date, []))))
     
     success_count = 0
-    for date in target_dates:
-        try:
-            logger.info(f"爬取 {date} 的数据...")
-            data = fetcher.fetch_date_data(date)
-            fetcher.save_market_data(date, data)
-            success_count += 1
-        except Exception as e:
-            logger.error(f"爬取 {date} 数据失败: {e}")
+    records = []
+    # 多个日期并发爬取，请求速率由各数据源的令牌桶控制
+    for date, data, error in map_concurrently(fetch, target_dates, concurrency):
+        if error is not None:
+            logger.error(f"爬取 {date} 数据失败: {error}")
+            continue
+        records.append(data)
+        success_count += 1
+    # 全部日期作为一个批次写入列式存储
+    if records:
+        fetcher.save_market_batch(records)
     
     logger.info(f"✓ 成功爬取 {success_count}/{len(target_dates)} 个日期的数据")
+    stats = fetcher.response_cache.stats()
+    logger.info(f"响应缓存: 命中 {stats['hits']}，未命中 {stats['misses']}，命中率 {stats['hit_rate']:.0%}")
+    fetcher.sources.log_metrics()
 
 
 def step_generate_training_data(use_gpt=False):
@@ -92,12 +132,13 @@ def step_generate_training_data(use_gpt=False):
     
     if use_gpt:
         logger.info("使用GPT生成训练数据")
-        training_data = generator.generate_all_training_data()
+        with DatasetWriter() as writer:
+            training_data = generator.generate_all_training_data(writer)
+        generator.clear_journal()
     else:
         logger.info("使用简化方法生成训练数据")
         training_data = generator.generate_simple_training_data()
-    
-    generator.save_training_data(training_data)
+        generator.save_training_data(training_data)
     
     logger.info(f"✓ 成功生成 {len(training_data)} 个训练样本")
 
@@ -129,11 +170,14 @@ def main():
     logger.info(f"执行步骤: {args.step}")
     
     try:
+        if args.refresh_stocks:
+            step_refresh_stocks()
+        
         if args.step in ['all', 'parse']:
-            step_parse_corpus()
+            step_parse_corpus(args.workers)
         
         if args.step in ['all', 'fetch']:
-            step_fetch_market_data(args.dates)
+            step_fetch_market_data(args.dates, args.fetch_concurrency, args.refetch)
         
         if args.step in ['all', 'generate']:
             step_generate_training_data(args.use_gpt)
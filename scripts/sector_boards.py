@@ -0,0 +1,249 @@
+"""板块行情 - 每次运行取一次行业、概念板块快照并按板块名索引，语料板块词经映射表解析，历史日期用缓存的板块日线"""
+import json
+import re
+import sys
+import threading
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+from loguru import logger
+
+# pyarrow是可选的，没有时退回pickle存储
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import RAW_DATA_DIR, SECTOR_BOARD_MAPPING
+from fetch_engine import map_concurrently
+from fetch_planner import TradingCalendar
+
+# 板块日线缓存目录：每个板块一个文件，manifest.json 记录已获取的日期区间
+BOARD_HISTORY_DIR = RAW_DATA_DIR / "board_history"
+MANIFEST_FILE = "manifest.json"
+
+# 板块类型 -> 快照数据集（行业在前，同名时以行业板块为准）
+BOARD_DATASETS = {"industry": "industry_boards", "concept": "concept_boards"}
+
+# 板块：(类型, 板块名称)
+Board = Tuple[str, str]
+
+
+def _normalize(raw: pd.DataFrame) -> pd.DataFrame:
+    """板块日线 -> 以 YYYY-MM-DD 为索引的 收盘、涨跌幅"""
+    if raw is None or raw.empty:
+        return pd.DataFrame(columns=["close", "change_pct"], index=pd.Index([], name="date"), dtype=float)
+    return pd.DataFrame({
+        "close": pd.to_numeric(raw["收盘"], errors="coerce").to_numpy(),
+        "change_pct": pd.to_numeric(raw["涨跌幅"], errors="coerce").to_numpy(),
+    }, index=pd.Index(raw["日期"].astype(str), name="date"))
+
+
+class BoardHistoryCache:
+    """板块日线缓存
+
+    每个板块落盘一份日线（日期 -> 收盘、涨跌幅），已获取区间之外的部分才联网，新取的数据与
+    已有数据合并；当天及以后的数据可能是盘中数据，下次运行重取。
+    """
+
+    def __init__(self, cache_dir: Path = BOARD_HISTORY_DIR):
+        self.cache_dir = cache_dir
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._manifest = self._load_manifest()
+        self._frames: Dict[Board, pd.DataFrame] = {}
+        self._lock = threading.Lock()
+
+    def _load_manifest(self) -> Dict[str, Dict]:
+        path = self.cache_dir / MANIFEST_FILE
+        if path.exists():
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {}
+
+    def _save_manifest(self):
+        path = self.cache_dir / MANIFEST_FILE
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._manifest, f, ensure_ascii=False)
+        tmp_path.replace(path)
+
+    def _path(self, board: Board) -> Path:
+        kind, name = board
+        safe = re.sub(r'[\\/:*?"<>|]', '_', name)
+        return self.cache_dir / f"{kind}_{safe}{'.parquet' if PARQUET_AVAILABLE else '.pkl'}"
+
+    def _load(self, board: Board) -> pd.DataFrame:
+        path = self._path(board)
+        if path.exists():
+            return pd.read_parquet(path) if PARQUET_AVAILABLE else pd.read_pickle(path)
+        return _normalize(None)
+
+    def _save(self, board: Board, df: pd.DataFrame):
+        path = self._path(board)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        if PARQUET_AVAILABLE:
+            df.to_parquet(tmp_path)
+        else:
+            df.to_pickle(tmp_path)
+        tmp_path.replace(path)
+
+    def history(self, sources, board: Board, start: str, end: str) -> pd.DataFrame:
+        """板块在 [start, end] 的日线（以 YYYY-MM-DD 为索引），缺的部分联网补齐"""
+        key = "/".join(board)
+        with self._lock:
+            entry = self._manifest.get(key)
+            df = self._frames.get(board)
+            if df is None:
+                df = self._frames[board] = self._load(board)
+        if entry and entry["start"] <= start and entry["end"] >= end:
+            return df.loc[start:end]
+
+        # 只取已获取区间之外的部分，并与已获取区间衔接（向前补到原起点，向后从原最后一天重取），
+        # 保证合并后的数据是连续的一段
+        if entry:
+            fetch_start = start if start < entry["start"] else entry["end"]
+            fetch_end = end if end > entry["end"] else entry["start"]
+        else:
+            fetch_start, fetch_end = start, end
+        raw = sources.fetch("board_hist", allow_empty=True, kind=board[0], board=board[1],
+                            start=fetch_start, end=fetch_end)
+        # 重叠日以新数据为准
+        df = pd.concat([df, _normalize(raw)])
+        df = df[~df.index.duplicated(keep="last")].sort_index()
+
+        # 今天及以后的数据可能是盘中数据，不计入已获取区间
+        yesterday = (date.today() - timedelta(days=1)).isoformat()
+        covered_start = min(start, entry["start"]) if entry else start
+        covered_end = min(max(end, entry["end"]) if entry else end, yesterday)
+        with self._lock:
+            self._save(board, df)
+            self._frames[board] = df
+            self._manifest[key] = {"start": covered_start, "end": covered_end}
+            self._save_manifest()
+        return df.loc[start:end]
+
+
+class SectorBoards:
+    """语料板块词 -> 板块涨跌幅
+
+    每次运行只取一次行业和概念板块快照（与 top_sectors 同一数据源），按板块名称索引；板块词
+    先查映射表（SECTOR_BOARD_MAPPING），再按名称完全匹配、包含匹配解析到板块，解析结果复用。
+    快照只对应最近一个交易日，其他日期由 prepare 一次取齐所需板块的日线，拼成 日期 × 板块 的表，
+    每天的全部板块词用一次索引查出。
+    """
+
+    def __init__(self, sources, history: Optional[BoardHistoryCache] = None,
+                 calendar: Optional[TradingCalendar] = None, now: Optional[datetime] = None):
+        self.sources = sources
+        self.history = history or BoardHistoryCache()
+        self.calendar = calendar
+        self.now = now
+        self.date: Optional[str] = None
+        self._snapshot: Optional[pd.DataFrame] = None
+        self._resolved: Dict[str, Optional[Board]] = {}
+        self._table = pd.DataFrame()
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> pd.DataFrame:
+        """行业 + 概念板块快照，以板块名称为索引（含 kind、涨跌幅、领涨股票）"""
+        with self._lock:
+            if self._snapshot is None:
+                frames = []
+                for kind, dataset in BOARD_DATASETS.items():
+                    try:
+                        df = self.sources.fetch(dataset)
+                        frames.append(pd.DataFrame({
+                            "板块名称": df["板块名称"].astype(str),
+                            "kind": kind,
+                            "涨跌幅": pd.to_numeric(df["涨跌幅"], errors="coerce"),
+                            "领涨股票": df["领涨股票"].astype(str) if "领涨股票" in df else "N/A",
+                        }))
+                    except Exception as e:
+                        logger.warning(f"获取{kind}板块快照失败: {e}")
+                snapshot = pd.concat(frames, ignore_index=True) if frames else \
+                    pd.DataFrame(columns=["板块名称", "kind", "涨跌幅", "领涨股票"])
+                self._snapshot = snapshot.drop_duplicates("板块名称").set_index("板块名称")
+                if frames:
+                    self.date = (self.calendar or TradingCalendar()).last_session(self.now)
+            return self._snapshot
+
+    def resolve(self, keywords: Iterable[str]) -> Dict[str, Board]:
+        """板块词 -> (类型, 板块名称)，解析不到的词不在结果中"""
+        keywords = list(keywords)
+        snapshot = self.snapshot()
+        names = snapshot.index.to_series()
+        for keyword in keywords:
+            if keyword in self._resolved:
+                continue
+            board = None
+            for candidate in dict.fromkeys([SECTOR_BOARD_MAPPING.get(keyword, keyword), keyword]):
+                if candidate in snapshot.index:
+                    board = candidate
+                    break
+                matches = names[names.str.contains(candidate, regex=False)]
+                if not matches.empty:
+                    # 包含匹配时取名称最短的（最接近原词），同长度时行业板块在前
+                    board = matches.iloc[matches.str.len().to_numpy().argmin()]
+                    break
+            if board is None:
+                logger.debug(f"板块词 {keyword} 没有对应的板块")
+            self._resolved[keyword] = (snapshot.at[board, "kind"], board) if board else None
+        return {k: self._resolved[k] for k in keywords if self._resolved.get(k)}
+
+    def prepare(self, dates: Iterable[str], keywords: Iterable[str], concurrency: Optional[int] = None):
+        """取齐 dates 中历史日期所需板块的日线，拼成 日期 × 板块 的涨跌幅表"""
+        keywords = list(dict.fromkeys(keywords))
+        boards = sorted(set(self.resolve(keywords).values()))
+        past = sorted(day for day in set(dates) if day != self.date)
+        if not boards or not past:
+            return
+        start, end = past[0], past[-1]
+        missing = [b for b in boards if b not in self._table.columns
+                   or not set(past) <= set(self._table.index)]
+        if not missing:
+            return
+
+        columns = {}
+        for board, df, error in map_concurrently(
+                lambda b: self.history.history(self.sources, b, start, end), missing, concurrency):
+            if error is not None:
+                logger.warning(f"获取板块 {board[1]} 日线失败: {error}")
+            else:
+                columns[board] = df["change_pct"]
+        if columns:
+            table = pd.DataFrame(columns)
+            with self._lock:
+                self._table = table.combine_first(self._table) if not self._table.empty else table
+
+    def lookup(self, date: str, keywords: List[str]) -> Dict[str, Dict]:
+        """一个日期的全部板块词 -> {板块词: {name, kind, change_pct}}，查不到的词不在结果中"""
+        resolved = self.resolve(keywords)
+        if not resolved:
+            return {}
+        boards = list(resolved.values())
+        if date == self.date:
+            rows = self.snapshot().reindex([name for _, name in boards])
+            values = rows["涨跌幅"].to_numpy()
+        else:
+            self.prepare([date], keywords)
+            if date not in self._table.index:
+                return {}
+            values = self._table.reindex(columns=pd.MultiIndex.from_tuples(boards)).loc[date].to_numpy()
+        return {
+            keyword: {"name": name, "kind": kind, "change_pct": round(float(value), 2)}
+            for (keyword, (kind, name)), value in zip(resolved.items(), values)
+            if value == value
+        }
+
+    def top(self, date: str, n: int = 10) -> List[Dict]:
+        """快照所属交易日涨幅前 n 的行业板块（其他日期为空）"""
+        snapshot = self.snapshot()
+        if date != self.date:
+            return []
+        industry = snapshot[snapshot["kind"] == "industry"].sort_values("涨跌幅", ascending=False).head(n)
+        return [{"name": name, "change_pct": float(row["涨跌幅"]), "lead_stock": str(row["领涨股票"])}
+                for name, row in industry.iterrows()]
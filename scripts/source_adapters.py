@@ -0,0 +1,337 @@
+"""数据源适配层 - 统一各数据源的接口和返回格式，带重试退避、熔断、超时切换和调用指标"""
+import random
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+from loguru import logger
+
+# 各数据源的库都是可选的，缺失的数据源不参与切换
+try:
+    import akshare as ak
+    AKSHARE_AVAILABLE = True
+except ImportError:
+    AKSHARE_AVAILABLE = False
+
+try:
+    import efinance as ef
+    EFINANCE_AVAILABLE = True
+except ImportError:
+    EFINANCE_AVAILABLE = False
+
+try:
+    import tushare as ts
+    TUSHARE_AVAILABLE = True
+except ImportError:
+    TUSHARE_AVAILABLE = False
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import MARKET_DATA_SOURCES, TUSHARE_TOKEN, SOURCE_RETRY, CIRCUIT_BREAKER
+from fetch_engine import limited_call
+from response_cache import ResponseCache, get_response_cache
+
+
+class SourceUnavailableError(RuntimeError):
+    """所有数据源都无法提供某类数据"""
+
+
+def _to_date_str(series: pd.Series) -> pd.Series:
+    """日期列统一为 YYYY-MM-DD 字符串"""
+    return pd.to_datetime(series.astype(str)).dt.strftime("%Y-%m-%d")
+
+
+class SourceAdapter:
+    """数据源适配器基类
+
+    每类数据一个方法，返回统一列名的 DataFrame：
+    - spot: 全部A股实时行情，至少含 代码、名称、涨跌幅（有价格时含 最新价、昨收）
+    - north_flow: 北向资金每日净流入，含 日期（YYYY-MM-DD）、当日资金流入（亿元）
+    - industry_boards / concept_boards: 行业 / 概念板块行情，含 板块名称、涨跌幅、领涨股票
+    - board_hist: 单个板块的日线（kind 为 industry 或 concept），含 日期（YYYY-MM-DD）、收盘、涨跌幅
+    - stock_hist: 单只股票的不复权日线，含 日期（YYYY-MM-DD）、开盘、收盘、最高、最低、
+      成交量、成交额、涨跌幅、涨跌额；停牌区间内为空
+    不支持的数据类型不在 DATASETS 中。
+    """
+
+    name = ""
+    DATASETS = ()
+
+    def __init__(self, cache: ResponseCache):
+        self.cache = cache
+
+    def available(self) -> bool:
+        return True
+
+    def supports(self, dataset: str) -> bool:
+        return dataset in self.DATASETS
+
+    def fetch(self, dataset: str, **kwargs) -> pd.DataFrame:
+        return getattr(self, dataset)(**kwargs)
+
+
+class AkshareAdapter(SourceAdapter):
+    """akshare（东方财富）"""
+
+    name = "akshare"
+    DATASETS = ("spot", "north_flow", "industry_boards", "concept_boards", "stock_hist", "board_hist")
+
+    def available(self) -> bool:
+        return AKSHARE_AVAILABLE
+
+    def spot(self) -> pd.DataFrame:
+        return self.cache.call(self.name, ak.stock_zh_a_spot_em)
+
+    def north_flow(self, symbol: str = "北上资金") -> pd.DataFrame:
+        df = self.cache.call(self.name, ak.stock_hsgt_north_net_flow_in_em, symbol=symbol)
+        return df.assign(日期=_to_date_str(df["日期"]))
+
+    def industry_boards(self) -> pd.DataFrame:
+        return self.cache.call(self.name, ak.stock_board_industry_name_em)
+
+    def concept_boards(self) -> pd.DataFrame:
+        return self.cache.call(self.name, ak.stock_board_concept_name_em)
+
+    def stock_hist(self, code: str, start: str, end: str) -> pd.DataFrame:
+        # 逐只日线直接写入个股日线库，不再经过响应缓存
+        df = limited_call(self.name, ak.stock_zh_a_hist, symbol=code, period="daily",
+                          start_date=start.replace("-", ""), end_date=end.replace("-", ""), adjust="")
+        return df.assign(日期=_to_date_str(df["日期"])) if not df.empty else df
+
+    def board_hist(self, kind: str, board: str, start: str, end: str) -> pd.DataFrame:
+        # 板块日线由板块日线缓存落盘，不再经过响应缓存；两个接口的周期参数写法不同
+        func, period = ((ak.stock_board_industry_hist_em, "日k") if kind == "industry"
+                        else (ak.stock_board_concept_hist_em, "daily"))
+        df = limited_call(self.name, func, symbol=board, period=period, adjust="",
+                          start_date=start.replace("-", ""), end_date=end.replace("-", ""))
+        return df.assign(日期=_to_date_str(df["日期"])) if not df.empty else df
+
+
+class EfinanceAdapter(SourceAdapter):
+    """efinance（东方财富另一套接口，列名不同）"""
+
+    name = "efinance"
+    DATASETS = ("spot", "industry_boards", "concept_boards", "stock_hist")
+
+    def available(self) -> bool:
+        return EFINANCE_AVAILABLE
+
+    def spot(self) -> pd.DataFrame:
+        df = self.cache.call(self.name, ef.stock.get_realtime_quotes)
+        df = df.rename(columns={"股票代码": "代码", "股票名称": "名称", "昨日收盘": "昨收"})
+        return df.assign(涨跌幅=pd.to_numeric(df["涨跌幅"], errors="coerce"))
+
+    def industry_boards(self) -> pd.DataFrame:
+        return self._boards("行业板块")
+
+    def concept_boards(self) -> pd.DataFrame:
+        return self._boards("概念板块")
+
+    def _boards(self, board_type: str) -> pd.DataFrame:
+        df = self.cache.call(self.name, ef.stock.get_realtime_quotes, board_type)
+        df = df.rename(columns={"股票名称": "板块名称"})
+        return df.assign(涨跌幅=pd.to_numeric(df["涨跌幅"], errors="coerce"), 领涨股票="N/A")
+
+    def stock_hist(self, code: str, start: str, end: str) -> pd.DataFrame:
+        # fqt=0 不复权，列名与 akshare 一致
+        df = limited_call(self.name, ef.stock.get_quote_history, code, beg=start.replace("-", ""),
+                          end=end.replace("-", ""), klt=101, fqt=0)
+        return df.assign(日期=_to_date_str(df["日期"])) if not df.empty else df
+
+
+class TushareAdapter(SourceAdapter):
+    """tushare（需要token，只提供历史数据）"""
+
+    name = "tushare"
+    DATASETS = ("north_flow",)
+    # 北向资金列：tushare 单位为百万元
+    NORTH_COLUMNS = {"北上资金": "north_money", "沪股通": "hgt", "深股通": "sgt"}
+
+    def __init__(self, cache: ResponseCache):
+        super().__init__(cache)
+        self._pro = ts.pro_api(TUSHARE_TOKEN) if TUSHARE_AVAILABLE and TUSHARE_TOKEN else None
+
+    def available(self) -> bool:
+        return self._pro is not None
+
+    def north_flow(self, symbol: str = "北上资金") -> pd.DataFrame:
+        # 接口名作为参数传给 query，缓存键才能区分不同接口
+        df = self.cache.call(self.name, self._pro.query, "moneyflow_hsgt")
+        return pd.DataFrame({
+            "日期": _to_date_str(df["trade_date"]),
+            "当日资金流入": pd.to_numeric(df[self.NORTH_COLUMNS[symbol]], errors="coerce") / 100,
+        })
+
+
+ADAPTERS = {adapter.name: adapter for adapter in (AkshareAdapter, EfinanceAdapter, TushareAdapter)}
+
+
+class CircuitBreaker:
+    """熔断器：连续失败 failure_threshold 次后熔断，reset_timeout 秒后放行一次试探调用"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """当前能否调用；熔断期满后只放行一次试探"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class SourceMetrics:
+    """单个数据源的调用次数、错误、超时和延迟分布"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.latencies = deque(maxlen=1000)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool, timeout: bool = False):
+        with self._lock:
+            self.calls += 1
+            self.errors += not ok
+            self.timeouts += timeout
+            self.latencies.append(latency)
+
+    def reject(self):
+        """熔断期间被跳过的调用"""
+        with self._lock:
+            self.rejected += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            latencies = sorted(self.latencies)
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "rejected": self.rejected,
+                "error_rate": self.errors / self.calls if self.calls else 0.0,
+                "avg_latency": sum(latencies) / len(latencies) if latencies else 0.0,
+                "p95_latency": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+                "max_latency": latencies[-1] if latencies else 0.0,
+            }
+
+
+class MarketDataSources:
+    """按优先级在多个数据源之间自动切换
+
+    每个数据源先重试（指数退避 + 随机抖动），单次调用超过 timeout 视为数据源过慢，
+    直接切换到下一个；连续失败的数据源被熔断，熔断期间跳过。全部失败时抛出
+    SourceUnavailableError。
+    """
+
+    def __init__(self, adapters: Optional[List[SourceAdapter]] = None,
+                 cache: Optional[ResponseCache] = None,
+                 retries: int = SOURCE_RETRY["retries"],
+                 base_delay: float = SOURCE_RETRY["base_delay"],
+                 max_delay: float = SOURCE_RETRY["max_delay"],
+                 timeout: Optional[float] = SOURCE_RETRY["timeout"],
+                 failure_threshold: int = CIRCUIT_BREAKER["failure_threshold"],
+                 reset_timeout: float = CIRCUIT_BREAKER["reset_timeout"]):
+        if adapters is None:
+            cache = cache or get_response_cache()
+            # 按配置顺序决定优先级，跳过未启用或未安装的数据源
+            adapters = [ADAPTERS[name](cache) for name, enabled in MARKET_DATA_SOURCES.items()
+                        if enabled and name in ADAPTERS]
+            adapters = [adapter for adapter in adapters if adapter.available()]
+        self.adapters = adapters
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.breakers = {adapter.name: CircuitBreaker(failure_threshold, reset_timeout)
+                         for adapter in adapters}
+        self._metrics = {adapter.name: SourceMetrics() for adapter in adapters}
+        # 超时的调用无法中断，留在后台线程里跑完
+        self._pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="source") if timeout else None
+
+    def _attempt(self, adapter: SourceAdapter, dataset: str, kwargs: Dict) -> pd.DataFrame:
+        if self._pool is None:
+            return adapter.fetch(dataset, **kwargs)
+        return self._pool.submit(adapter.fetch, dataset, **kwargs).result(timeout=self.timeout)
+
+    def _backoff(self, attempt: int):
+        """第 attempt 次重试前等待：指数增长的上限内均匀随机（full jitter）"""
+        time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+    def fetch(self, dataset: str, allow_empty: bool = False, **kwargs) -> pd.DataFrame:
+        """从第一个可用的数据源获取数据
+
+        空数据默认视为失败；allow_empty=True 用于本来就可能为空的请求（如停牌区间的个股日线）。
+        """
+        errors = []
+        for adapter in self.adapters:
+            if not adapter.supports(dataset):
+                continue
+            breaker, metrics = self.breakers[adapter.name], self._metrics[adapter.name]
+            for attempt in range(self.retries + 1):
+                if not breaker.allow():
+                    metrics.reject()
+                    errors.append(f"{adapter.name}: 已熔断")
+                    break
+                if attempt:
+                    self._backoff(attempt - 1)
+                start = time.monotonic()
+                try:
+                    df = self._attempt(adapter, dataset, kwargs)
+                    if df is None or (df.empty and not allow_empty):
+                        raise ValueError("返回空数据")
+                except FutureTimeoutError:
+                    metrics.record(time.monotonic() - start, ok=False, timeout=True)
+                    breaker.record_failure()
+                    errors.append(f"{adapter.name}: 超过 {self.timeout}s 未返回")
+                    # 数据源过慢时不再重试，直接切换
+                    break
+                except Exception as e:
+                    metrics.record(time.monotonic() - start, ok=False)
+                    breaker.record_failure()
+                    errors.append(f"{adapter.name}: {e}")
+                    continue
+                metrics.record(time.monotonic() - start, ok=True)
+                breaker.record_success()
+                if errors:
+                    logger.info(f"{dataset} 由 {adapter.name} 提供（之前失败: {'; '.join(errors)}）")
+                return df
+        raise SourceUnavailableError(f"{dataset} 所有数据源均失败: {'; '.join(errors) or '没有支持的数据源'}")
+
+    def metrics(self) -> Dict[str, Dict]:
+        """各数据源的调用指标和熔断状态"""
+        return {name: {**metrics.snapshot(), "state": self.breakers[name].state}
+                for name, metrics in self._metrics.items()}
+
+    def log_metrics(self):
+        for name, m in self.metrics().items():
+            if m["calls"] or m["rejected"]:
+                logger.info(f"数据源 {name}: 调用 {m['calls']} 次，错误 {m['errors']}，超时 {m['timeouts']}，"
+                            f"熔断跳过 {m['rejected']}，平均 {m['avg_latency']:.2f}s，"
+                            f"P95 {m['p95_latency']:.2f}s，状态 {m['state']}")
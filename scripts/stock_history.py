@@ -0,0 +1,323 @@
+"""个股日线库 - 全部A股的不复权日线按年存放，首次逐只批量导入，之后用收盘快照或逐只区间增量更新"""
+import argparse
+import json
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+from tqdm import tqdm
+
+# pyarrow是可选的，没有时退回pickle
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import RAW_DATA_DIR, LOG_DIR
+from fetch_engine import map_concurrently
+from fetch_planner import TradingCalendar
+
+# 存储目录：{年}{.parquet|.pkl}，coverage.json 记录每只股票已获取的日期区间，以及全部股票都已获取的区间
+STOCK_HISTORY_DIR = RAW_DATA_DIR / "stock_history"
+COVERAGE_FILE = "coverage.json"
+
+COLUMNS = ["date", "code", "open", "high", "low", "close", "prev_close", "pct", "volume", "amount", "st"]
+
+# 逐只获取时每攒够这么多只写入一次
+STOCK_BATCH = 200
+
+# 实时快照 / 逐只日线的列名 -> 存储列名
+SPOT_COLUMNS = {"代码": "code", "今开": "open", "最高": "high", "最低": "low", "最新价": "close",
+                "昨收": "prev_close", "涨跌幅": "pct", "成交量": "volume", "成交额": "amount"}
+HIST_COLUMNS = {"日期": "date", "开盘": "open", "最高": "high", "最低": "low", "收盘": "close",
+                "涨跌幅": "pct", "成交量": "volume", "成交额": "amount"}
+
+
+class IncompleteHistoryError(RuntimeError):
+    """部分股票的日线没有取到，库中的数据不足以计算全市场统计"""
+
+
+def _day_after(day: str) -> str:
+    return (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+
+
+def _day_before(day: str) -> str:
+    return (date.fromisoformat(day) - timedelta(days=1)).isoformat()
+
+
+def _is_st(names: pd.Series) -> pd.Series:
+    return names.astype(str).str.contains("ST", regex=False)
+
+
+def snapshot_rows(df: pd.DataFrame, day: str) -> pd.DataFrame:
+    """收盘后的实时快照 -> 当天的日线行（停牌股票没有成交，不写入）"""
+    rows = df[[column for column in SPOT_COLUMNS if column in df]].rename(columns=SPOT_COLUMNS)
+    rows = rows.apply(lambda column: column if column.name == "code" else pd.to_numeric(column, errors="coerce"))
+    rows["st"] = _is_st(df["名称"]) if "名称" in df else False
+    rows.insert(0, "date", day)
+    return rows.dropna(subset=["close", "pct"]).reindex(columns=COLUMNS)
+
+
+def hist_rows(df: pd.DataFrame, code: str, st: bool = False) -> pd.DataFrame:
+    """单只股票的日线 -> 存储行；昨收由收盘价减涨跌额还原（除权日为交易所的除权参考价）"""
+    rows = df[list(HIST_COLUMNS)].rename(columns=HIST_COLUMNS)
+    rows[rows.columns[1:]] = rows[rows.columns[1:]].apply(pd.to_numeric, errors="coerce")
+    rows["prev_close"] = (rows["close"] - pd.to_numeric(df["涨跌额"], errors="coerce")).round(2)
+    rows["code"] = code
+    rows["st"] = st
+    return rows.reindex(columns=COLUMNS)
+
+
+class StockHistoryStore:
+    """个股日线库
+
+    每年一个文件，追加时只重写涉及的年份（同一股票同一日期以新数据为准）。
+    ST 标记来自写入时的股票简称，批量导入的历史按当前简称标记。
+    覆盖范围按股票记录，获取失败的股票下次只补它们自己缺的区间。
+    """
+
+    def __init__(self, root: Path = STOCK_HISTORY_DIR):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _suffix(self) -> str:
+        return ".parquet" if PARQUET_AVAILABLE else ".pkl"
+
+    def _years(self) -> List[str]:
+        return sorted(path.stem for path in self.root.glob(f"[0-9]*{self._suffix()}"))
+
+    def _read_year(self, year: str, columns: Optional[List[str]] = None,
+                   start: Optional[str] = None, end: Optional[str] = None) -> pd.DataFrame:
+        path = self.root / f"{year}{self._suffix()}"
+        if not path.exists():
+            return pd.DataFrame(columns=columns or COLUMNS)
+        if PARQUET_AVAILABLE:
+            filters = [f for f in (("date", ">=", start) if start else None,
+                                   ("date", "<=", end) if end else None) if f]
+            return pd.read_parquet(path, columns=columns, filters=filters or None)
+        df = pd.read_pickle(path)
+        if start:
+            df = df[df["date"] >= start]
+        if end:
+            df = df[df["date"] <= end]
+        return df[columns] if columns else df
+
+    def _write_year(self, year: str, df: pd.DataFrame):
+        path = self.root / f"{year}{self._suffix()}"
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        if PARQUET_AVAILABLE:
+            df.to_parquet(tmp_path, index=False)
+        else:
+            df.to_pickle(tmp_path)
+        tmp_path.replace(path)
+
+    def _read_coverage(self) -> Dict:
+        path = self.root / COVERAGE_FILE
+        if path.exists():
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {"start": None, "end": None, "stocks": {}}
+
+    def coverage(self) -> Dict[str, Optional[str]]:
+        """全部股票都已获取的日期区间"""
+        covered = self._read_coverage()
+        return {"start": covered["start"], "end": covered["end"]}
+
+    def stock_coverage(self) -> Dict[str, List[str]]:
+        """每只股票已获取的日期区间 {代码: [起, 止]}
+
+        旧版只记录了全部股票的区间，按该区间补给库中已有的股票。
+        """
+        covered = self._read_coverage()
+        stocks = covered.get("stocks")
+        if stocks is None:
+            stocks = {}
+            if covered["start"] is not None:
+                stocks = {code: [covered["start"], covered["end"]] for code in self.codes()}
+        return stocks
+
+    def _set_coverage(self, stocks: Dict[str, List[str]], codes: List[str]):
+        """写入每只股票的区间，以及 codes 全部覆盖的区间（各股票区间的交集）"""
+        start = end = None
+        ranges = [stocks.get(code) for code in codes]
+        if ranges and all(ranges):
+            start, end = max(r[0] for r in ranges), min(r[1] for r in ranges)
+            if start > end:
+                start = end = None
+        path = self.root / COVERAGE_FILE
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"start": start, "end": end, "stocks": stocks}, f)
+        tmp_path.replace(path)
+
+    def append(self, rows: pd.DataFrame) -> int:
+        """追加日线行，返回行数"""
+        if rows.empty:
+            return 0
+        rows = rows.reindex(columns=COLUMNS)
+        for year, part in rows.groupby(rows["date"].str[:4]):
+            df = pd.concat([self._read_year(year), part], ignore_index=True)
+            df = df.drop_duplicates(["date", "code"], keep="last")
+            self._write_year(year, df.sort_values(["date", "code"], ignore_index=True))
+        return len(rows)
+
+    def codes(self) -> List[str]:
+        """库中最近一年出现过的股票代码"""
+        years = self._years()
+        return sorted(self._read_year(years[-1], ["code"])["code"].unique()) if years else []
+
+    def load(self, start: str, end: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """读取日期闭区间内的日线行"""
+        frames = [self._read_year(year, columns, start, end) for year in self._years()
+                  if start[:4] <= year <= end[:4]]
+        frames = [df for df in frames if not df.empty]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns or COLUMNS)
+
+    def panel(self, start: str, end: str,
+              fields: Tuple[str, ...] = ("close", "prev_close", "pct", "st")) -> Dict[str, np.ndarray]:
+        """区间内的 (股票 × 交易日) 二维数组，缺失（停牌、未上市）为 NaN
+
+        返回 {"codes": 代码, "dates": 日期, 字段: 数组}。
+        """
+        df = self.load(start, end, ["date", "code", *fields])
+        code_idx, codes = pd.factorize(df["code"], sort=True)
+        date_idx, dates = pd.factorize(df["date"], sort=True)
+        panel = {"codes": np.asarray(codes, dtype=object), "dates": np.asarray(dates, dtype=object)}
+        for field in fields:
+            values = np.full((len(codes), len(dates)), np.nan)
+            values[code_idx, date_idx] = df[field].to_numpy(dtype=float)
+            panel[field] = values
+        return panel
+
+    def _fetch_stocks(self, sources, codes: List[str], start: str, end: str, st_codes: set,
+                      concurrency: Optional[int], done: Callable[[List[str]], None]) -> List[str]:
+        """逐只获取区间日线并分批写入，每批写入后用 done 记录这批股票已获取，返回失败的股票"""
+        def fetch(code: str) -> pd.DataFrame:
+            return sources.fetch("stock_hist", allow_empty=True, code=code, start=start, end=end)
+
+        def flush():
+            if pending:
+                self.append(pd.concat(pending, ignore_index=True))
+            done(pending_codes)
+
+        pending, pending_codes, failed = [], [], []
+        with tqdm(total=len(codes), desc=f"📊 个股日线 {start}~{end}", unit="只", colour="cyan") as pbar:
+            for code, df, error in map_concurrently(fetch, codes, concurrency):
+                if error is not None:
+                    failed.append(code)
+                    logger.warning(f"获取 {code} 日线失败: {error}")
+                else:
+                    pending_codes.append(code)
+                    if not df.empty:
+                        pending.append(hist_rows(df, code, code in st_codes))
+                if len(pending_codes) >= STOCK_BATCH:
+                    flush()
+                    pending, pending_codes = [], []
+                pbar.update(1)
+        if pending_codes:
+            flush()
+        return failed
+
+    def update(self, sources, start: str, until: str, calendar: Optional[TradingCalendar] = None,
+               snapshot=None, concurrency: Optional[int] = None):
+        """让库中每只股票都覆盖 [start, until]
+
+        - 某只股票区间前段缺失（首次使用、回看更早或新上市）：逐只获取缺的区间
+        - 只差快照所属的交易日且已收盘：用一次实时快照写入当天
+        - 其他缺口：逐只获取缺口区间
+        股票列表取自实时快照（包含新上市的股票），快照不可用时用库中已有的股票。
+        每批写入后记录这批股票的覆盖范围；有股票获取失败时抛出 IncompleteHistoryError，
+        下次运行只重新获取失败的股票。
+        """
+        calendar = calendar or TradingCalendar()
+        covered = self.coverage()
+        if covered["start"] is not None and covered["start"] <= start and covered["end"] >= until:
+            return
+
+        frame = snapshot.frame() if snapshot is not None else None
+        if frame is not None:
+            codes = sorted(frame["代码"].astype(str))
+            st_codes = set(frame.loc[_is_st(frame["名称"]), "代码"].astype(str)) if "名称" in frame else set()
+        else:
+            codes, st_codes = self.codes(), set()
+        if not codes:
+            raise RuntimeError("没有股票列表（实时快照不可用且个股日线库为空）")
+
+        stocks = self.stock_coverage()
+
+        def extend(done_codes: List[str]):
+            for code in done_codes:
+                old = stocks.get(code)
+                stocks[code] = [min(old[0], start), max(old[1], until)] if old else [start, until]
+            self._set_coverage(stocks, codes)
+
+        # 每只股票缺的区间：向前缺数据时补到原起点，向后只看区间末尾之后有没有交易日
+        gaps: Dict[str, List[str]] = {}
+        ranges: Dict[Tuple[str, str], List[str]] = {}
+        by_snapshot, no_gap = [], []
+        for code in codes:
+            old = stocks.get(code)
+            if old is None:
+                ranges.setdefault((start, until), []).append(code)
+                continue
+            before = start < old[0]
+            if old[1] < until and old[1] not in gaps:
+                gaps[old[1]] = calendar.trading_days(_day_after(old[1]), until)
+            after = gaps.get(old[1], []) if old[1] < until else []
+            if not before and not after:
+                if old[1] < until:
+                    no_gap.append(code)
+            elif not before and frame is not None and snapshot.final and after == [snapshot.date]:
+                by_snapshot.append(code)
+            else:
+                ranges.setdefault((start if before else after[0],
+                                   until if after else _day_before(old[0])), []).append(code)
+        if no_gap:
+            extend(no_gap)
+        if by_snapshot:
+            rows = snapshot_rows(frame[frame["代码"].astype(str).isin(by_snapshot)], snapshot.date)
+            self.append(rows)
+            extend(by_snapshot)
+            logger.info(f"个股日线库: 用收盘快照写入 {snapshot.date}（{len(rows)} 只）")
+
+        failed = []
+        for (fetch_start, fetch_end), fetch_codes in sorted(ranges.items()):
+            logger.info(f"个股日线库: 逐只获取 {len(fetch_codes)} 只股票 {fetch_start} ~ {fetch_end}")
+            failed += self._fetch_stocks(sources, fetch_codes, fetch_start, fetch_end, st_codes,
+                                         concurrency, extend)
+        if failed:
+            raise IncompleteHistoryError(f"{len(failed)} 只股票日线获取失败（下次运行只重新获取这些股票）")
+
+
+def main():
+    """命令行：查看覆盖范围，或更新到指定日期"""
+    logger.add(LOG_DIR / "stock_history.log", rotation="10 MB")
+    arg_parser = argparse.ArgumentParser(description="个股日线库")
+    arg_parser.add_argument("--start", help="更新：起始日期 YYYY-MM-DD")
+    arg_parser.add_argument("--until", default=date.today().isoformat(), help="更新：截止日期（默认今天）")
+    arg_parser.add_argument("--concurrency", type=int, default=None, help="同时在途的请求数")
+    args = arg_parser.parse_args()
+
+    store = StockHistoryStore()
+    if args.start:
+        from market_breadth import SpotSnapshot
+        from source_adapters import MarketDataSources
+        sources = MarketDataSources()
+        try:
+            store.update(sources, args.start, args.until, snapshot=SpotSnapshot(sources),
+                         concurrency=args.concurrency)
+        except IncompleteHistoryError as e:
+            logger.warning(f"个股日线库: {e}")
+        sources.log_metrics()
+    covered = store.coverage()
+    logger.info(f"个股日线库覆盖 {covered['start']} ~ {covered['end']}，共 {len(store.codes())} 只股票")
+
+
+if __name__ == "__main__":
+    main()
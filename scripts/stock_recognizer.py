@@ -0,0 +1,187 @@
+"""A股名称识别 - 基于本地股票名称快照的前缀表，一次扫描做最长匹配"""
+import argparse
+import csv
+import hashlib
+import pickle
+import re
+import sys
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+# akshare是可选的，只有刷新快照时才需要
+try:
+    import akshare as ak
+    AKSHARE_AVAILABLE = True
+except ImportError:
+    AKSHARE_AVAILABLE = False
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import STOCK_SNAPSHOT_FILE, PROCESSED_DATA_DIR
+
+# 预构建识别器缓存（按快照哈希校验，快照变化后自动重建）
+STOCK_RECOGNIZER_CACHE = PROCESSED_DATA_DIR / "stock_recognizer.pkl"
+
+# 识别器结构版本：修改构建逻辑时递增
+RECOGNIZER_VERSION = 1
+
+# 前缀表中「不是任何名称前缀」的标记
+_MISSING = object()
+
+
+def normalize_name(name: str) -> str:
+    """统一全角字母数字、去掉空格（如「万 科Ａ」->「万科A」）"""
+    return ''.join(unicodedata.normalize('NFKC', name).split())
+
+
+def load_snapshot(path: Path = STOCK_SNAPSHOT_FILE) -> Dict[str, str]:
+    """读取快照 CSV（code,name），返回 {代码: 名称}"""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        return {row["code"].strip(): row["name"] for row in csv.DictReader(f)}
+
+
+def refresh_snapshot(path: Path = STOCK_SNAPSHOT_FILE) -> int:
+    """用akshare拉取全部A股代码和简称，写入快照 CSV，返回股票数"""
+    if not AKSHARE_AVAILABLE:
+        raise ImportError("刷新股票快照需要 akshare: pip install akshare")
+    df = ak.stock_info_a_code_name()
+    rows = sorted(zip(df["code"].astype(str), df["name"].astype(str)))
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["code", "name"])
+        writer.writerows(rows)
+    tmp_path.replace(path)
+    return len(rows)
+
+
+class StockRecognizer:
+    """股票名称/代码识别器
+
+    所有名称的全部前缀放在一张字典里（前缀 -> 代码，仅是前缀时为 None），
+    从左到右扫描，每个候选起点沿前缀表向后延伸，取最长的完整名称后跳过；
+    6位数字只在快照中存在该代码时才算命中。
+    """
+
+    def __init__(self, stocks: Dict[str, str], snapshot_hash: str = ""):
+        self.snapshot_hash = snapshot_hash
+        # 名称 -> 代码、代码 -> 名称
+        self.names: Dict[str, str] = {}
+        self.codes: Dict[str, str] = {}
+        for code, name in stocks.items():
+            name = normalize_name(name)
+            if len(name) < 2:
+                continue
+            self.names.setdefault(name, code)
+            self.codes[code] = name
+        self._build()
+
+    def _build(self):
+        """构建前缀表和候选起点正则"""
+        prefixes: Dict[str, Optional[str]] = {}
+        for name, code in self.names.items():
+            for i in range(1, len(name)):
+                prefixes.setdefault(name[:i], None)
+            prefixes[name] = code
+        self._prefixes = prefixes
+
+        # 候选起点：独立的6位数字，或某个名称的首字符且下一个字可以是名称第二个字
+        # （名称至少2个字，字符集过滤在C层完成，大部分位置不会进入Python循环）
+        first_chars = ''.join(re.escape(ch) for ch in sorted({name[0] for name in self.names}))
+        second_chars = ''.join(re.escape(ch) for ch in sorted({name[1] for name in self.names}))
+        self._start_re = re.compile(r'(?<!\d)(\d{6})(?!\d)'
+                                    + (f'|[{first_chars}](?=[{second_chars}])' if first_chars else ''))
+
+    def scan(self, text: str) -> List[Tuple[int, str, str]]:
+        """返回所有命中 [(起始位置, 名称, 代码), ...]，互不重叠"""
+        hits = []
+        prefixes = self._prefixes
+        search = self._start_re.search
+        size = len(text)
+        pos = 0
+        while True:
+            match = search(text, pos)
+            if match is None:
+                break
+            start = match.start()
+            digits = match.group(1)
+            if digits:
+                pos = match.end()
+                name = self.codes.get(digits)
+                if name:
+                    hits.append((start, name, digits))
+                continue
+
+            # 沿前缀表向后延伸，记下最长的完整名称
+            end = 0
+            code = None
+            j = start + 1
+            while j <= size:
+                value = prefixes.get(text[start:j], _MISSING)
+                if value is _MISSING:
+                    break
+                if value:
+                    end, code = j, value
+                j += 1
+
+            if end:
+                hits.append((start, text[start:end], code))
+                pos = end
+            else:
+                pos = start + 1
+        return hits
+
+    def names_in(self, text: str) -> List[str]:
+        """文本中出现的股票名称（按首次出现顺序去重）"""
+        return list(dict.fromkeys(name for _, name, _ in self.scan(text)))
+
+
+def load_recognizer(snapshot: Path = STOCK_SNAPSHOT_FILE,
+                    cache: Path = STOCK_RECOGNIZER_CACHE) -> Optional[StockRecognizer]:
+    """加载识别器：优先读取预构建的 pickle，快照变化时重建；没有快照返回 None"""
+    if not snapshot.exists():
+        return None
+    snapshot_hash = hashlib.sha256(snapshot.read_bytes()).hexdigest()
+
+    if cache.exists():
+        try:
+            with open(cache, 'rb') as f:
+                version, cached_hash, recognizer = pickle.load(f)
+            if version == RECOGNIZER_VERSION and cached_hash == snapshot_hash:
+                return recognizer
+        except Exception as e:
+            logger.warning(f"股票识别器缓存损坏，重新构建: {e}")
+
+    recognizer = StockRecognizer(load_snapshot(snapshot), snapshot_hash)
+    tmp_path = cache.with_name(f".{cache.name}.tmp")
+    with open(tmp_path, 'wb') as f:
+        pickle.dump((RECOGNIZER_VERSION, snapshot_hash, recognizer), f, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp_path.replace(cache)
+    logger.info(f"已构建股票识别器: {len(recognizer.names)} 个名称")
+    return recognizer
+
+
+def main():
+    """命令行：刷新快照，或识别一段文本中的股票"""
+    arg_parser = argparse.ArgumentParser(description="A股名称识别")
+    arg_parser.add_argument("text", nargs='?', help="要识别的文本")
+    arg_parser.add_argument("--refresh", action="store_true", help="用akshare刷新股票名称快照")
+    args = arg_parser.parse_args()
+
+    if args.refresh:
+        count = refresh_snapshot()
+        logger.info(f"股票名称快照已更新: {STOCK_SNAPSHOT_FILE}（{count} 只）")
+
+    if args.text:
+        recognizer = load_recognizer()
+        if recognizer is None:
+            logger.error(f"未找到股票名称快照 {STOCK_SNAPSHOT_FILE}，请先运行 --refresh")
+            return
+        for start, name, code in recognizer.scan(args.text):
+            print(f"{start:>6}  {code}  {name}")
+
+
+if __name__ == "__main__":
+    main()
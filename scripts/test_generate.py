@@ -1,11 +1,13 @@
 """测试脚本 - 只处理2天数据验证流程"""
 import json
 import sys
+from itertools import islice
 from pathlib import Path
 
 sys.path.append(str(Path(__file__).parent.parent))
 from scripts.generate_training_data import TrainingDataGenerator
 from config import PROCESSED_DATA_DIR, TRAINING_DATA_DIR
+from scripts.corpus_store import iter_parsed_corpus
 from loguru import logger
 
 def test_with_two_days():
@@ -16,13 +18,9 @@ def test_with_two_days():
     
     generator = TrainingDataGenerator()
     
-    # 加载语料
-    corpus_file = PROCESSED_DATA_DIR / "parsed_corpus.json"
-    with open(corpus_file, 'r', encoding='utf-8') as f:
-        all_corpus = json.load(f)
-    
-    # 只取前2天
-    test_corpus = all_corpus[:2]
+    # 只读取前2天语料（章节正文从源文件切出后一并保存）
+    test_corpus = [dict(item, sections=dict(item['sections']))
+                   for item in islice(iter_parsed_corpus(), 2)]
     logger.info(f"测试数据: {[item['date'] for item in test_corpus]}")
     
     # 临时保存测试语料
@@ -43,6 +41,7 @@ def test_with_two_days():
     test_output = TRAINING_DATA_DIR / "test_training_dataset.json"
     with open(test_output, 'w', encoding='utf-8') as f:
         json.dump(training_data, f, ensure_ascii=False, indent=2)
+    generator.clear_journal()
     
     logger.info("=" * 60)
     logger.info(f"测试完成！生成了 {len(training_data)} 个训练样本")
@@ -1,5 +1,4 @@
 """模型微调脚本 - 使用LoRA方法"""
-import json
 import sys
 from pathlib import Path
 from typing import Dict, List
@@ -17,6 +16,7 @@ from loguru import logger
 
 sys.path.append(str(Path(__file__).parent.parent))
 from config import TRAINING_DATA_DIR, MODEL_DIR, FINETUNE_CONFIG, LOG_DIR
+from dataset_writer import dataset_files, iter_dataset
 
 # 配置日志
 logger.add(LOG_DIR / "train_model.log", rotation="10 MB")
@@ -31,16 +31,16 @@ class FinancialAssistantTrainer:
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
     def load_training_data(self, filename: str = "training_dataset.jsonl") -> Dataset:
-        """加载训练数据"""
-        file_path = TRAINING_DATA_DIR / filename
+        """加载训练数据（单个JSONL，或 DATASET_SHARD_SIZE 切分的分片）"""
+        name = filename[:-len(".jsonl")] if filename.endswith(".jsonl") else filename
+        files = dataset_files(name)
+        if not files:
+            raise FileNotFoundError(f"找不到训练数据: {TRAINING_DATA_DIR / filename}")
         
-        logger.info(f"加载训练数据: {file_path}")
+        logger.info(f"加载训练数据: {', '.join(path.name for path in files)}")
         
-        # 读取JSONL文件
-        data_list = []
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                data_list.append(json.loads(line))
+        # 逐行读取JSONL（分片可以是gzip压缩的）
+        data_list = list(iter_dataset(name))
         
         logger.info(f"加载了 {len(data_list)} 个训练样本")
         